@@ -1,30 +1,75 @@
-from model import app, db, Student, Teacher, Class, TeacherToClass, StudentToClass, Template, QuestionFile, AnswerFile, VisionPro, TeacherToTemplate, StudentToTemplate, TemplateToAnswerFile, TemplateToQuestionFile
-from flask import jsonify, request, send_from_directory, session
+from model import app, db, replica_router, Student, Teacher, Class, TeacherToClass, StudentToClass, Template, QuestionFile, AnswerFile, VisionPro, TeacherToTemplate, StudentToTemplate, TemplateToAnswerFile, TemplateToQuestionFile
+from flask import jsonify, request, send_file, send_from_directory, session
 from datetime import datetime, timedelta
 from flask_cors import CORS
 import os
 import uuid
 from werkzeug.utils import secure_filename
 from functools import wraps
-from flask_session import Session
-from werkzeug.security import generate_password_hash, check_password_hash
-
-# 配置 Flask-Session
-app.config['SESSION_TYPE'] = 'filesystem'  # 使用文件系统存储会话
+from cache import TTLCache
+from session_store import init_session
+from passwords import PasswordHasher, PasswordHasherBusy
+import authz
+from authz import teacher_owns_class, teacher_owns_template
+from upload_paths import UPLOAD_FOLDER, QUESTION_FOLDER, ANSWER_FOLDER, shard_dir, placeholder_file_path
+from uploads import ChunkedUploads, UploadError
+from blob_store import BlobStore
+from zip_stream import StoredZip
+from reaper import Reaper, start_reaper
+from response_cache import ResponseCache, entity_key
+from metrics import RequestMetrics
+from db_profiler import DBProfiler
+from db_config import pool_stats
+from db_routing import read_only, replica_cache_ttl
+from roster_import import ON_EXISTING, RosterError, insert_roster, parse_roster, plan_import
+import base64
+import hashlib
+import json
+import mimetypes
+import re
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import IntegrityError
+
+# 配置服务端会话（见 session_store.py）
+app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', 'sqlite')
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=60)  # 会话有效期60分钟
 app.config['SESSION_FILE_DIR'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flask_sessions')  # 会话文件存储目录
+app.config['SESSION_SQLITE_PATH'] = os.path.join(app.config['SESSION_FILE_DIR'], 'sessions.db')
+app.config['SESSION_REFRESH_THRESHOLD'] = 0.5  # 剩余有效期不足一半时才续期写回
 app.config['SESSION_COOKIE_SECURE'] = True
 app.config['SESSION_COOKIE_HTTPONLY'] = False
 app.config['SESSION_COOKIE_SAMESITE'] = 'None'
 
 app.secret_key = "jerry"
 
-# 初始化Flask-Session
-Session(app)
-
 # 确保会话存储目录存在
 os.makedirs(app.config['SESSION_FILE_DIR'], exist_ok=True)
 
+# 初始化会话存储
+init_session(app)
+
+# 读接口响应缓存（见 response_cache.py），实体版本号与会话放在同一目录
+app.config['RESPONSE_CACHE_BACKEND'] = os.environ.get('RESPONSE_CACHE_BACKEND', 'sqlite')
+app.config['RESPONSE_CACHE_SQLITE_PATH'] = os.path.join(app.config['SESSION_FILE_DIR'], 'response_versions.db')
+response_cache = ResponseCache.from_config(app.config)
+# 老师归属缓存的版本号与响应缓存共用同一存储（见 authz.py）
+authz.configure(app, response_cache.versions)
+
+# 按接口的请求统计（见 metrics.py），多个 worker 进程通过同一 sqlite 文件汇总
+app.config['METRICS_SQLITE_PATH'] = os.path.join(app.config['SESSION_FILE_DIR'], 'metrics.db')
+# 设置后 /metrics 需要携带 Authorization: Bearer <token>
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+request_metrics = RequestMetrics.from_config(app.config)
+request_metrics.init_app(app)
+
+# 按请求统计 SQL 次数和耗时，检测 N+1 与慢查询（见 db_profiler.py）
+if DBProfiler.enabled(app):
+    with app.app_context():
+        DBProfiler.from_config(app).init_app(app, db.engines.values())
+
+# 密码哈希进程池（见 passwords.py）
+password_hasher = PasswordHasher.from_config(app.config)
+
 # 修复：使用全局CORS配置，不依赖于request对象
 CORS(app, supports_credentials=True)
 
@@ -34,7 +79,8 @@ def after_request(response):
     origin = request.headers.get('Origin')
     if origin:
         response.headers.add('Access-Control-Allow-Origin', origin)
-        response.headers.add('Access-Control-Allow-Headers', 'Origin, X-Requested-With, Content-Type, Accept, If-Modified-Since')
+        response.headers.add('Access-Control-Allow-Headers', 'Origin, X-Requested-With, Content-Type, Accept, If-Modified-Since, If-None-Match, Range')
+        response.headers.add('Access-Control-Expose-Headers', 'ETag, Last-Modified, Content-Range, Accept-Ranges, X-DB-Queries, X-DB-Time')
         response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
         response.headers.add('Access-Control-Allow-Credentials', 'true')
         response.headers.add('Access-Control-Max-Age', '3600')
@@ -46,8 +92,7 @@ def login_required(f):
     def decorated_function(*args, **kwargs):
         if not session.get('user_id'):
             return jsonify(code=401, message="Please login first")
-        # 更新会话过期时间
-        session.modified = True
+        # 会话过期时间由会话存储按阈值滑动续期，这里不再强制写回
         return f(*args, **kwargs)
     return decorated_function
 
@@ -60,61 +105,172 @@ def teacher_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# 文件存储目录设置
-UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads')
-QUESTION_FOLDER = os.path.join(UPLOAD_FOLDER, 'questions')
-ANSWER_FOLDER = os.path.join(UPLOAD_FOLDER, 'answers')
-
-# 确保上传目录存在
+# 确保上传目录存在（目录布局见 upload_paths.py）
 os.makedirs(QUESTION_FOLDER, exist_ok=True)
 os.makedirs(ANSWER_FOLDER, exist_ok=True)
 
+# 分块上传的临时目录，与最终目录在同一文件系统上以便原子移动
+INCOMING_FOLDER = os.path.join(UPLOAD_FOLDER, '.incoming')
+chunked_uploads = ChunkedUploads(
+    INCOMING_FOLDER,
+    chunk_size=int(os.environ.get('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024)),
+    max_size=int(os.environ.get('UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024)),
+)
+
+# 下载交给前端代理发送文件内容：'' 表示由 Flask 发送，'x-sendfile'（Apache/lighttpd）或 'x-accel'（nginx）
+# x-accel 需要在 nginx 中把 FILE_ACCEL_PREFIX 配置为指向 UPLOAD_FOLDER 的 internal location
+FILE_OFFLOAD = os.environ.get('FILE_OFFLOAD', '')
+FILE_ACCEL_PREFIX = os.environ.get('FILE_ACCEL_PREFIX', '/protected-uploads/')
+app.config['USE_X_SENDFILE'] = FILE_OFFLOAD == 'x-sendfile'
+
+# 按内容哈希去重的文件存储，记录路径是指向其中 blob 的硬链接
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, '.blobs')
+blob_store = BlobStore(BLOB_FOLDER)
+
+# 上传目录与数据库的对账清理（见 reaper.py），REAPER_INTERVAL 为 0 时只能手动执行
+reaper = Reaper.from_env(app, UPLOAD_FOLDER, QUESTION_FOLDER, ANSWER_FOLDER, blob_store, chunked_uploads)
+# 以 python api.py 运行时，密码进程池的子进程会以 __mp_main__ 重新导入本模块，不在其中启动
+if int(os.environ.get('REAPER_INTERVAL', 0)) and __name__ != '__mp_main__':
+    start_reaper(reaper, int(os.environ['REAPER_INTERVAL']))
+
 # 文件工具函数
-def save_file(file, is_question=True):
-    """保存上传的文件到服务器，返回文件名和路径"""
-    if not file:
-        return None, None
-    
-    # 安全处理文件名并添加唯一标识
-    original_filename = secure_filename(file.filename)
+def storage_path(original_filename, is_question=True):
+    """为上传文件生成唯一的存储路径"""
     unique_id = uuid.uuid4().hex
     filename = f"{unique_id}_{original_filename}"
     
     # 选择存储目录
     folder = QUESTION_FOLDER if is_question else ANSWER_FOLDER
-    filepath = os.path.join(folder, filename)
+    return os.path.join(shard_dir(folder, unique_id), filename)
+
+def placeholder_path(filename, is_question=True):
+    """尚未上传的文件记录使用的路径，按文件名哈希分散，目录在真正写入时才创建"""
+    folder = QUESTION_FOLDER if is_question else ANSWER_FOLDER
+    return placeholder_file_path(folder, filename)
+
+def save_file(file, is_question=True):
+    """保存上传的文件到服务器，返回文件名、路径和内容哈希；相同内容只存一份"""
+    if not file:
+        return None, None, None
+    
+    # 安全处理文件名并添加唯一标识
+    original_filename = secure_filename(file.filename)
+    filepath = storage_path(original_filename, is_question)
     
     try:
-        file.save(filepath)
-        return original_filename, filepath
+        sha256, _ = blob_store.store_stream(file.stream, filepath)
+        return original_filename, filepath, sha256
     except Exception as e:
         print(f"Error saving file: {e}")
-        return None, None
+        return None, None, None
 
-def get_file(filepath):
-    """获取文件进行下载"""
-    if not os.path.exists(filepath):
+def get_file(filepath, sha256=None):
+    """
+    获取文件进行下载，支持 ETag/Last-Modified 条件请求和 Range 续传
+    有内容哈希时用它作强 ETag，否则由 werkzeug 按修改时间和大小生成
+    """
+    try:
+        stat = os.stat(filepath)
+    except OSError:
         return None
     
-    directory, filename = os.path.split(filepath)
     try:
-        return send_from_directory(directory, filename, as_attachment=True)
+        if FILE_OFFLOAD == 'x-accel':
+            # 只在这里处理 304，文件内容和 Range 由 nginx 处理
+            response = app.response_class()
+            response.set_etag(sha256 or f"{int(stat.st_mtime)}-{stat.st_size}")
+            response.last_modified = stat.st_mtime
+            response.make_conditional(request)
+            if response.status_code != 304:
+                relative = os.path.relpath(filepath, UPLOAD_FOLDER).replace(os.sep, '/')
+                response.headers['X-Accel-Redirect'] = FILE_ACCEL_PREFIX.rstrip('/') + '/' + relative
+                response.headers['Content-Disposition'] = f'attachment; filename="{os.path.basename(filepath)}"'
+                response.content_type = mimetypes.guess_type(filepath)[0] or 'application/octet-stream'
+        else:
+            # USE_X_SENDFILE 打开时 send_file 只返回 X-Sendfile 头，不读取文件内容
+            response = send_file(filepath, as_attachment=True, etag=sha256 or True,
+                                 last_modified=stat.st_mtime, conditional=True)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
     except Exception as e:
         print(f"Error retrieving file: {e}")
         return None
 
-def delete_file(filepath):
-    """删除存储的文件"""
+def file_hash_referenced(sha256):
+    """是否还有文件记录引用该内容"""
+    return (db.session.query(QuestionFile.id).filter_by(sha256=sha256).first() is not None
+            or db.session.query(AnswerFile.id).filter_by(sha256=sha256).first() is not None)
+
+def delete_file(filepath, sha256=None):
+    """删除存储的文件；调用前对应记录应已删除，最后一个引用消失时才删除 blob"""
     if not filepath or not os.path.exists(filepath):
         return False
     
     try:
         os.remove(filepath)
+        if sha256 and not file_hash_referenced(sha256):
+            blob_store.remove(sha256)
         return True
     except Exception as e:
         print(f"Error deleting file: {e}")
         return False
 
+def referenced_hashes(sha256s):
+    """sha256s 中仍有文件记录引用的内容哈希，每张表每批一次 IN 查询"""
+    sha256s = list(set(sha256s))
+    referenced = set()
+    for column in [QuestionFile.sha256, AnswerFile.sha256]:
+        for shas in chunked(sha256s):
+            referenced.update(sha for (sha,) in db.session.query(column).filter(column.in_(shas)).distinct())
+    return referenced
+
+def delete_files(files):
+    """批量删除存储的文件 [(路径, sha256)]；调用前对应记录应已删除，不再被引用的 blob 一并删除"""
+    sha256s = {sha256 for _, sha256 in files if sha256}
+    unreferenced = sha256s - referenced_hashes(sha256s)
+    for filepath, _ in files:
+        try:
+            if filepath and os.path.exists(filepath):
+                os.remove(filepath)
+        except Exception as e:
+            print(f"Error deleting file: {e}")
+    for sha256 in unreferenced:
+        blob_store.remove(sha256)
+
+# 班级人数缓存，避免每次分页都执行 COUNT；与响应缓存一样按 ('class', id) 的版本号失效，
+# 版本号在多个进程间共享，任一进程增删学生后其他进程的缓存也随之失效
+roster_count_cache = TTLCache(maxsize=10000, ttl=300)
+
+def get_roster_count(class_id):
+    """获取班级实际学生人数（带缓存）"""
+    key = entity_key('class', class_id)
+    version = response_cache.versions.get_many([key])[key]
+    entry = roster_count_cache.get(class_id)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    # 先取版本号再 COUNT，期间发生的写入会让这条缓存在下次读取时失效
+    count = StudentToClass.query.filter_by(cid=class_id).count()
+    roster_count_cache.set(class_id, (version, count), replica_cache_ttl())
+    return count
+
+def touch_class(class_id, teacher_ids=None):
+    """班级信息或成员变化后，使班级人数和相关老师的班级列表、设备列表缓存失效（事务提交后调用）"""
+    if teacher_ids is None:
+        teacher_ids = [tid for (tid,) in db.session.query(TeacherToClass.tid).filter_by(cid=class_id)]
+    response_cache.bump(('classes',), ('class', class_id), *[('teacher', tid) for tid in teacher_ids])
+
+def encode_cursor(values):
+    """把分页游标编码为 URL 安全的字符串"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor):
+    """解析分页游标，格式错误时返回 None"""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
 @app.route("/")
 def index():
     return send_from_directory('/var/www/jerrykongzzz.top', 'homepage.html')
@@ -133,8 +289,15 @@ def student_login():
     if not student:
         return jsonify(code=400, message="student not found")
     
-    if not check_password_hash(student.password, password):
-        return jsonify(code=400, message="password incorrect")
+    try:
+        if not password_hasher.verify(student.password, password):
+            return jsonify(code=400, message="password incorrect")
+        # 哈希参数变化时顺便重新计算
+        if password_hasher.needs_rehash(student.password):
+            student.password = password_hasher.hash(password)
+            db.session.commit()
+    except PasswordHasherBusy:
+        return jsonify(code=503, message="server busy, please retry")
     
     # 设置会话数据
     session.permanent = True
@@ -143,7 +306,11 @@ def student_login():
     session['is_teacher'] = False
     
     # 获取学生的班级信息
-    classes = student.classes
+    classes = (
+        Class.query.join(StudentToClass, StudentToClass.cid == Class.cid)
+        .filter(StudentToClass.sid == student.sid)
+        .all()
+    )
     class_list = []
     for cls in classes:
         class_info = {
@@ -172,14 +339,22 @@ def teacher_login():
     if not teacher:
         return jsonify(code=400, message="teacher not found")
     
-    if not check_password_hash(teacher.password, password):
-        return jsonify(code=400, message="password incorrect")
+    try:
+        if not password_hasher.verify(teacher.password, password):
+            return jsonify(code=400, message="password incorrect")
+        # 哈希参数变化时顺便重新计算
+        if password_hasher.needs_rehash(teacher.password):
+            teacher.password = password_hasher.hash(password)
+            db.session.commit()
+    except PasswordHasherBusy:
+        return jsonify(code=503, message="server busy, please retry")
     
     # 设置会话数据
     session.permanent = True
     session['user_id'] = teacher.tid
     session['teacher_name'] = teacher.name
     session['is_teacher'] = True
+    authz.invalidate()
     
     return jsonify(
         code=200, 
@@ -188,6 +363,34 @@ def teacher_login():
         name=teacher.name
     )
 
+# Prometheus 格式的请求指标，配置了 METRICS_TOKEN 时需要 Bearer 令牌
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return app.response_class("unauthorized\n", status=401, mimetype='text/plain')
+    return app.response_class(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# 密码哈希进程池指标
+@app.route("/metrics/passwords", methods=["GET"])
+@login_required
+@teacher_required
+def password_metrics():
+    return jsonify(code=200, data=password_hasher.stats())
+
+@app.route("/metrics/db", methods=["GET"])
+@login_required
+@teacher_required
+def db_metrics():
+    return jsonify(code=200, data=dict(pool_stats(db.engine), replication=replica_router.stats()))
+
+@app.route("/metrics/reaper", methods=["GET"])
+@login_required
+@teacher_required
+def reaper_metrics():
+    """最近一次对账清理的报告"""
+    return jsonify(code=200, data=reaper.last_report)
+
 # 用户登出
 @app.route("/user/logout", methods=["DELETE"])
 def user_logout():
@@ -199,6 +402,7 @@ def user_logout():
 @app.route('/api/teacher/info', methods=['POST'])
 @login_required
 @teacher_required
+@read_only
 def get_teacher_info():
     data = request.get_json()
     teacher = db.session.get(Teacher, data.get('teacher_id'))
@@ -245,6 +449,8 @@ def update_teacher_info():
 @app.route("/teacher/classes", methods=['POST'])
 @login_required
 @teacher_required
+@response_cache.cached(lambda data: [('teacher', data.get("teacher_id"))])
+@read_only
 def get_teacher_classes():
     data = request.get_json()
     teacher_id = data.get("teacher_id")
@@ -265,135 +471,189 @@ def get_teacher_classes():
     
     return jsonify(code=200, data=classes)
 
+# 教师模板列表可用的排序字段
+TEMPLATE_SORT_FIELDS = {
+    "template_id": Template.temid,
+    "template_name": Template.name,
+    "start_time": Template.startTime,
+    "end_time": Template.endTime,
+    "submitted_num": "submitted_num",
+    "total_num": "total_num",
+}
+
 # 获取教师模板
 @app.route("/api/teacher/templates", methods=["POST"])
 @login_required
 @teacher_required
+@read_only
 def get_teacher_templates():
+    """
+    "teacher_id": 1,
+    "keyword": "Template",      (可选, 按模板名称模糊过滤)
+    "sort_by": "end_time",      (可选, 见 TEMPLATE_SORT_FIELDS)
+    "sort_order": "asc"         (可选, asc 或 desc)
+    """
     data = request.get_json()
     teacher_id = data.get("teacher_id")
     teacher = db.session.get(Teacher, teacher_id)
     if not teacher:
         return jsonify(code=404, message="Teacher not found")
-    
-    teacher_templates = TeacherToTemplate.query.filter_by(tid=teacher_id).all()
+
+    sort_by = data.get("sort_by")
+    sort_order = data.get("sort_order", "asc")
+    if sort_by is not None and sort_by not in TEMPLATE_SORT_FIELDS:
+        return jsonify(code=400, message="invalid sort_by")
+    if sort_order not in ["asc", "desc"]:
+        return jsonify(code=400, message="invalid sort_order")
+
+    # 一次查询完成 teacher_template / template / student_template 的连接与聚合
+    submitted_num = db.func.coalesce(
+        db.func.sum(db.case((StudentToTemplate.isSubmitted == db.true(), 1), else_=0)), 0
+    ).label("submitted_num")
+    total_num = db.func.count(StudentToTemplate.id).label("total_num")
+    query = (
+        db.session.query(
+            Template.temid,
+            Template.name,
+            Template.startTime,
+            Template.endTime,
+            submitted_num,
+            total_num,
+        )
+        .select_from(TeacherToTemplate)
+        .join(Template, Template.temid == TeacherToTemplate.temid)
+        .outerjoin(StudentToTemplate, StudentToTemplate.temid == Template.temid)
+        .filter(TeacherToTemplate.tid == teacher_id)
+        .group_by(TeacherToTemplate.id, Template.temid, Template.name, Template.startTime, Template.endTime)
+    )
+
+    keyword = data.get("keyword")
+    if keyword:
+        query = query.filter(Template.name.contains(keyword, autoescape=True))
+
+    if sort_by:
+        sort_column = TEMPLATE_SORT_FIELDS[sort_by]
+        if isinstance(sort_column, str):
+            sort_column = db.literal_column(sort_column)
+        sort_column = sort_column.desc() if sort_order == "desc" else sort_column.asc()
+        query = query.order_by(sort_column, TeacherToTemplate.id)
+    else:
+        # 默认保持原来的关联顺序
+        query = query.order_by(TeacherToTemplate.id)
+
     list = []
-    for teacher_template in teacher_templates:
-        template_obj = db.session.get(Template, teacher_template.temid)
-        student_templates = StudentToTemplate.query.filter_by(temid=teacher_template.temid).all()
-        submitted_num = 0
-        num = 0
-        for student_template in student_templates:
-            if student_template.isSubmitted:
-                submitted_num += 1
-            num += 1
+    for row in query.all():
         list.append({
-            "template_id": template_obj.temid,
-            "template_name": template_obj.name,
-            "start_time": template_obj.startTime,
-            "end_time": template_obj.endTime,
-            "submitted_num": submitted_num,
-            "total_num": num
+            "template_id": row.temid,
+            "template_name": row.name,
+            "start_time": row.startTime,
+            "end_time": row.endTime,
+            "submitted_num": int(row.submitted_num),
+            "total_num": row.total_num
         })
-    
+
     return jsonify(code=200, data=list)
 
+# 分批大小，避免 IN 列表过长
+BULK_CHUNK_SIZE = 1000
+
+def chunked(items, size=BULK_CHUNK_SIZE):
+    """把列表按固定大小切分"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
 # 创建新模板
 @app.route("/api/template/create", methods=["POST"])
 @login_required
 @teacher_required
 def create_template():
-    """创建新的模板"""
+    """创建新的模板（单个事务内批量写入）"""
     data = request.get_json()
     teacher_id = data.get("teacher_id")
     teacher = db.session.get(Teacher, teacher_id)
     if not teacher:
         return jsonify(code=404, message="Teacher not found")
 
-    student_list = []
-    student_ids = data.get("student_ids")
-    for student_id in student_ids:
-        student = db.session.get(Student, student_id)
-        if not student:
-            return jsonify(code=404, message="Student not found")
-        student_list.append({
-            "student_id": student.sid,
-        })
-
-    #自动帮我创建对应文件夹
-    question_names = data.get("question_names")
-    question_paths = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads', 'questions', data.get("name"))
-    for student in student_list:
-        answer_paths = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads', 'answers', data.get("name"), str(student.get("student_id")))
-        os.makedirs(answer_paths, exist_ok=True)
-    os.makedirs(question_paths, exist_ok=True)
-
-    template = Template(
-        name=data.get("name"),
-        startTime=data.get("startTime"),
-        endTime=data.get("endTime"),
-        description=data.get("description")
-    )
-    db.session.add(template)
-    db.session.commit()
-
-    #找到刚刚添加的模板
-    template_obj = Template.query.filter_by(name=data.get("name")).order_by(Template.temid.desc()).first()
-    template_id = template_obj.temid
-
-    for i in range(len(question_names)):
-        question = QuestionFile(
-            questionFileName=str(template_id) + question_names[i],
-            questionFilePath=os.path.join(question_paths, question_names[i])
-        )
-        db.session.add(question)
-    db.session.commit()
-
-    for i in range(len(question_names)):
-        for student in student_list:
-            answer = AnswerFile(
-                answerFileName=str(template_id) + str(student.get("student_id")) + question_names[i],
-                answerFilePath=os.path.join(answer_paths, question_names[i])
-            )
-        db.session.add(answer)
-    db.session.commit()
+    name = data.get("name")
+    question_names = data.get("question_names") or []
+    # 去重并保持顺序
+    student_ids = list(dict.fromkeys(data.get("student_ids") or []))
+    if not name:
+        return jsonify(code=400, message="missing parameters")
 
+    # 一次 IN 查询校验所有学生
+    existing_ids = set()
+    for ids in chunked(student_ids):
+        existing_ids.update(sid for (sid,) in db.session.query(Student.sid).filter(Student.sid.in_(ids)))
+    if len(existing_ids) != len(student_ids):
+        return jsonify(code=404, message="Student not found")
 
-    for student in student_list:
-        student_template = StudentToTemplate(
-            sid=student.get("student_id"),
-            temid=template_id,
-            isSubmitted=False,
-            totalTime=0,
-            score=''
+    try:
+        template = Template(
+            name=name,
+            startTime=data.get("startTime"),
+            endTime=data.get("endTime"),
+            description=data.get("description")
         )
-        db.session.add(student_template)
-    db.session.commit()
-
-    teacher_template = TeacherToTemplate(
-        tid=teacher_id,
-        temid=template_id
-    )
-    db.session.add(teacher_template)
-    db.session.commit()
+        db.session.add(template)
+        # flush 获取自增 id，不提交事务
+        db.session.flush()
+        template_id = template.temid
+
+        # 文件名以 "_" 分隔，保证 模板/学生/题目 组合唯一
+        question_rows = [{
+            "questionFileName": f"{template_id}_{question_name}",
+            "questionFilePath": placeholder_path(f"{template_id}_{question_name}")
+        } for question_name in question_names]
+        if question_rows:
+            db.session.execute(QuestionFile.__table__.insert(), question_rows)
+
+        # 通过唯一文件名批量取回刚插入的 id
+        question_ids = {}
+        for names in chunked([row["questionFileName"] for row in question_rows]):
+            question_ids.update((name, qid) for (qid, name) in db.session.query(QuestionFile.id, QuestionFile.questionFileName).filter(QuestionFile.questionFileName.in_(names)))
+
+        # 答案记录直接带上所属学生和问题，供按 (qid, sid) 索引查找
+        answer_rows = [{
+            "answerFileName": f"{student_id}_{template_id}_{question_name}",
+            "answerFilePath": placeholder_path(f"{student_id}_{template_id}_{question_name}", is_question=False),
+            "sid": student_id,
+            "qid": question_ids[f"{template_id}_{question_name}"]
+        } for question_name in question_names for student_id in student_ids]
+        if answer_rows:
+            db.session.execute(AnswerFile.__table__.insert(), answer_rows)
+
+        answer_ids = {}
+        for names in chunked([row["answerFileName"] for row in answer_rows]):
+            answer_ids.update((name, aid) for (aid, name) in db.session.query(AnswerFile.id, AnswerFile.answerFileName).filter(AnswerFile.answerFileName.in_(names)))
+
+        if student_ids:
+            db.session.execute(StudentToTemplate.__table__.insert(), [{
+                "sid": student_id,
+                "temid": template_id,
+                "isSubmitted": False,
+                "totalTime": 0,
+                "score": ''
+            } for student_id in student_ids])
+        db.session.execute(TeacherToTemplate.__table__.insert(), [{"tid": teacher_id, "temid": template_id}])
+
+        # 将问题和答案与模板关联，问题按老师输入的顺序插入（模板详情按关联 id 排序）
+        if question_ids:
+            db.session.execute(TemplateToQuestionFile.__table__.insert(), [
+                {"temid": template_id, "qid": question_ids[f"{template_id}_{question_name}"]}
+                for question_name in question_names])
+        if answer_ids:
+            db.session.execute(TemplateToAnswerFile.__table__.insert(), [
+                {"temid": template_id, "aid": answer_ids[row["answerFileName"]]} for row in answer_rows])
 
-    # 将问题和答案与模板关联
-    for i in range(len(question_names)):
-        question_file = db.session.get(QuestionFile, question_names[i])
-        template_to_question_file = TemplateToQuestionFile(
-            temid=template_id,
-            qid=question_file.id
-        )
-        db.session.add(template_to_question_file)
-        answer_file = db.session.get(AnswerFile, question_names[i])
-        template_to_answer_file = TemplateToAnswerFile(
-            temid=template_id,
-            aid=answer_file.id
-        )
-        db.session.add(template_to_answer_file)
-    db.session.commit()
+        db.session.commit()
+        authz.grant(authz.TEMPLATES, teacher_id, template_id)
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        return jsonify(code=500, message="error creating template")
 
-    return jsonify(code=200, message="Template created successfully")
+    return jsonify(code=200, message="Template created successfully", template_id=template_id)
 
 # 删除模板
 @app.route("/api/template/delete", methods=["POST"])
@@ -406,34 +666,52 @@ def delete_template():
     template = db.session.get(Template, template_id)
     if not template:
         return jsonify(code=404, message="Template not found")
+
+    # 只能删除自己的模板
+    if not teacher_owns_template(session.get('user_id'), template_id):
+        return jsonify(code=403, message="not authorized for this template")
     
     try:
-        student_templates = StudentToTemplate.query.filter_by(temid=template_id).all()
-        for student_template in student_templates:
-            db.session.delete(student_template)
-        teacher_templates = TeacherToTemplate.query.filter_by(temid=template_id).all()
-        for teacher_template in teacher_templates:
-            db.session.delete(teacher_template)
-        question_files = QuestionFile.query.filter_by(template_id=template_id).all()
-        for question_file in question_files:
-            db.session.delete(question_file)
-        answer_files = AnswerFile.query.filter_by(template_id=template_id).all()
-        for answer_file in answer_files:
-            db.session.delete(answer_file)
+        question_files = (
+            db.session.query(QuestionFile.id, QuestionFile.questionFilePath, QuestionFile.sha256)
+            .join(TemplateToQuestionFile, TemplateToQuestionFile.qid == QuestionFile.id)
+            .filter(TemplateToQuestionFile.temid == template_id)
+            .all()
+        )
+        answer_files = (
+            db.session.query(AnswerFile.id, AnswerFile.answerFilePath, AnswerFile.sha256)
+            .join(TemplateToAnswerFile, TemplateToAnswerFile.aid == AnswerFile.id)
+            .filter(TemplateToAnswerFile.temid == template_id)
+            .all()
+        )
+        teacher_ids = [tid for (tid,) in db.session.query(TeacherToTemplate.tid).filter_by(temid=template_id)]
+        StudentToTemplate.query.filter_by(temid=template_id).delete()
+        TeacherToTemplate.query.filter_by(temid=template_id).delete()
         TemplateToQuestionFile.query.filter_by(temid=template_id).delete()
         TemplateToAnswerFile.query.filter_by(temid=template_id).delete()
+        # 答案引用问题，先删答案
+        for ids in chunked([file.id for file in answer_files]):
+            AnswerFile.query.filter(AnswerFile.id.in_(ids)).delete(synchronize_session=False)
+        for ids in chunked([file.id for file in question_files]):
+            QuestionFile.query.filter(QuestionFile.id.in_(ids)).delete(synchronize_session=False)
         db.session.delete(template)
         db.session.commit()
-        return jsonify(code=200, message="Template deleted successfully")
+        authz.revoke(authz.TEMPLATES, template_id, teacher_ids)
+        response_cache.bump(('template', template_id))
     except Exception as e:
         print(e)
         db.session.rollback()
         return jsonify(code=500, message="error deleting template")
 
+    # 记录提交后再删除物理文件，共享内容的 blob 在最后一个引用消失时才删除
+    delete_files([(filepath, sha256) for _, filepath, sha256 in answer_files + question_files])
+    return jsonify(code=200, message="Template deleted successfully")
+
 # 获取学生在特定模板下的详细答案情况
 @app.route("/api/template/student/answers", methods=["POST"])
 @login_required
 @teacher_required
+@read_only
 def get_student_template_answers():
     """获取特定学生在特定模板下的详细答案情况"""
     data = request.get_json()
@@ -457,33 +735,20 @@ def get_student_template_answers():
     if not student_template:
         return jsonify(code=404, message="Student not assigned to this template")
     
-    # 获取该模板的所有问题文件
-    template_question_relations = TemplateToQuestionFile.query.filter_by(temid=template_id).all()
-    question_data = []
-    
-    # 获取该模板的所有答案文件
-    template_answer_relations = TemplateToAnswerFile.query.filter_by(temid=template_id).all()
-    all_answer_files = []
-    
-    for relation in template_answer_relations:
-        answer_file = db.session.get(AnswerFile, relation.aid)
-        if answer_file:
-            all_answer_files.append(answer_file)
-    
+    # 一次连接查询取出模板的问题及该学生对应的答案（走 answer_file 的 (qid, sid) 索引）
+    rows = (
+        db.session.query(QuestionFile, AnswerFile)
+        .select_from(TemplateToQuestionFile)
+        .join(QuestionFile, QuestionFile.id == TemplateToQuestionFile.qid)
+        .outerjoin(AnswerFile, db.and_(AnswerFile.qid == QuestionFile.id, AnswerFile.sid == student_id))
+        .filter(TemplateToQuestionFile.temid == template_id)
+        .order_by(TemplateToQuestionFile.id)
+        .all()
+    )
+
     # 构建问题和答案数据
-    for relation in template_question_relations:
-        question_file = db.session.get(QuestionFile, relation.qid)
-        if not question_file:
-            continue
-        
-        # 使用问题文件名和学生ID的组合来匹配答案文件
-        matching_answer = None
-        for answer_file in all_answer_files:
-            expected_file = f"{student_id}{question_file.questionFileName}"
-            if answer_file.answerFileName == expected_file:
-                matching_answer = answer_file
-                break
-        
+    question_data = []
+    for question_file, matching_answer in rows:
         question_info = {
             "question_id": question_file.id,
             "question_name": question_file.questionFileName,
@@ -526,10 +791,20 @@ def get_student_template_answers():
 @app.route("/api/template/detail", methods=["POST"])
 @login_required
 @teacher_required
+@response_cache.cached(lambda data: [('template', data.get("template_id"))])
+@read_only
 def get_template_detail():
-    """获取模板详情及学生基本情况，不包含详细答案"""  
+    """
+    获取模板详情及学生基本情况，不包含详细答案
+    "template_id": 1,
+    "only": "students" 或 "questions"  (可选, 只返回其中一部分)
+    """
     data = request.get_json()
     template_id = data.get("template_id")
+    only = data.get("only")
+    if only not in [None, "students", "questions"]:
+        return jsonify(code=400, message="invalid only")
+
     template = db.session.get(Template, template_id)
     if not template:
         return jsonify(code=404, message="Template not found")
@@ -542,49 +817,48 @@ def get_template_detail():
         "end_time": template.endTime,
         "description": template.description
     }
-    
-    # 获取所有相关的问题文件
-    questions_data = []
-    template_question_relations = TemplateToQuestionFile.query.filter_by(temid=template_id).all()
-    
-    for relation in template_question_relations:
-        question_file = db.session.get(QuestionFile, relation.qid)
-        if question_file:
-            questions_data.append({
-                "question_id": question_file.id,
-                "question_name": question_file.questionFileName,
-                "question_path": question_file.questionFilePath
-            })
-    
-    # 获取所有相关的学生及其基本提交情况（不包含详细答案）
-    students_data = []
-    student_templates = StudentToTemplate.query.filter_by(temid=template_id).all()
-    
-    for st in student_templates:
-        student = db.session.get(Student, st.sid)
-        if not student:
-            continue
-        
-        student_data = {
+    result = {"template": template_info}
+
+    # 获取所有相关的问题文件（一次连接查询）
+    if only != "students":
+        questions = (
+            db.session.query(QuestionFile.id, QuestionFile.questionFileName, QuestionFile.questionFilePath)
+            .join(TemplateToQuestionFile, TemplateToQuestionFile.qid == QuestionFile.id)
+            .filter(TemplateToQuestionFile.temid == template_id)
+            .order_by(TemplateToQuestionFile.id)
+            .all()
+        )
+        questions_data = [{
+            "question_id": question.id,
+            "question_name": question.questionFileName,
+            "question_path": question.questionFilePath
+        } for question in questions]
+        result["questions"] = questions_data
+        result["questions_count"] = len(questions_data)
+
+    # 获取所有相关的学生及其基本提交情况（一次连接查询，不包含详细答案）
+    if only != "questions":
+        students = (
+            db.session.query(Student.sid, Student.name, Student.account,
+                             StudentToTemplate.totalTime, StudentToTemplate.score, StudentToTemplate.isSubmitted)
+            .join(StudentToTemplate, StudentToTemplate.sid == Student.sid)
+            .filter(StudentToTemplate.temid == template_id)
+            .order_by(StudentToTemplate.id)
+            .all()
+        )
+        result["students"] = [{
             "student_id": student.sid,
             "student_name": student.name,
             "account": student.account,
-            "total_time": st.totalTime,
-            "score": st.score,
-            "is_submitted": st.isSubmitted  # 使用数据库中的提交状态
-        }
-        
-        students_data.append(student_data)
-    
+            "total_time": student.totalTime,
+            "score": student.score,
+            "is_submitted": student.isSubmitted  # 使用数据库中的提交状态
+        } for student in students]
+
     return jsonify(
         code=200, 
         message="Template details retrieved successfully",
-        data={
-            "template": template_info,
-            "questions": questions_data,
-            "questions_count": len(questions_data),
-            "students": students_data
-        }
+        data=result
     )
 
 
@@ -621,14 +895,19 @@ def user_register():
     if student_name or teacher_name:
         return jsonify(code = 400, message = "name already exists")
 
+    try:
+        password_hash = password_hasher.hash(password)
+    except PasswordHasherBusy:
+        return jsonify(code=503, message="server busy, please retry")
+
     try:
         if ifTeacher == 1:
             # 创建老师账号
-            teacher = Teacher(name=name, account=account, password=password, birth=birth, gender=gender)
+            teacher = Teacher(name=name, account=account, password=password_hash, birth=birth, gender=gender)
             db.session.add(teacher)
         else:
             # 创建学生账号
-            student = Student(name=name, account=account, password=password, birth=birth, gender=gender)
+            student = Student(name=name, account=account, password=password_hash, birth=birth, gender=gender)
             db.session.add(student)
             
         db.session.commit()
@@ -678,6 +957,8 @@ def class_create():
         
         db.session.add(teacher_to_class)
         db.session.commit()
+        authz.grant(authz.CLASSES, teacher_id, class_obj.cid)
+        response_cache.bump(('teacher', teacher_id))
         return jsonify(code = 200, message = "class created successfully", class_id = class_obj.cid)
     except Exception as e:
         print(e)
@@ -712,8 +993,7 @@ def class_info_update():
         return jsonify(code = 400, message = "class not found")
     
     # 检查是否是该班级的老师
-    teacher_class = TeacherToClass.query.filter_by(tid=teacher_id, cid=classId).first()
-    if not teacher_class:
+    if not teacher_owns_class(teacher_id, classId):
         return jsonify(code = 400, message = "not the teacher of this class")
 
     if name:
@@ -723,6 +1003,7 @@ def class_info_update():
         
     try:
         db.session.commit()
+        touch_class(classId)
         return jsonify(code = 200, message = "class updated successfully")
     except Exception as e:
         print(e)
@@ -753,16 +1034,11 @@ def class_delete():
         return jsonify(code = 400, message = "class not found")
     
     # 检查是否是该班级的老师
-    teacher_class = TeacherToClass.query.filter_by(tid=teacher_id, cid=classId).first()
-    if not teacher_class:
+    if not teacher_owns_class(teacher_id, classId):
         return jsonify(code = 400, message = "not the teacher of this class")
     
-    # 检查班级是否有关联的模板
-    templates = Template.query.filter_by(cid=classId).all()
-    if templates:
-        return jsonify(code = 400, message = "class has templates, cannot be deleted")
-        
     try:
+        teacher_ids = [tid for (tid,) in db.session.query(TeacherToClass.tid).filter_by(cid=classId)]
         # 删除班级的所有学生关联
         StudentToClass.query.filter_by(cid=classId).delete()
         
@@ -772,6 +1048,8 @@ def class_delete():
         # 删除班级
         db.session.delete(class_obj)
         db.session.commit()
+        touch_class(classId, teacher_ids)
+        authz.revoke(authz.CLASSES, classId, teacher_ids)
         return jsonify(code = 200, message = "class deleted successfully")
     except Exception as e:
         print(e)
@@ -805,8 +1083,7 @@ def class_add_student():
         return jsonify(code = 400, message = "class not found")
     
     # 检查是否是该班级的老师
-    teacher_class = TeacherToClass.query.filter_by(tid=teacher_id, cid=classId).first()
-    if not teacher_class:
+    if not teacher_owns_class(teacher_id, classId):
         return jsonify(code = 400, message = "not the teacher of this class")
         
     # 检查学生是否存在
@@ -825,18 +1102,106 @@ def class_add_student():
         cid = classId
     )
     
-    # 更新班级学生数量
-    class_obj.studentNum += 1
+    # 更新班级学生数量（在数据库中累加，避免并发添加时互相覆盖）
+    class_obj.studentNum = Class.studentNum + 1
     
     try:
         db.session.add(student_to_class)
         db.session.commit()
+        touch_class(classId)
         return jsonify(code = 200, message = "student added to class successfully")
     except Exception as e:
         print(e)
         db.session.rollback()
         return jsonify(code = 500, message = "error")
 
+# 名单导入每次最多的行数和每批写入的行数
+ROSTER_IMPORT_MAX_ROWS = int(os.environ.get('ROSTER_IMPORT_MAX_ROWS', 5000))
+ROSTER_IMPORT_BATCH_SIZE = 1000
+
+def hash_passwords(passwords):
+    """每个不同的密码只计算一次哈希，并发提交到密码进程池"""
+    passwords = list(set(passwords))
+    with ThreadPoolExecutor(max_workers=max(password_hasher.pool_size, 1)) as executor:
+        return dict(zip(passwords, executor.map(password_hasher.hash, passwords)))
+
+# 批量导入班级学生
+@app.route("/class/<int:class_id>/students/import", methods=["POST"])
+@login_required
+@teacher_required
+def class_import_students(class_id):
+    """
+    multipart/form-data，名单格式见 roster_import.py：
+    "file": 名单文件 (.csv 或 .xlsx),
+    "password": "123456",       (可选, password 列为空时使用的初始密码)
+    "existing": "error",        (可选, 账号已是学生时: error 报错, enroll 直接加入班级)
+    "dry_run": 1                (可选, 只校验不写入)
+    每个不同的密码都要计算一次哈希，大批量导入时建议留空 password 列、统一使用初始密码
+    """
+    teacher_id = session.get('user_id')
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify(code=400, message="missing file")
+    on_existing = request.form.get('existing', 'error')
+    if on_existing not in ON_EXISTING:
+        return jsonify(code=400, message="existing must be error or enroll")
+    default_password = request.form.get('password')
+    dry_run = request.form.get('dry_run') in ['1', 'true']
+
+    class_obj = db.session.get(Class, class_id)
+    if not class_obj:
+        return jsonify(code=404, message="class not found")
+    if not teacher_owns_class(teacher_id, class_id):
+        return jsonify(code=403, message="not authorized for this class")
+
+    try:
+        records, errors = parse_roster(upload.filename, upload.stream, ROSTER_IMPORT_MAX_ROWS)
+    except RosterError as e:
+        return jsonify(code=400, message=str(e))
+
+    new_students, existing_ids, plan_errors = plan_import(class_id, records, on_existing)
+    errors += plan_errors
+    if not default_password:
+        errors += [{"row": line, "account": record['account'], "message": "missing password"}
+                   for line, record in new_students if not record.get('password')]
+        new_students = [(line, record) for line, record in new_students if record.get('password')]
+    errors.sort(key=lambda error: error["row"])
+
+    if dry_run or not (new_students or existing_ids):
+        return jsonify(code=200, message="dry run" if dry_run else "nothing to import",
+                       created=len(new_students) if dry_run else 0,
+                       enrolled=len(existing_ids) if dry_run else 0, errors=errors)
+
+    try:
+        hashes = hash_passwords(record.get('password') or default_password for _, record in new_students)
+    except PasswordHasherBusy:
+        return jsonify(code=503, message="server busy, please retry")
+
+    student_rows = [{
+        'name': record['name'],
+        'account': record['account'],
+        'password': hashes[record.get('password') or default_password],
+        'birth': record['birth'],
+        'gender': record['gender'],
+    } for _, record in new_students]
+
+    try:
+        insert_roster(class_id, student_rows, existing_ids, ROSTER_IMPORT_BATCH_SIZE)
+        db.session.commit()
+    except IntegrityError as e:
+        # 检查之后有其他请求注册了相同账号，或同时导入了同一批学生
+        print(e)
+        db.session.rollback()
+        return jsonify(code=409, message="roster changed during import, please retry")
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        return jsonify(code=500, message="error")
+
+    touch_class(class_id)
+    return jsonify(code=200, message="roster imported", created=len(student_rows),
+                   enrolled=len(existing_ids), errors=errors)
+
 # 模板文件上传
 @app.route("/api/template/<int:template_id>/file/upload", methods=["POST"])
 def template_file_upload(template_id):
@@ -856,38 +1221,45 @@ def template_file_upload(template_id):
     
     # 处理问题文件
     if question_file and question_file.filename != '':
-        question_filename, question_filepath = save_file(question_file, is_question=True)
+        question_filename, question_filepath, question_sha256 = save_file(question_file, is_question=True)
         if question_filename and question_filepath:
             question_file_record = QuestionFile(
-                template_id=template_id,
-                questionFileName=question_filename,
-                questionFilePath=question_filepath
+                questionFileName=f"{template_id}_{question_filename}",
+                questionFilePath=question_filepath,
+                sha256=question_sha256
             )
             try:
                 db.session.add(question_file_record)
+                db.session.flush()
+                db.session.add(TemplateToQuestionFile(temid=template_id, qid=question_file_record.id))
                 db.session.commit()
-                file_ids.append(question_file_record.fid)
+                response_cache.bump(('template', template_id))
+                file_ids.append(question_file_record.id)
             except Exception as e:
                 print(e)
                 db.session.rollback()
+                delete_file(question_filepath, question_sha256)
                 return jsonify(code=500, message="database error")
     
     # 处理答案文件
     if answer_file and answer_file.filename != '':
-        answer_filename, answer_filepath = save_file(answer_file, is_question=False)
+        answer_filename, answer_filepath, answer_sha256 = save_file(answer_file, is_question=False)
         if answer_filename and answer_filepath:
             answer_file_record = AnswerFile(
-                template_id=template_id,
-                answerFileName=answer_filename,
-                answerFilePath=answer_filepath
+                answerFileName=os.path.basename(answer_filepath),
+                answerFilePath=answer_filepath,
+                sha256=answer_sha256
             )
             try:
                 db.session.add(answer_file_record)
+                db.session.flush()
+                db.session.add(TemplateToAnswerFile(temid=template_id, aid=answer_file_record.id))
                 db.session.commit()
-                file_ids.append(answer_file_record.fid)
+                file_ids.append(answer_file_record.id)
             except Exception as e:
                 print(e)
                 db.session.rollback()
+                delete_file(answer_filepath, answer_sha256)
                 return jsonify(code=500, message="database error")
     
     if file_ids:
@@ -895,6 +1267,181 @@ def template_file_upload(template_id):
     else:
         return jsonify(code=400, message="no valid files provided")
 
+# 分块上传：初始化
+@app.route("/api/template/<int:template_id>/upload/init", methods=["POST"])
+@login_required
+def template_upload_init(template_id):
+    """
+    "kind": "question" 或 "answer",
+    "filename": "1.jpg",
+    "size": 1048576,
+    "sha256": "...",            (可选, 整文件校验)
+    "question_id": 3,           (答案必填)
+    "student_id": 5             (老师代传答案时必填, 学生默认为自己)
+    客户端声明的 sha256 只用于校验；相同内容的去重在 finalize 收到全部数据、由服务器计算哈希之后进行
+    """
+    data = request.get_json()
+    kind = data.get("kind")
+    filename = secure_filename(data.get("filename") or '')
+    if kind not in ["question", "answer"] or not filename:
+        return jsonify(code=400, message="missing parameters")
+
+    template = db.session.get(Template, template_id)
+    if not template:
+        return jsonify(code=404, message="Template not found")
+
+    meta = {
+        "kind": kind,
+        "filename": filename,
+        "size": data.get("size"),
+        "sha256": data.get("sha256"),
+        "template_id": template_id,
+        "user_id": session.get('user_id'),
+        "is_teacher": bool(session.get('is_teacher')),
+    }
+    # 老师只能向自己的模板上传问题或代传答案
+    if session.get('is_teacher') and not teacher_owns_template(session.get('user_id'), template_id):
+        return jsonify(code=403, message="not authorized for this template")
+
+    if kind == "question":
+        if not session.get('is_teacher'):
+            return jsonify(code=403, message="Teacher permission required")
+    else:
+        question_id = data.get("question_id")
+        student_id = data.get("student_id") if session.get('is_teacher') else session.get('user_id')
+        link = TemplateToQuestionFile.query.filter_by(temid=template_id, qid=question_id).first()
+        if not link:
+            return jsonify(code=404, message="Question not found in this template")
+        if not StudentToTemplate.query.filter_by(temid=template_id, sid=student_id).first():
+            return jsonify(code=404, message="Student not assigned to this template")
+        meta.update(question_id=question_id, student_id=student_id)
+
+    try:
+        upload_id = chunked_uploads.create(meta)
+    except UploadError as e:
+        return jsonify(code=e.code, message=e.message)
+    return jsonify(code=200, message="upload initiated", upload_id=upload_id,
+                   chunk_size=chunked_uploads.chunk_size, chunk_count=chunked_uploads.chunk_count(meta))
+
+def load_own_upload(upload_id):
+    """读取上传会话并确认属于当前用户"""
+    meta = chunked_uploads.load(upload_id)
+    if meta["user_id"] != session.get('user_id') or meta["is_teacher"] != bool(session.get('is_teacher')):
+        raise UploadError(404, "upload not found")
+    return meta
+
+# 分块上传：查询进度（断点续传时使用）
+@app.route("/api/upload/<upload_id>", methods=["GET"])
+@login_required
+def upload_status(upload_id):
+    try:
+        meta = load_own_upload(upload_id)
+        received = chunked_uploads.received(upload_id)
+    except UploadError as e:
+        return jsonify(code=e.code, message=e.message)
+    return jsonify(code=200, message="success", upload_id=upload_id, size=meta["size"],
+                   chunk_size=meta["chunk_size"], chunk_count=chunked_uploads.chunk_count(meta),
+                   received=received)
+
+# 分块上传：上传第 index 块，请求体为原始字节
+@app.route("/api/upload/<upload_id>/chunk/<int:index>", methods=["PUT"])
+@login_required
+def upload_chunk(upload_id, index):
+    try:
+        load_own_upload(upload_id)
+        # 直接读取请求流，不经过表单解析
+        digest = chunked_uploads.write_chunk(upload_id, index, request.stream, request.content_length,
+                                             request.headers.get('X-Chunk-SHA256'))
+    except UploadError as e:
+        return jsonify(code=e.code, message=e.message)
+    return jsonify(code=200, message="chunk received", index=index, sha256=digest)
+
+# 分块上传：取消
+@app.route("/api/upload/<upload_id>", methods=["DELETE"])
+@login_required
+def upload_abort(upload_id):
+    try:
+        load_own_upload(upload_id)
+    except UploadError as e:
+        return jsonify(code=e.code, message=e.message)
+    chunked_uploads.discard(upload_id)
+    return jsonify(code=200, message="upload aborted")
+
+def register_upload(meta, filepath, sha256):
+    """把完成的上传登记为 QuestionFile/AnswerFile，返回记录 id 和被替换的旧文件 (路径, 哈希)"""
+    template_id = meta["template_id"]
+    if meta["kind"] == "question":
+        name = f"{template_id}_{meta['filename']}"
+        if QuestionFile.query.filter_by(questionFileName=name).first():
+            raise UploadError(400, "question file name already exists")
+        record = QuestionFile(questionFileName=name, questionFilePath=filepath, sha256=sha256)
+        db.session.add(record)
+        db.session.flush()
+        db.session.add(TemplateToQuestionFile(temid=template_id, qid=record.id))
+        return record.id, None
+
+    # create_template 已为每个学生每道题建好答案记录，这里替换其文件
+    record = AnswerFile.query.filter_by(qid=meta["question_id"], sid=meta["student_id"]).first()
+    if record:
+        old_file = (record.answerFilePath, record.sha256)
+        record.answerFilePath = filepath
+        record.sha256 = sha256
+        return record.id, old_file
+    question = db.session.get(QuestionFile, meta["question_id"])
+    record = AnswerFile(answerFileName=f"{meta['student_id']}_{question.questionFileName}",
+                        answerFilePath=filepath, sha256=sha256, sid=meta["student_id"], qid=meta["question_id"])
+    db.session.add(record)
+    db.session.flush()
+    db.session.add(TemplateToAnswerFile(temid=template_id, aid=record.id))
+    return record.id, None
+
+def commit_upload(meta, filepath, sha256):
+    """登记已放到 filepath 的文件并提交，失败时删除该文件引用"""
+    try:
+        file_id, old_file = register_upload(meta, filepath, sha256)
+        db.session.commit()
+    except UploadError:
+        db.session.rollback()
+        delete_file(filepath, sha256)
+        raise
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        delete_file(filepath, sha256)
+        raise UploadError(500, "database error")
+
+    if meta["kind"] == "question":
+        response_cache.bump(('template', meta["template_id"]))
+    if old_file and old_file[0] != filepath:
+        delete_file(*old_file)
+    return file_id
+
+# 分块上传：完成并登记文件
+@app.route("/api/upload/<upload_id>/finalize", methods=["POST"])
+@login_required
+def upload_finalize(upload_id):
+    try:
+        load_own_upload(upload_id)
+        part_path, meta, digest = chunked_uploads.assemble(upload_id)
+    except UploadError as e:
+        return jsonify(code=e.code, message=e.message)
+
+    # 放入去重存储并登记；失败时保留上传数据，客户端可以重试
+    filepath = storage_path(meta["filename"], is_question=meta["kind"] == "question")
+    try:
+        blob_store.store_file(part_path, digest, filepath)
+    except Exception as e:
+        print(e)
+        delete_file(filepath)
+        return jsonify(code=500, message="error storing file")
+    try:
+        file_id = commit_upload(meta, filepath, digest)
+    except UploadError as e:
+        return jsonify(code=e.code, message=e.message)
+
+    chunked_uploads.discard(upload_id)
+    return jsonify(code=200, message="file uploaded successfully", file_id=file_id, sha256=digest)
+
 # 下载问题文件
 @app.route("/api/template/file/question/<int:file_id>", methods=["GET"])
 def template_file_download_question(file_id):
@@ -906,7 +1453,7 @@ def template_file_download_question(file_id):
     if not file_record.questionFilePath:
         return jsonify(code=404, message="question file not found")
     
-    file_response = get_file(file_record.questionFilePath)
+    file_response = get_file(file_record.questionFilePath, file_record.sha256)
     if file_response:
         return file_response
     else:
@@ -923,50 +1470,230 @@ def template_file_download_answer(file_id):
     if not file_record.answerFilePath:
         return jsonify(code=404, message="answer file not found")
     
-    file_response = get_file(file_record.answerFilePath)
+    file_response = get_file(file_record.answerFilePath, file_record.sha256)
     if file_response:
         return file_response
     else:
         return jsonify(code=404, message="file not found or inaccessible")
 
-# 获取模板所有文件
+# 打包下载模板的全部答案，按学生分目录
+@app.route("/api/template/<int:template_id>/answers/export", methods=["GET"])
+@login_required
+@teacher_required
+def export_template_answers(template_id):
+    """
+    边读文件边生成不压缩的 ZIP，不落临时文件；支持 Range 断点续传（见 zip_stream.py）
+    """
+    template = db.session.get(Template, template_id)
+    if not template:
+        return jsonify(code=404, message="Template not found")
+    if not teacher_owns_template(session.get('user_id'), template_id):
+        return jsonify(code=403, message="not authorized for this template")
+
+    rows = (
+        db.session.query(AnswerFile.answerFilePath, Student.sid, Student.name)
+        .join(TemplateToAnswerFile, TemplateToAnswerFile.aid == AnswerFile.id)
+        .outerjoin(Student, Student.sid == AnswerFile.sid)
+        .filter(TemplateToAnswerFile.temid == template_id)
+        .order_by(AnswerFile.sid, AnswerFile.id)
+        .all()
+    )
+    files = []
+    used_names = set()
+    for filepath, student_id, student_name in rows:
+        folder = f"{student_id}_{student_name}" if student_id else "unassigned"
+        folder = folder.replace('/', '_').replace('\\', '_')
+        # 去掉存储时添加的 uuid 前缀
+        filename = re.sub(r'^[0-9a-f]{32}_', '', os.path.basename(filepath))
+        name = f"{folder}/{filename}"
+        suffix = 1
+        while name in used_names:
+            suffix += 1
+            name = f"{folder}/{suffix}_{filename}"
+        used_names.add(name)
+        files.append((name, filepath))
+
+    # 未上传的答案文件不存在，StoredZip 会跳过
+    archive = StoredZip(files)
+    fingerprint = hashlib.sha256()
+    for entry in archive.entries:
+        fingerprint.update(b'%s\0%d\0%d\0' % (entry.name, entry.size, int(entry.mtime)))
+    etag = fingerprint.hexdigest()
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    start, stop, status = 0, len(archive), 200
+    byte_range = request.range
+    if (byte_range and len(byte_range.ranges) == 1
+            and (not request.headers.get('If-Range') or request.if_range.etag == etag)):
+        bounds = byte_range.range_for_length(len(archive))
+        if bounds is None:
+            response = app.response_class(status=416)
+            response.headers['Content-Range'] = f"bytes */{len(archive)}"
+            return response
+        (start, stop), status = bounds, 206
+
+    response = app.response_class(archive.iter_bytes(start, stop), status=status,
+                                  mimetype='application/zip', direct_passthrough=True)
+    response.content_length = stop - start
+    if status == 206:
+        response.headers['Content-Range'] = f"bytes {start}-{stop - 1}/{len(archive)}"
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Disposition'] = f'attachment; filename="template_{template_id}_answers.zip"'
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# 模板文件列表可选的字段：(问题文件列, 答案文件列)，问题文件没有的字段返回 null
+TEMPLATE_FILE_COLUMNS = {
+    "filename": (QuestionFile.questionFileName, AnswerFile.answerFileName),
+    "upload_date": (QuestionFile.upload_date, AnswerFile.upload_date),
+    "sha256": (QuestionFile.sha256, AnswerFile.sha256),
+    "student_id": (None, AnswerFile.sid),
+    "question_id": (None, AnswerFile.qid),
+}
+# 旧版响应的字段，值由类型和文件名推出
+TEMPLATE_FILE_LEGACY_FIELDS = {
+    "has_question": None,
+    "question_filename": "filename",
+    "has_answer": None,
+    "answer_filename": "filename",
+}
+TEMPLATE_FILE_DEFAULT_FIELDS = ["id", "type", "has_question", "question_filename",
+                                "has_answer", "answer_filename", "upload_date"]
+TEMPLATE_FILE_DEFAULT_LIMIT = 100
+TEMPLATE_FILE_MAX_LIMIT = 500
+
+def parse_date_arg(value, end=False):
+    """解析日期参数；结束日期只给到天时包含当天"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+# 获取模板文件（游标分页）
 @app.route("/api/template/<int:template_id>/files", methods=["GET"])
+@read_only
 def get_template_files(template_id):
-    """获取模板的所有文件"""
+    """
+    查询参数:
+    type=question|answer        (可选, 默认两种都返回, 问题文件在前)
+    student_id=5                (可选, 只返回该学生的答案文件)
+    date_from=2025-03-01        (可选, 上传时间下限, 含)
+    date_to=2025-03-31          (可选, 上传时间上限, 只写日期时包含当天)
+    fields=id,filename          (可选, 只查询需要的列; 可选 id, type, filename, upload_date, sha256,
+                                 student_id, question_id 及旧版字段)
+    limit=100                   (可选, 每页数量, 最大 500)
+    cursor=...                  (可选, 上一页返回的 next_cursor)
+    """
+    args = request.args
+    kinds = ["question", "answer"]
+    file_type = args.get("type")
+    if file_type:
+        if file_type not in kinds:
+            return jsonify(code=400, message="invalid type")
+        kinds = [file_type]
+    student_id = args.get("student_id", type=int)
+    if student_id is not None:
+        # 问题文件不属于某个学生
+        kinds = [kind for kind in kinds if kind == "answer"]
+
+    fields = args.get("fields")
+    fields = [field.strip() for field in fields.split(",") if field.strip()] if fields else TEMPLATE_FILE_DEFAULT_FIELDS
+    for field in fields:
+        if field not in TEMPLATE_FILE_COLUMNS and field not in TEMPLATE_FILE_LEGACY_FIELDS and field not in ["id", "type"]:
+            return jsonify(code=400, message=f"invalid field: {field}")
+    columns = {TEMPLATE_FILE_LEGACY_FIELDS.get(field, field) for field in fields} & set(TEMPLATE_FILE_COLUMNS)
+
+    limit = args.get("limit", TEMPLATE_FILE_DEFAULT_LIMIT, type=int)
+    if not limit or limit <= 0:
+        return jsonify(code=400, message="invalid limit")
+    limit = min(limit, TEMPLATE_FILE_MAX_LIMIT)
+
     try:
-        question_files = QuestionFile.query.filter_by(template_id=template_id).all()
-        answer_files = AnswerFile.query.filter_by(template_id=template_id).all()
-        
-        result = []
-        # 处理问题文件
-        for file in question_files:
-            result.append({
-                "id": file.fid,
-                "type": "question",
-                "has_question": True,
-                "question_filename": file.questionFileName,
-                "has_answer": False,
-                "answer_filename": None,
-                "upload_date": file.upload_date.strftime('%Y-%m-%d %H:%M:%S') if file.upload_date else None
-            })
-        
-        # 处理答案文件
-        for file in answer_files:
-            result.append({
-                "id": file.fid,
-                "type": "answer",
-                "has_question": False,
-                "question_filename": None,
-                "has_answer": True,
-                "answer_filename": file.answerFileName,
-                "upload_date": file.upload_date.strftime('%Y-%m-%d %H:%M:%S') if file.upload_date else None
-            })
-        
-        return jsonify(code=200, message="files retrieved successfully", files=result)
+        date_from = parse_date_arg(args.get("date_from"))
+        date_to = parse_date_arg(args.get("date_to"), end=True)
+    except ValueError:
+        return jsonify(code=400, message="invalid date")
+
+    cursor_kind, cursor_id = None, 0
+    if args.get("cursor"):
+        values = decode_cursor(args.get("cursor"))
+        if not (isinstance(values, list) and len(values) == 2 and values[0] in kinds and isinstance(values[1], int)):
+            return jsonify(code=400, message="invalid cursor")
+        cursor_kind, cursor_id = values
+        kinds = kinds[kinds.index(cursor_kind):]
+
+    if not db.session.get(Template, template_id):
+        return jsonify(code=404, message="Template not found")
+
+    try:
+        rows = []
+        for kind in kinds:
+            remaining = limit + 1 - len(rows)
+            if remaining <= 0:
+                break
+            # 按关联表 (temid, 文件 id) 索引顺序分页
+            position = 0 if kind == "question" else 1
+            model, link, link_column = ((QuestionFile, TemplateToQuestionFile, TemplateToQuestionFile.qid) if kind == "question"
+                                        else (AnswerFile, TemplateToAnswerFile, TemplateToAnswerFile.aid))
+            selected = [link_column.label("id")] + [
+                TEMPLATE_FILE_COLUMNS[name][position].label(name)
+                for name in columns if TEMPLATE_FILE_COLUMNS[name][position] is not None
+            ]
+            query = db.session.query(*selected).filter(link.temid == template_id)
+            if len(selected) > 1 or student_id is not None or date_from or date_to:
+                query = query.join(model, model.id == link_column)
+            if student_id is not None:
+                query = query.filter(AnswerFile.sid == student_id)
+            if date_from:
+                query = query.filter(model.upload_date >= date_from)
+            if date_to:
+                query = query.filter(model.upload_date < date_to)
+            if kind == cursor_kind:
+                query = query.filter(link_column > cursor_id)
+            rows.extend((kind, row) for row in query.order_by(link_column).limit(remaining))
     except Exception as e:
         print(e)
         return jsonify(code=500, message="database error")
 
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    result = []
+    for kind, row in rows:
+        values = row._mapping
+        item = {}
+        for field in fields:
+            if field == "id":
+                item[field] = row.id
+            elif field == "type":
+                item[field] = kind
+            elif field == "has_question":
+                item[field] = kind == "question"
+            elif field == "has_answer":
+                item[field] = kind == "answer"
+            elif field == "question_filename":
+                item[field] = values["filename"] if kind == "question" else None
+            elif field == "answer_filename":
+                item[field] = values["filename"] if kind == "answer" else None
+            elif field == "upload_date":
+                upload_date = values.get("upload_date")
+                item[field] = upload_date.isoformat(sep=' ', timespec='seconds') if upload_date else None
+            else:
+                item[field] = values.get(field)
+        result.append(item)
+
+    next_cursor = encode_cursor([rows[-1][0], rows[-1][1].id]) if has_more else None
+    return jsonify(code=200, message="files retrieved successfully", files=result,
+                   has_more=has_more, next_cursor=next_cursor)
+
 # 删除问题文件
 @app.route("/api/template/file/question/<int:file_id>", methods=["DELETE"])
 def template_question_file_delete(file_id):
@@ -975,14 +1702,15 @@ def template_question_file_delete(file_id):
         file_record = db.session.get(QuestionFile, file_id)
         if not file_record:
             return jsonify(code=404, message="Question file not found")
+        filepath, sha256 = file_record.questionFilePath, file_record.sha256
+        template_ids = [temid for (temid,) in db.session.query(TemplateToQuestionFile.temid).filter_by(qid=file_id)]
         
-        # 删除物理文件
-        if file_record.questionFilePath:
-            delete_file(file_record.questionFilePath)
-        
-        # 删除数据库记录
+        # 先删除数据库记录，再按剩余引用删除物理文件
         db.session.delete(file_record)
         db.session.commit()
+        response_cache.bump(*[('template', temid) for temid in template_ids])
+        if filepath:
+            delete_file(filepath, sha256)
         
         return jsonify(code=200, message="question file deleted successfully")
     except Exception as e:
@@ -998,14 +1726,13 @@ def template_answer_file_delete(file_id):
         file_record = db.session.get(AnswerFile, file_id)
         if not file_record:
             return jsonify(code=404, message="Answer file not found")
+        filepath, sha256 = file_record.answerFilePath, file_record.sha256
         
-        # 删除物理文件
-        if file_record.answerFilePath:
-            delete_file(file_record.answerFilePath)
-        
-        # 删除数据库记录
+        # 先删除数据库记录，再按剩余引用删除物理文件
         db.session.delete(file_record)
         db.session.commit()
+        if filepath:
+            delete_file(filepath, sha256)
         
         return jsonify(code=200, message="answer file deleted successfully")
     except Exception as e:
@@ -1017,6 +1744,7 @@ def template_answer_file_delete(file_id):
 @app.route("/class/info/<int:class_id>", methods=["POST"])
 @login_required
 @teacher_required
+@read_only
 def get_class_info(class_id):
     """获取指定班级的信息"""
     data = request.get_json()
@@ -1028,12 +1756,11 @@ def get_class_info(class_id):
         return jsonify(code=404, message="class not found")
     
     # 检查是否是该班级的老师
-    teacher_class = TeacherToClass.query.filter_by(tid=teacher_id, cid=class_id).first()
-    if not teacher_class:
+    if not teacher_owns_class(teacher_id, class_id):
         return jsonify(code=403, message="not authorized to view this class")
     
     # 获取班级学生数量
-    student_count = StudentToClass.query.filter_by(cid=class_id).count()
+    student_count = get_roster_count(class_id)
     
     # 构建班级信息
     class_info = {
@@ -1046,12 +1773,29 @@ def get_class_info(class_id):
     
     return jsonify(code=200, message="success", data=class_info)
 
+# 班级学生列表可用的排序字段
+ROSTER_SORT_FIELDS = {
+    "student_id": Student.sid,
+    "name": Student.name,
+    "account": Student.account,
+}
+ROSTER_MAX_LIMIT = 500
+
 # 获取班级学生列表
 @app.route("/class/students/<int:class_id>", methods=["POST"])
 @login_required
 @teacher_required
+@read_only
 def get_class_students(class_id):
-    """获取指定班级中的所有学生"""
+    """
+    获取指定班级中的学生，传 limit 时分页（游标分页）
+    "teacher_id": 1,
+    "limit": 100,               (可选, 每页数量, 最大 500; 不传时返回全部学生)
+    "cursor": "...",            (可选, 上一页返回的 next_cursor)
+    "sort_by": "name",          (可选, student_id / name / account)
+    "sort_order": "asc",        (可选, asc 或 desc)
+    "keyword": "Da"             (可选, 按姓名或账号模糊过滤)
+    """
     data = request.get_json()
     teacher_id = data.get("teacher_id")
     
@@ -1061,21 +1805,68 @@ def get_class_students(class_id):
         return jsonify(code=404, message="class not found")
     
     # 检查是否是该班级的老师
-    teacher_class = TeacherToClass.query.filter_by(tid=teacher_id, cid=class_id).first()
-    if not teacher_class:
+    if not teacher_owns_class(teacher_id, class_id):
         return jsonify(code=403, message="not authorized to view this class")
-    
-    # 获取班级中的所有学生
-    student_classes = StudentToClass.query.filter_by(cid=class_id).all()
-    student_ids = [sc.sid for sc in student_classes]
-    students = Student.query.filter(Student.sid.in_(student_ids)).all()
-    
+
+    sort_by = data.get("sort_by", "student_id")
+    sort_order = data.get("sort_order", "asc")
+    limit = data.get("limit")
+    if sort_by not in ROSTER_SORT_FIELDS:
+        return jsonify(code=400, message="invalid sort_by")
+    if sort_order not in ["asc", "desc"]:
+        return jsonify(code=400, message="invalid sort_order")
+    if limit is not None:
+        if not isinstance(limit, int) or limit <= 0:
+            return jsonify(code=400, message="invalid limit")
+        limit = min(limit, ROSTER_MAX_LIMIT)
+
+    # 一次连接查询获取学生，按 (排序字段, sid) 做游标分页
+    sort_column = ROSTER_SORT_FIELDS[sort_by]
+    descending = sort_order == "desc"
+    query = (
+        db.session.query(Student.sid, Student.name, Student.account)
+        .join(StudentToClass, StudentToClass.sid == Student.sid)
+        .filter(StudentToClass.cid == class_id)
+    )
+
+    keyword = data.get("keyword")
+    if keyword:
+        query = query.filter(db.or_(Student.name.contains(keyword, autoescape=True),
+                                    Student.account.contains(keyword, autoescape=True)))
+
+    cursor = data.get("cursor")
+    if cursor:
+        values = decode_cursor(cursor)
+        if not (isinstance(values, list) and len(values) == 4 and values[:2] == [sort_by, sort_order]):
+            return jsonify(code=400, message="invalid cursor")
+        last_value, last_sid = values[2], values[3]
+        if sort_column is Student.sid:
+            query = query.filter(Student.sid < last_sid if descending else Student.sid > last_sid)
+        elif descending:
+            query = query.filter(db.or_(sort_column < last_value,
+                                        db.and_(sort_column == last_value, Student.sid < last_sid)))
+        else:
+            query = query.filter(db.or_(sort_column > last_value,
+                                        db.and_(sort_column == last_value, Student.sid > last_sid)))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), Student.sid.desc())
+    else:
+        query = query.order_by(sort_column.asc(), Student.sid.asc())
+    if limit is None:
+        # 不分页（view.html 用完整名单填充学生选择和全选）
+        rows = query.all()
+        has_more = False
+    else:
+        # 多取一条判断是否还有下一页
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
     # 构建学生信息列表
+    join_date = datetime.now().strftime('%Y-%m-%d')  # 假设没有加入日期字段，使用当前日期
     student_list = []
-    for student in students:
-        student_class = StudentToClass.query.filter_by(sid=student.sid, cid=class_id).first()
-        join_date = datetime.now().strftime('%Y-%m-%d')  # 假设没有加入日期字段，使用当前日期
-        
+    for student in rows:
         student_list.append({
             "student_id": student.sid,
             "name": student.name,
@@ -1083,8 +1874,15 @@ def get_class_students(class_id):
             "join_date": join_date,
             "status": "Active"  # 假设所有学生都是活跃状态
         })
-    
-    return jsonify(code=200, message="success", data=student_list)
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        last_value = {"student_id": last.sid, "name": last.name, "account": last.account}[sort_by]
+        next_cursor = encode_cursor([sort_by, sort_order, last_value, last.sid])
+
+    return jsonify(code=200, message="success", data=student_list,
+                   total=get_roster_count(class_id), has_more=has_more, next_cursor=next_cursor)
 
 # 从班级移除学生
 @app.route("/class/remove_student", methods=["POST"])
@@ -1106,8 +1904,7 @@ def remove_student_from_class():
         return jsonify(code=404, message="class not found")
     
     # 检查是否是该班级的老师
-    teacher_class = TeacherToClass.query.filter_by(tid=teacher_id, cid=class_id).first()
-    if not teacher_class:
+    if not teacher_owns_class(teacher_id, class_id):
         return jsonify(code=403, message="not authorized for this class")
     
     # 检查学生是否在班级中
@@ -1116,56 +1913,102 @@ def remove_student_from_class():
         return jsonify(code=404, message="student not in this class")
     
     try:
-        # 删除学生班级关联
-        db.session.delete(student_class)
+        # 删除学生班级关联；并发删除同一关联时只有一个请求删到行
+        removed = db.session.execute(
+            db.delete(StudentToClass).where(StudentToClass.id == student_class.id)
+        ).rowcount
         
-        # 更新班级学生数量
-        if class_obj.studentNum > 0:
-            class_obj.studentNum -= 1
+        # 在数据库中原子地更新班级学生数量，不覆盖并发请求的修改
+        if removed:
+            db.session.execute(db.update(Class)
+                               .where(Class.cid == class_id, Class.studentNum > 0)
+                               .values(studentNum=Class.studentNum - 1))
             
         db.session.commit()
+        touch_class(class_id)
         return jsonify(code=200, message="student removed successfully")
     except Exception as e:
         print(e)
         db.session.rollback()
         return jsonify(code=500, message="error removing student")
 
+VP_MAX_LIMIT = 500
+
 # 获取老师所有Vision Pro设备信息
 @app.route("/vp/info", methods=["POST"])
 @login_required
 @teacher_required
+@response_cache.cached(lambda data: [('vp', data.get("teacher_id")), ('classes',)])
+@read_only
 def get_vp_info():
-    """获取老师所有Vision Pro设备信息"""
+    """
+    获取老师的 Vision Pro 设备信息，传 limit 时分页（游标分页）
+    "teacher_id": 1,
+    "limit": 100,               (可选, 每页数量, 最大 500; 不传时返回全部设备)
+    "cursor": "...",            (可选, 上一页返回的 next_cursor)
+    "curState": "Assigned"      (可选, 按设备状态过滤)
+    """
     data = request.get_json()
     teacher_id = data.get("teacher_id")
 
-    # 获取老师所有Vision Pro设备信息
-    vision_pros = VisionPro.query.filter_by(teacher_id=teacher_id).all()
+    limit = data.get("limit")
+    if limit is not None:
+        if not isinstance(limit, int) or limit <= 0:
+            return jsonify(code=400, message="invalid limit")
+        limit = min(limit, VP_MAX_LIMIT)
+
+    # 设备拥有者的第一条班级关联（与原逻辑 .first() 一致）
+    first_class_link = (
+        db.select(db.func.min(StudentToClass.id))
+        .where(StudentToClass.sid == VisionPro.owner_id)
+        .correlate(VisionPro)
+        .scalar_subquery()
+    )
+    # visionpro / student_class / class 一次外连接查询
+    query = (
+        db.session.query(VisionPro.vp_id, VisionPro.owner_name, VisionPro.owner_id,
+                         VisionPro.teacher_id, VisionPro.curState, Class.name.label("class_name"))
+        .outerjoin(StudentToClass, StudentToClass.id == first_class_link)
+        .outerjoin(Class, Class.cid == StudentToClass.cid)
+        .filter(VisionPro.teacher_id == teacher_id)
+    )
+
+    cur_state = data.get("curState")
+    if cur_state:
+        query = query.filter(VisionPro.curState == cur_state)
+
+    cursor = data.get("cursor")
+    if cursor:
+        values = decode_cursor(cursor)
+        if not (isinstance(values, list) and len(values) == 1 and isinstance(values[0], int)):
+            return jsonify(code=400, message="invalid cursor")
+        query = query.filter(VisionPro.vp_id > values[0])
+
+    query = query.order_by(VisionPro.vp_id)
+    if limit is None:
+        # 不分页（manageVP.html 一次加载全部设备）
+        rows = query.all()
+        has_more = False
+    else:
+        # 多取一条判断是否还有下一页
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
 
     # 构建返回数据
     vp_list = []
-    for vp in vision_pros:
-        class_name = "Not Assigned"
-        
-        # Only check for class if the VP has an owner
-        if vp.owner_id:
-            # Get the first class association for this student
-            sc = StudentToClass.query.filter_by(sid=vp.owner_id).first()
-            if sc:
-                class_obj = db.session.get(Class, sc.cid)
-                if class_obj:
-                    class_name = class_obj.name
-        
+    for vp in rows:
         vp_list.append({
             "vp_id": vp.vp_id,
             "owner_name": vp.owner_name or "Not Assigned",
             "owner_id": vp.owner_id or None,
             "teacher_id": vp.teacher_id,
-            "class": class_name,
+            "class": (vp.class_name or "Not Assigned") if vp.owner_id else "Not Assigned",
             "curState": vp.curState
         })
 
-    return jsonify(code=200, message="success", data=vp_list)
+    next_cursor = encode_cursor([rows[-1].vp_id]) if has_more else None
+    return jsonify(code=200, message="success", data=vp_list, has_more=has_more, next_cursor=next_cursor)
 
 @app.route("/vp/add", methods=["POST"])
 @login_required
@@ -1191,6 +2034,7 @@ def add_vp():
     new_vp = VisionPro(vp_id=vp_id, owner_name=owner_name, owner_id=owner_id, teacher_id=teacher_id, curState=curState)
     db.session.add(new_vp)
     db.session.commit()
+    response_cache.bump(('vp', teacher_id))
     
     return jsonify(code=200, message="Vision Pro added successfully")
     
@@ -1213,6 +2057,7 @@ def delete_vp():
     # 删除Vision Pro设备    
     db.session.delete(vp)
     db.session.commit()
+    response_cache.bump(('vp', vp.teacher_id))
     
     return jsonify(code=200, message="Vision Pro deleted successfully")
 
@@ -0,0 +1,118 @@
+"""
+教师资源归属校验
+
+会话中只缓存老师最近校验通过的少量班级 id 和模板 id（每类最多 MAX_CACHED_IDS 个），
+不再整体加载老师的全部对象，会话大小与老师拥有的对象数量无关。
+- 集合未命中时查数据库，命中后加入集合；新建班级、模板时由对应接口调用 grant 加入
+- 每个老师有一个归属版本号，存放在与响应缓存共用的版本号存储中（sqlite 存储时多进程共享）；
+  删除班级、模板时 revoke 递增其所有老师的版本号，其他会话和进程中缓存的集合在下次校验时整体丢弃
+"""
+from flask import g, session
+
+from model import TeacherToClass, TeacherToTemplate
+
+CLASSES = 'classes'
+TEMPLATES = 'templates'
+MAX_CACHED_IDS = 256
+
+# 版本号存储（MemoryVersionStore / SQLiteVersionStore），由 api.py 调用 configure 设置
+_versions = None
+
+
+def configure(app, versions):
+    global _versions
+    _versions = versions
+
+    @app.teardown_request
+    def clear_request_cache(exc=None):
+        # 已有应用上下文时（如脚本、测试）多个请求共用同一个 g
+        g.pop('authz_data', None)
+
+
+def version_key(teacher_id):
+    return f"authz:{teacher_id}"
+
+
+def class_owned(teacher_id, class_id):
+    return TeacherToClass.query.filter_by(tid=teacher_id, cid=class_id).first() is not None
+
+
+def template_owned(teacher_id, template_id):
+    return TeacherToTemplate.query.filter_by(tid=teacher_id, temid=template_id).first() is not None
+
+
+def _cached():
+    """当前会话老师缓存的归属信息，版本号已变化时清空；同一请求内只读取一次版本号"""
+    data = g.get('authz_data')
+    if data is None:
+        teacher_id = session.get('user_id')
+        key = version_key(teacher_id)
+        version = _versions.get_many([key])[key]
+        data = session.get('authz')
+        if not data or data.get('tid') != teacher_id or data.get('version') != version:
+            data = {'tid': teacher_id, 'version': version, CLASSES: [], TEMPLATES: []}
+            session['authz'] = data
+        g.authz_data = data
+    return data
+
+
+def _update(kind, object_id, add):
+    data = dict(_cached())
+    ids = [cached_id for cached_id in data[kind] if cached_id != object_id]
+    if add:
+        # 超出上限时丢弃最早加入的
+        ids = (ids + [object_id])[-MAX_CACHED_IDS:]
+    data[kind] = ids
+    session['authz'] = g.authz_data = data
+
+
+def grant(kind, teacher_id, object_id):
+    """当前会话老师新增了某个对象"""
+    if _is_session_teacher(teacher_id):
+        _update(kind, int(object_id), True)
+
+
+def revoke(kind, object_id, teacher_ids):
+    """对象被删除（事务提交后调用）：使拥有它的老师在所有会话中缓存的归属信息失效"""
+    if teacher_ids:
+        _versions.bump(sorted({version_key(teacher_id) for teacher_id in teacher_ids}))
+    g.pop('authz_data', None)
+    if session.get('is_teacher') and session.get('authz'):
+        _update(kind, int(object_id), False)
+
+
+def invalidate():
+    """丢弃当前会话缓存的归属信息，下次校验时重新读取"""
+    session.pop('authz', None)
+    g.pop('authz_data', None)
+
+
+def _is_session_teacher(teacher_id):
+    try:
+        return session.get('is_teacher') and int(teacher_id) == session.get('user_id')
+    except (TypeError, ValueError):
+        return False
+
+
+def _owns(kind, teacher_id, object_id, query):
+    try:
+        object_id = int(object_id)
+    except (TypeError, ValueError):
+        return False
+    # 请求中的老师不是当前会话老师时直接查库
+    if not _is_session_teacher(teacher_id):
+        return query(teacher_id, object_id)
+    if object_id in _cached()[kind]:
+        return True
+    if query(teacher_id, object_id):
+        _update(kind, object_id, True)
+        return True
+    return False
+
+
+def teacher_owns_class(teacher_id, class_id):
+    return _owns(CLASSES, teacher_id, class_id, class_owned)
+
+
+def teacher_owns_template(teacher_id, template_id):
+    return _owns(TEMPLATES, teacher_id, template_id, template_owned)
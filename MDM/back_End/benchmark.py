@@ -0,0 +1,410 @@
+"""
+后端负载基准测试
+
+按给定规模写入数据后，在本进程内启动多线程 HTTP 服务（api.app），由并发客户端执行场景：
+    login        同一班级的学生依次登录
+    dashboard    老师登录后反复打开班级、模板、名单、设备等页面
+    templates    老师反复打开模板列表（配合 --teachers 1 --templates 10000 测大列表的查询次数）
+    upload       学生分块上传答案文件
+    create       老师为整个班级创建模板（配合 --students 300 --questions 20 测批量写入）
+
+每个接口统计请求数、错误数、p50/p95/p99 延迟、吞吐和每次请求的 SQL 次数（取自 X-DB-Queries 响应头），
+结果可写入 JSON，与其他提交的结果对比。
+
+默认使用临时 sqlite 数据库，也可以通过环境变量 DATABASE_URL 指向 MySQL：
+
+    python benchmark.py --teachers 5 --classes 4 --students 40 --templates 20 --clients 16 --duration 10
+    python benchmark.py --scenarios dashboard,upload --output results/HEAD.json
+    python benchmark.py --teachers 1 --classes 1 --templates 10000 --questions 1 --scenarios templates
+    python benchmark.py --teachers 1 --classes 1 --students 300 --questions 20 --templates 1 --scenarios create
+    python benchmark.py --compare results/base.json results/HEAD.json
+"""
+import argparse
+import datetime
+import http.client
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+if 'DATABASE_URL' not in os.environ:
+    _db_path = os.path.join(tempfile.mkdtemp(prefix='mdm_bench_'), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + _db_path
+# 每个响应带上 SQL 次数和耗时
+os.environ.setdefault('DB_PROFILER_HEADERS', '1')
+
+import api
+from api import app, db
+from blob_store import BlobStore
+from seed import Layout, seed as seed_layout
+from uploads import ChunkedUploads
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+TEACHER_PASSWORD = 'bench'
+STUDENT_PASSWORD = 'student'
+PERCENTILES = (50, 95, 99)
+
+
+def seed_dataset(teachers, classes_per_teacher, students_per_class, templates_per_teacher,
+                 questions_per_template, devices_per_teacher, random_seed):
+    """用 seed.py 按规模写入数据（相同参数得到相同的数据），返回场景使用的主键"""
+    layout = Layout(teachers, classes_per_teacher, students_per_class, templates_per_teacher,
+                    questions_per_template, devices_per_teacher, random_seed=random_seed)
+    seed_layout(layout, teacher_password=TEACHER_PASSWORD, student_password=STUDENT_PASSWORD,
+                upload_folder=api.UPLOAD_FOLDER)
+
+    dataset = {'teachers': [], 'classes': {}, 'templates': {}, 'questions_per_template': questions_per_template}
+    for tid in layout.teacher_ids():
+        dataset['teachers'].append({'tid': tid, 'account': layout.teacher_account(tid),
+                                    'classes': list(layout.class_ids(tid)),
+                                    'templates': list(layout.template_ids(tid))})
+        for cid in layout.class_ids(tid):
+            dataset['classes'][cid] = list(layout.student_ids(cid))
+        for temid in layout.template_ids(tid):
+            dataset['templates'][temid] = {'class_id': layout.template_class(temid),
+                                           'questions': list(layout.question_ids(temid))}
+    return dataset
+
+
+def use_upload_dir(upload_dir):
+    """把上传相关目录指向临时目录，避免污染 uploads"""
+    api.UPLOAD_FOLDER = upload_dir
+    api.QUESTION_FOLDER = os.path.join(upload_dir, 'questions')
+    api.ANSWER_FOLDER = os.path.join(upload_dir, 'answers')
+    api.blob_store = BlobStore(os.path.join(upload_dir, '.blobs'))
+    api.chunked_uploads = ChunkedUploads(os.path.join(upload_dir, '.incoming'),
+                                         chunk_size=api.chunked_uploads.chunk_size,
+                                         max_size=api.chunked_uploads.max_size)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """不输出每个请求的访问日志"""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class Recorder:
+    """线程安全地收集每个请求的 (接口, 状态, 延迟, SQL 次数)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def add(self, sample):
+        with self._lock:
+            self.samples.append(sample)
+
+
+class HttpClient:
+    """每个虚拟用户一个长连接，自行保存会话 cookie"""
+
+    def __init__(self, host, port, recorder):
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.recorder = recorder
+        self.cookie = None
+
+    def request(self, name, method, path, json_body=None, body=None, headers=None):
+        headers = dict(headers or {})
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        start = time.perf_counter()
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        data = response.read()
+        latency = time.perf_counter() - start
+
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        payload = None
+        if response.getheader('Content-Type', '').startswith('application/json'):
+            payload = json.loads(data)
+        code = payload.get('code') if isinstance(payload, dict) else None
+        ok = response.status < 400 and (code is None or code == 200)
+        queries = response.getheader('X-DB-Queries')
+        self.recorder.add((name, ok, latency, int(queries) if queries is not None else None))
+        return payload
+
+    def close(self):
+        self.connection.close()
+
+
+def scenario_login(client, dataset, rng, worker):
+    """同一班级的学生依次登录"""
+    students = dataset['classes'][rng.choice(list(dataset['classes']))]
+    for sid in students:
+        client.cookie = None
+        yield client.request('POST /student/login', 'POST', '/student/login',
+                             {'account': f'student{sid}', 'password': STUDENT_PASSWORD})
+
+
+def scenario_dashboard(client, dataset, rng, worker):
+    """老师登录后依次打开各个页面"""
+    teacher = dataset['teachers'][worker % len(dataset['teachers'])]
+    tid = teacher['tid']
+    yield client.request('POST /teacher/login', 'POST', '/teacher/login',
+                         {'account': teacher['account'], 'password': TEACHER_PASSWORD})
+    while True:
+        cid = rng.choice(teacher['classes'])
+        yield client.request('POST /teacher/classes', 'POST', '/teacher/classes', {'teacher_id': tid})
+        yield client.request('POST /api/teacher/templates', 'POST', '/api/teacher/templates', {'teacher_id': tid})
+        yield client.request('POST /class/info/<id>', 'POST', f'/class/info/{cid}', {'teacher_id': tid})
+        yield client.request('POST /class/students/<id>', 'POST', f'/class/students/{cid}', {'teacher_id': tid})
+        yield client.request('POST /vp/info', 'POST', '/vp/info', {'teacher_id': tid})
+        if teacher['templates']:
+            temid = rng.choice(teacher['templates'])
+            yield client.request('POST /api/template/detail', 'POST', '/api/template/detail', {'template_id': temid})
+            yield client.request('GET /api/template/<id>/files', 'GET', f'/api/template/{temid}/files?limit=100')
+
+
+def scenario_templates(client, dataset, rng, worker):
+    """老师登录后反复打开模板列表"""
+    teacher = dataset['teachers'][worker % len(dataset['teachers'])]
+    yield client.request('POST /teacher/login', 'POST', '/teacher/login',
+                         {'account': teacher['account'], 'password': TEACHER_PASSWORD})
+    while True:
+        yield client.request('POST /api/teacher/templates', 'POST', '/api/teacher/templates',
+                             {'teacher_id': teacher['tid']})
+
+
+def scenario_create(client, dataset, rng, worker):
+    """老师登录后为自己的一个班级的全部学生创建模板"""
+    teacher = dataset['teachers'][worker % len(dataset['teachers'])]
+    yield client.request('POST /teacher/login', 'POST', '/teacher/login',
+                         {'account': teacher['account'], 'password': TEACHER_PASSWORD})
+    questions = dataset['questions_per_template']
+    count = 0
+    while True:
+        count += 1
+        cid = rng.choice(teacher['classes'])
+        yield client.request('POST /api/template/create', 'POST', '/api/template/create', {
+            'teacher_id': teacher['tid'], 'name': f'Bench create {worker}-{count}',
+            'student_ids': dataset['classes'][cid],
+            'question_names': [f'{index}.jpg' for index in range(1, questions + 1)],
+            'startTime': '2025-01-01 00:00:00', 'endTime': '2025-12-31 23:59:59', 'description': ''})
+
+
+def scenario_upload(client, dataset, rng, worker, file_size=256 * 1024):
+    """学生登录后为一个模板的每道题分块上传答案"""
+    templates = [temid for temid, template in dataset['templates'].items() if template['questions']]
+    temid = rng.choice(templates)
+    template = dataset['templates'][temid]
+    sid = rng.choice(dataset['classes'][template['class_id']])
+    yield client.request('POST /student/login', 'POST', '/student/login',
+                         {'account': f'student{sid}', 'password': STUDENT_PASSWORD})
+    for qid in template['questions']:
+        content = rng.randbytes(file_size)
+        init = client.request('POST /api/template/<id>/upload/init', 'POST', f'/api/template/{temid}/upload/init',
+                              {'kind': 'answer', 'filename': f'{qid}.jpg', 'size': len(content), 'question_id': qid})
+        yield init
+        if not init or init.get('code') != 200:
+            continue
+        chunk_size = init['chunk_size']
+        for index in range(init['chunk_count']):
+            yield client.request('PUT /api/upload/<id>/chunk/<index>', 'PUT',
+                                 f"/api/upload/{init['upload_id']}/chunk/{index}",
+                                 body=content[index * chunk_size:(index + 1) * chunk_size],
+                                 headers={'Content-Type': 'application/octet-stream'})
+        yield client.request('POST /api/upload/<id>/finalize', 'POST', f"/api/upload/{init['upload_id']}/finalize", {})
+
+
+SCENARIOS = {
+    'login': scenario_login,
+    'dashboard': scenario_dashboard,
+    'templates': scenario_templates,
+    'upload': scenario_upload,
+    # 会新增模板，放在最后避免影响其他场景的数据规模
+    'create': scenario_create,
+}
+
+
+def run_scenario(name, server, dataset, clients, duration, random_seed):
+    """clients 个线程循环执行场景直到 duration 秒，返回按接口汇总的结果"""
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+    errors = []
+
+    def worker(index):
+        rng = random.Random(f'{random_seed}-{name}-{index}')
+        client = HttpClient(server.host, server.port, recorder)
+        try:
+            while time.perf_counter() < deadline:
+                # 场景每完成一个请求 yield 一次，到时间后在请求之间停止
+                for _ in SCENARIOS[name](client, dataset, rng, index):
+                    if time.perf_counter() >= deadline:
+                        break
+        except Exception as e:
+            errors.append(f'{type(e).__name__}: {e}')
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        print(f'{name}: {len(errors)} clients failed, first error: {errors[0]}')
+    return summarize(recorder.samples, elapsed)
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def summarize(samples, elapsed):
+    by_endpoint = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample[0]].append(sample)
+
+    endpoints = {}
+    for endpoint, items in sorted(by_endpoint.items()):
+        latencies = sorted(latency for _, _, latency, _ in items)
+        queries = [count for _, _, _, count in items if count is not None]
+        result = {
+            'requests': len(items),
+            'errors': sum(1 for _, ok, _, _ in items if not ok),
+            'throughput': len(items) / elapsed,
+            'mean_ms': statistics.fmean(latencies) * 1000,
+            'queries_per_request': statistics.fmean(queries) if queries else None,
+        }
+        for p in PERCENTILES:
+            result[f'p{p}_ms'] = percentile(latencies, p) * 1000
+        endpoints[endpoint] = result
+    return {
+        'elapsed_s': elapsed,
+        'requests': len(samples),
+        'errors': sum(1 for _, ok, _, _ in samples if not ok),
+        'throughput': len(samples) / elapsed if elapsed else 0,
+        'endpoints': endpoints,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    for name, scenario in results['scenarios'].items():
+        print(f"\n[{name}] {scenario['requests']} requests in {scenario['elapsed_s']:.1f} s, "
+              f"{scenario['throughput']:.1f} req/s, {scenario['errors']} errors")
+        print(f"  {'endpoint':<40} {'req':>6} {'err':>5} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'sql':>6}")
+        for endpoint, row in scenario['endpoints'].items():
+            sql = f"{row['queries_per_request']:.1f}" if row['queries_per_request'] is not None else '-'
+            print(f"  {endpoint:<40} {row['requests']:>6} {row['errors']:>5} {row['throughput']:>8.1f} "
+                  f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {sql:>6}")
+
+
+def compare(base_path, head_path):
+    """对比两次结果中相同场景、相同接口的吞吐和延迟"""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(head_path) as f:
+        head = json.load(f)
+    print(f"base {base['meta'].get('revision')} -> head {head['meta'].get('revision')}")
+
+    def change(old, new):
+        if old is None or new is None or not old:
+            return '-'
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    for name, scenario in head['scenarios'].items():
+        old_scenario = base['scenarios'].get(name)
+        if not old_scenario:
+            continue
+        print(f"\n[{name}] throughput {change(old_scenario['throughput'], scenario['throughput'])}")
+        print(f"  {'endpoint':<40} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'sql':>8}")
+        for endpoint, row in scenario['endpoints'].items():
+            old = old_scenario['endpoints'].get(endpoint)
+            if not old:
+                continue
+            print(f"  {endpoint:<40} {change(old['throughput'], row['throughput']):>8} "
+                  f"{change(old['p50_ms'], row['p50_ms']):>8} {change(old['p95_ms'], row['p95_ms']):>8} "
+                  f"{change(old['p99_ms'], row['p99_ms']):>8} "
+                  f"{change(old['queries_per_request'], row['queries_per_request']):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MDM backend load benchmark')
+    parser.add_argument('--teachers', type=int, default=5)
+    parser.add_argument('--classes', type=int, default=4, help='classes per teacher')
+    parser.add_argument('--students', type=int, default=40, help='students per class')
+    parser.add_argument('--templates', type=int, default=20, help='templates per teacher')
+    parser.add_argument('--questions', type=int, default=10, help='questions per template')
+    parser.add_argument('--devices', type=int, default=10, help='Vision Pro devices per teacher')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma separated: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients per scenario')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per scenario')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'HEAD'), help='compare two JSON results and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error(f'unknown scenario: {name}')
+
+    upload_dir = tempfile.mkdtemp(prefix='mdm_bench_uploads_')
+    use_upload_dir(upload_dir)
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    try:
+        with app.app_context():
+            start = time.perf_counter()
+            dataset = seed_dataset(args.teachers, args.classes, args.students, args.templates,
+                                   args.questions, args.devices, args.seed)
+            seed_seconds = time.perf_counter() - start
+            database = db.engine.url.get_backend_name()
+            db.session.remove()
+        print(f'seeded in {seed_seconds:.1f} s')
+
+        server_thread.start()
+        results = {
+            'meta': {
+                'revision': git_revision(),
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'database': database,
+                'args': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+                'seed_s': seed_seconds,
+            },
+            'scenarios': {},
+        }
+        for name in scenarios:
+            results['scenarios'][name] = run_scenario(name, server, dataset, args.clients, args.duration, args.seed)
+    finally:
+        if server_thread.is_alive():
+            server.shutdown()
+        server.server_close()
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    print_results(results)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'\nresults written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
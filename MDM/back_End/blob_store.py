@@ -0,0 +1,109 @@
+"""
+按内容寻址的文件存储
+
+相同内容只保存一份：<root>/<sha256[:2]>/<sha256[2:4]>/<sha256>。
+QuestionFile/AnswerFile 的路径仍各不相同（数据库对路径有唯一约束），它们是指向
+blob 的硬链接，读文件的代码无需改动。引用计数由调用方根据数据库中 sha256 相同的
+记录数判断，最后一个引用删除后才删除 blob。
+
+不支持硬链接的文件系统上退化为复制，仍然可用但不再节省空间。
+"""
+import hashlib
+import os
+import re
+import shutil
+import uuid
+
+READ_BLOCK_SIZE = 64 * 1024
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_sha256(value):
+    return isinstance(value, str) and SHA256_PATTERN.match(value) is not None
+
+
+class BlobStore:
+
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def blob_path(self, sha256):
+        if not is_sha256(sha256):
+            raise ValueError(f"invalid sha256: {sha256!r}")
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256):
+        return is_sha256(sha256) and os.path.exists(self.blob_path(sha256))
+
+    def _tmp_path(self):
+        return os.path.join(self.tmp_dir, uuid.uuid4().hex)
+
+    @staticmethod
+    def _link_or_copy(src, dest):
+        try:
+            os.link(src, dest)
+        except FileExistsError:
+            raise
+        except OSError:
+            shutil.copyfile(src, dest)
+
+    def _adopt(self, src, sha256):
+        """把 src 登记为 blob（已存在则保留原 blob）"""
+        blob = self.blob_path(sha256)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            self._link_or_copy(src, blob)
+        except FileExistsError:
+            pass
+        return blob
+
+    def _place(self, src, sha256, dest):
+        """让 dest 成为 blob 的硬链接；blob 恰好被并发删除时用 src 重新登记"""
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        try:
+            self._link_or_copy(self._adopt(src, sha256), dest)
+        except FileNotFoundError:
+            self._link_or_copy(self._adopt(src, sha256), dest)
+
+    def store_stream(self, stream, dest):
+        """把上传流写入存储并在 dest 建立链接，返回 (sha256, size)"""
+        tmp = self._tmp_path()
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp, 'wb') as f:
+                for block in iter(lambda: stream.read(READ_BLOCK_SIZE), b''):
+                    f.write(block)
+                    hasher.update(block)
+                    size += len(block)
+            sha256 = hasher.hexdigest()
+            self._place(tmp, sha256, dest)
+            return sha256, size
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def store_file(self, src, sha256, dest):
+        """把已知哈希的本地文件（如分块上传拼好的文件）登记到存储，src 保持不变由调用方清理"""
+        self._place(src, sha256, dest)
+
+    def link(self, sha256, dest):
+        """内容已存在时直接在 dest 建立链接；blob 不存在返回 False。只能用于服务器自己计算过哈希的内容"""
+        if not self.exists(sha256):
+            return False
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        try:
+            self._link_or_copy(self.blob_path(sha256), dest)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def remove(self, sha256):
+        """删除 blob，调用方需先确认已无引用"""
+        try:
+            os.remove(self.blob_path(sha256))
+            return True
+        except FileNotFoundError:
+            return False
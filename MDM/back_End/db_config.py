@@ -0,0 +1,195 @@
+"""
+数据库引擎配置与连接池监控
+
+配置项（app.config 或同名环境变量）：
+    DB_POOL_SIZE            常驻连接数，默认 10
+    DB_MAX_OVERFLOW         高峰时额外允许的连接数，默认 20
+    DB_POOL_TIMEOUT         等待空闲连接的超时秒数（整数），默认 10
+    DB_POOL_RECYCLE         连接最长使用秒数，超过后重建，默认 1800（需小于 MySQL wait_timeout）
+    DB_POOL_PRE_PING        取出连接时先探活，默认开启，避免空闲后第一批请求用到已断开的连接
+    DB_CONNECT_TIMEOUT      建立连接的超时秒数，默认 10
+    DB_STATEMENT_TIMEOUT    单条语句超时秒数，默认 0 不限制
+                            MySQL 使用 max_execution_time（只对 SELECT 生效），
+                            PostgreSQL 使用 statement_timeout，SQLite 由进度回调中断
+
+SQLite 内存库使用 Flask-SQLAlchemy 的 StaticPool，不应用连接池参数。
+"""
+import os
+import statistics
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+
+
+class PoolTelemetry:
+    """连接池取连接的等待情况"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waiters = 0
+        self.max_waiters = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self._waits = deque(maxlen=1024)
+
+    def enter(self):
+        with self._lock:
+            self.waiters += 1
+            self.max_waiters = max(self.max_waiters, self.waiters)
+
+    def leave(self, elapsed, timed_out=False):
+        with self._lock:
+            self.waiters -= 1
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                self._waits.append(elapsed)
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            data = {
+                'waiters': self.waiters,
+                'max_waiters': self.max_waiters,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+            }
+        data['wait_ms'] = {
+            'mean': statistics.fmean(waits) * 1000 if waits else None,
+            'p95': waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000 if waits else None,
+            'max': waits[-1] * 1000 if waits else None,
+        }
+        return data
+
+
+class InstrumentedQueuePool(QueuePool):
+    """记录取连接等待时间和排队数的 QueuePool（等待时间包含建立连接和探活）"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.telemetry = PoolTelemetry()
+        event.listen(self, 'connect', lambda *args: self.telemetry.count('connects'))
+        event.listen(self, 'invalidate', lambda *args: self.telemetry.count('invalidations'))
+
+    def connect(self):
+        self.telemetry.enter()
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.telemetry.leave(time.perf_counter() - start, timed_out=True)
+            raise
+        except BaseException:
+            self.telemetry.leave(time.perf_counter() - start)
+            raise
+        self.telemetry.leave(time.perf_counter() - start)
+        return connection
+
+
+def _setting(config, name, default, cast=str):
+    value = config.get(name, os.environ.get(name))
+    if value is None:
+        return default
+    if cast is bool:
+        return value if isinstance(value, bool) else str(value).lower() in TRUE_VALUES
+    return cast(value)
+
+
+def is_memory_sqlite(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(url, config):
+    """根据配置生成 SQLALCHEMY_ENGINE_OPTIONS"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    statement_timeout = _setting(config, 'DB_STATEMENT_TIMEOUT', 0, float)
+    connect_timeout = _setting(config, 'DB_CONNECT_TIMEOUT', 10, int)
+    options = {}
+    connect_args = {}
+
+    if not is_memory_sqlite(url):
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=_setting(config, 'DB_POOL_SIZE', 10, int),
+            max_overflow=_setting(config, 'DB_MAX_OVERFLOW', 20, int),
+            pool_timeout=_setting(config, 'DB_POOL_TIMEOUT', 10, int),
+            pool_recycle=_setting(config, 'DB_POOL_RECYCLE', 1800, int),
+            pool_pre_ping=_setting(config, 'DB_POOL_PRE_PING', True, bool),
+        )
+
+    if backend == 'mysql':
+        connect_args['connect_timeout'] = connect_timeout
+        if statement_timeout:
+            connect_args['init_command'] = f"SET SESSION max_execution_time={int(statement_timeout * 1000)}"
+    elif backend == 'postgresql':
+        connect_args['connect_timeout'] = connect_timeout
+        if statement_timeout:
+            connect_args['options'] = f"-c statement_timeout={int(statement_timeout * 1000)}"
+    elif backend == 'sqlite':
+        # 等待其他连接释放写锁的时间
+        connect_args['timeout'] = connect_timeout
+
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+def install_engine_hooks(engine, config):
+    """SQLite 没有语句超时，用进度回调在超时后中断执行（抛出 OperationalError: interrupted）"""
+    statement_timeout = _setting(config, 'DB_STATEMENT_TIMEOUT', 0, float)
+    if engine.dialect.name != 'sqlite' or not statement_timeout:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_progress_handler(dbapi_connection, connection_record):
+        deadline = connection_record.info['statement_deadline'] = [None]
+
+        def check():
+            return 1 if deadline[0] is not None and time.monotonic() > deadline[0] else 0
+        dbapi_connection.set_progress_handler(check, 10000)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        deadline = conn.info.get('statement_deadline')
+        if deadline is not None:
+            deadline[0] = time.monotonic() + statement_timeout
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        deadline = conn.info.get('statement_deadline')
+        if deadline is not None:
+            deadline[0] = None
+
+
+def pool_stats(engine):
+    """连接池实时状态"""
+    pool = engine.pool
+    data = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        data.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow(),
+        )
+    telemetry = getattr(pool, 'telemetry', None)
+    if telemetry is not None:
+        data.update(telemetry.snapshot())
+    return data
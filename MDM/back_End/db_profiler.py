@@ -0,0 +1,199 @@
+"""
+按请求统计 SQL
+
+通过 SQLAlchemy 的 before/after_cursor_execute 事件记录每条语句的耗时：
+- 每个请求统计查询次数和数据库总耗时，调试模式下写入响应头 X-DB-Queries / X-DB-Time（毫秒）
+- 同一请求中形状相同（忽略参数和 IN 列表长度）的 SELECT 执行次数达到阈值时输出 N+1 警告
+- 超过慢查询阈值的 SELECT 连同参数和执行计划一起输出
+- query_budget 用于测试和基准脚本，断言一段代码内的查询次数不超过上限
+
+配置项（app.config 或同名环境变量）：
+    DB_PROFILER               是否启用，默认开启
+    DB_PROFILER_HEADERS       是否输出响应头，默认跟随 app.debug
+    DB_N_PLUS_ONE_THRESHOLD   同一形状语句的告警次数，默认 10
+    DB_SLOW_QUERY_MS          慢查询阈值（毫秒），默认 200，0 表示不记录
+"""
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, request
+from sqlalchemy import event
+
+TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+PARAMETER_LOG_LIMIT = 500
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+_PLACEHOLDER_LIST = re.compile(r'\(\s*' + _PLACEHOLDER + r'(?:\s*,\s*' + _PLACEHOLDER + r')*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+_local = threading.local()
+
+
+def statement_shape(statement):
+    """去掉字面量、合并 IN 列表，得到用于识别重复语句的形状"""
+    shape = _STRING_LITERAL.sub('?', statement)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _PLACEHOLDER_LIST.sub('(?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def is_select(statement):
+    return statement.lstrip().upper().startswith(('SELECT', 'WITH'))
+
+
+class QueryProfile:
+    """一段代码内执行的语句"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.total_time += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        """执行次数达到 threshold 的 SELECT 形状"""
+        return [(shape, count) for shape, count in self.shapes.most_common()
+                if count >= threshold and is_select(shape)]
+
+    def report(self, limit=20):
+        lines = [f"{self.count} queries, {self.total_time * 1000:.1f} ms"]
+        lines += [f"  {count}x {shape}" for shape, count in self.shapes.most_common(limit)]
+        return '\n'.join(lines)
+
+
+def _active_profiles():
+    profiles = getattr(_local, 'profiles', None)
+    if profiles is None:
+        profiles = _local.profiles = []
+    return profiles
+
+
+def start_profile():
+    query_profile = QueryProfile()
+    _active_profiles().append(query_profile)
+    return query_profile
+
+
+def stop_profile(query_profile):
+    _active_profiles().remove(query_profile)
+
+
+@contextmanager
+def profile():
+    """记录当前线程在 with 块内执行的语句，可以嵌套（例如测试中的 query_budget 包住一次请求）"""
+    query_profile = start_profile()
+    try:
+        yield query_profile
+    finally:
+        stop_profile(query_profile)
+
+
+@contextmanager
+def query_budget(max_queries):
+    """
+    断言 with 块内的查询次数不超过 max_queries，超出时抛出 AssertionError 并列出语句形状
+
+        with query_budget(3):
+            client.post('/api/teacher/templates', json={'teacher_id': 1})
+    """
+    with profile() as query_profile:
+        yield query_profile
+    if query_profile.count > max_queries:
+        raise AssertionError(f"query budget exceeded: {query_profile.count} > {max_queries}\n"
+                             f"{query_profile.report()}")
+
+
+def explain(cursor_connection, dialect, statement, parameters):
+    """用同一连接上的新游标获取执行计划"""
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    cursor = cursor_connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [' | '.join(str(value) for value in row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+class DBProfiler:
+
+    def __init__(self, n_plus_one_threshold=10, slow_query_ms=200, headers=False):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.slow_query_ms = slow_query_ms
+        self.headers = headers
+
+    @classmethod
+    def from_config(cls, app):
+        def setting(name, default):
+            return app.config.get(name, os.environ.get(name, default))
+        headers = setting('DB_PROFILER_HEADERS', None)
+        return cls(n_plus_one_threshold=int(setting('DB_N_PLUS_ONE_THRESHOLD', 10)),
+                   slow_query_ms=float(setting('DB_SLOW_QUERY_MS', 200)),
+                   headers=app.debug if headers is None else str(headers).lower() in TRUE_VALUES)
+
+    @staticmethod
+    def enabled(app):
+        return str(app.config.get('DB_PROFILER', os.environ.get('DB_PROFILER', '1'))).lower() in TRUE_VALUES
+
+    def install(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._profiler_start = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_profiler_start', None)
+        if start is None:
+            return
+        duration = time.perf_counter() - start
+        for query_profile in _active_profiles():
+            query_profile.record(statement, duration)
+        if self.slow_query_ms and duration * 1000 >= self.slow_query_ms and not executemany and is_select(statement):
+            self._log_slow_query(conn, cursor, statement, parameters, duration)
+
+    def _log_slow_query(self, conn, cursor, statement, parameters, duration):
+        try:
+            plan = explain(cursor.connection, conn.dialect.name, statement, parameters)
+        except Exception as e:
+            plan = [f"unavailable: {e}"]
+        print(f"Slow query ({duration * 1000:.1f} ms): {_WHITESPACE.sub(' ', statement)}\n"
+              f"  parameters: {repr(parameters)[:PARAMETER_LOG_LIMIT]}\n"
+              + '\n'.join(f"  plan: {line}" for line in plan))
+
+    def init_app(self, app, engines):
+        for engine in engines:
+            self.install(engine)
+
+        @app.before_request
+        def start_request_profile():
+            g.db_profile = start_profile()
+
+        @app.after_request
+        def finish_profile(response):
+            query_profile = g.get('db_profile')
+            if query_profile is None:
+                return response
+            for shape, count in query_profile.repeated(self.n_plus_one_threshold):
+                print(f"Possible N+1 in {request.method} {request.path} ({request.endpoint}): "
+                      f"{count}x {shape}")
+            if self.headers:
+                response.headers['X-DB-Queries'] = str(query_profile.count)
+                response.headers['X-DB-Time'] = f"{query_profile.total_time * 1000:.1f}"
+            return response
+
+        @app.teardown_request
+        def stop_request_profile(exc):
+            query_profile = g.pop('db_profile', None)
+            if query_profile is not None:
+                stop_profile(query_profile)
@@ -0,0 +1,265 @@
+"""
+读写分离
+
+用 read_only 标记的只读接口把 SELECT 发到只读副本，其余语句和其他接口都走主库。
+- 同一请求内固定使用一个副本，结果前后一致
+- 会话写入并提交后的 REPLICA_STICKY_SECONDS 秒内，该会话的读请求仍走主库（读到自己的写入）
+- 定期检查副本延迟，超过 REPLICA_MAX_LAG 或连接失败的副本暂停使用；
+  没有可用副本时回退到主库，只读接口在副本上出错时自动在主库重试一次
+- 从副本读出的数据写入进程内缓存时，有效期不超过 REPLICA_MAX_LAG（见 replica_cache_ttl）
+
+配置项（app.config 或同名环境变量）：
+    DATABASE_REPLICA_URLS     副本连接串，逗号分隔；为空时全部走主库
+    REPLICA_MAX_LAG           允许的最大延迟秒数，默认 5
+    REPLICA_CHECK_INTERVAL    延迟检查间隔秒数，默认 5
+    REPLICA_RETRY_AFTER       副本出错后暂停使用的秒数，默认 30
+    REPLICA_STICKY_SECONDS    写入后读主库的秒数，默认 REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL
+    REPLICA_LAG_QUERY         自定义延迟查询（返回秒数），默认按数据库类型：
+                              MySQL 读 SHOW REPLICA STATUS，PostgreSQL 读 pg_last_xact_replay_timestamp()，
+                              其他（如本地测试用的 sqlite）只检查连通性
+"""
+import itertools
+import os
+import threading
+import time
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+
+from db_config import engine_options, pool_stats
+
+REPLICA_BIND_PREFIX = 'replica_'
+STICKY_SESSION_KEY = 'db_primary_until'
+
+
+def configure_replicas(config):
+    """把副本加入 SQLALCHEMY_BINDS，需在创建 SQLAlchemy 之前调用"""
+    urls = config.get('DATABASE_REPLICA_URLS', os.environ.get('DATABASE_REPLICA_URLS', ''))
+    if isinstance(urls, str):
+        urls = [url.strip() for url in urls.split(',') if url.strip()]
+    binds = config.setdefault('SQLALCHEMY_BINDS', {})
+    for index, url in enumerate(urls):
+        binds[f'{REPLICA_BIND_PREFIX}{index}'] = dict(engine_options(url, config), url=url)
+
+
+class ReplicaState:
+
+    def __init__(self, key):
+        self.key = key
+        self.lock = threading.RLock()
+        self.available = True
+        self.lag = None
+        self.next_check = 0
+        self.last_error = None
+        self.reads = 0
+        self.errors = 0
+
+
+class ReplicaRouter:
+
+    def __init__(self, db, max_lag=5, check_interval=5, retry_after=30, sticky_seconds=None, lag_query=None):
+        self.db = db
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.retry_after = retry_after
+        self.sticky_seconds = max_lag + check_interval if sticky_seconds is None else sticky_seconds
+        self.lag_query = lag_query
+        self.states = {}
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        self.primary_reads = 0
+        self.sticky_reads = 0
+
+    @classmethod
+    def from_config(cls, db, config):
+        def setting(name, default):
+            value = config.get(name, os.environ.get(name))
+            return default if value is None else float(value)
+        return cls(db,
+                   max_lag=setting('REPLICA_MAX_LAG', 5),
+                   check_interval=setting('REPLICA_CHECK_INTERVAL', 5),
+                   retry_after=setting('REPLICA_RETRY_AFTER', 30),
+                   sticky_seconds=setting('REPLICA_STICKY_SECONDS', None),
+                   lag_query=config.get('REPLICA_LAG_QUERY', os.environ.get('REPLICA_LAG_QUERY')))
+
+    def init_app(self, app):
+        app.extensions['replica_router'] = self
+        with app.app_context():
+            for key in self.db.engines:
+                if key is not None and key.startswith(REPLICA_BIND_PREFIX):
+                    self.states[key] = ReplicaState(key)
+                    sa.event.listen(self.db.engines[key], 'handle_error', self._on_error(key))
+
+        @app.after_request
+        def remember_write(response):
+            # 本次请求提交过写入，之后一段时间内该会话的读请求走主库
+            if g.get('db_wrote') and session.get('user_id'):
+                until = time.time() + self.sticky_seconds
+                if until - session.get(STICKY_SESSION_KEY, 0) > 1:
+                    session[STICKY_SESSION_KEY] = until
+            return response
+
+    def _count(self, name, state=None):
+        with self._lock:
+            target = state if state is not None else self
+            setattr(target, name, getattr(target, name) + 1)
+
+    def _on_error(self, key):
+        def handle_error(context):
+            if context.is_disconnect or isinstance(context.original_exception, sa.exc.OperationalError):
+                self.mark_down(key, context.original_exception)
+        return handle_error
+
+    def mark_down(self, key, error=None):
+        state = self.states[key]
+        with state.lock:
+            state.available = False
+            state.last_error = str(error) if error is not None else None
+            state.next_check = time.monotonic() + self.retry_after
+        self._count('errors', state)
+
+    def measure_lag(self, connection):
+        if self.lag_query:
+            return float(connection.exec_driver_sql(self.lag_query).scalar() or 0)
+        dialect = connection.dialect.name
+        if dialect == 'mysql':
+            try:
+                row = connection.exec_driver_sql('SHOW REPLICA STATUS').mappings().first()
+            except sa.exc.DBAPIError:
+                row = connection.exec_driver_sql('SHOW SLAVE STATUS').mappings().first()
+            if row is None:
+                # 未配置复制（例如本地用两个独立实例测试）
+                return 0
+            lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+            # 复制线程停止时为 NULL
+            return float('inf') if lag is None else float(lag)
+        if dialect == 'postgresql':
+            return float(connection.exec_driver_sql(
+                'SELECT CASE WHEN pg_is_in_recovery() '
+                'THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) '
+                'ELSE 0 END').scalar())
+        connection.exec_driver_sql('SELECT 1')
+        return 0
+
+    def _check(self, state, engine):
+        """到期时检查副本延迟，同一时间只有一个线程检查，其他线程沿用上次结果"""
+        if time.monotonic() < state.next_check or not state.lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() < state.next_check:
+                return
+            try:
+                with engine.connect() as connection:
+                    state.lag = self.measure_lag(connection)
+                state.available = state.lag <= self.max_lag
+                state.last_error = None if state.available else f"lag {state.lag}s"
+                state.next_check = time.monotonic() + self.check_interval
+            except Exception as e:
+                print(f"Replica {state.key} unavailable: {e}")
+                state.available = False
+                state.last_error = str(e)
+                state.next_check = time.monotonic() + self.retry_after
+        finally:
+            state.lock.release()
+
+    def sticky(self):
+        return session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+    def choose(self):
+        """为当前请求选择一个可用副本，没有则返回 None"""
+        if 'db_replica' in g:
+            return g.db_replica
+        replica = None
+        if self.sticky():
+            self._count('sticky_reads')
+        else:
+            engines = self.db.engines
+            for state in self.states.values():
+                self._check(state, engines[state.key])
+            available = [key for key, state in self.states.items() if state.available]
+            if available:
+                replica = available[next(self._round_robin) % len(available)]
+                self._count('reads', self.states[replica])
+            else:
+                self._count('primary_reads')
+        g.db_replica = replica
+        return replica
+
+    def stats(self):
+        engines = self.db.engines
+        return {
+            'primary_reads': self.primary_reads,
+            'sticky_reads': self.sticky_reads,
+            'replicas': {
+                key: {
+                    'available': state.available,
+                    'lag': state.lag,
+                    'last_error': state.last_error,
+                    'reads': state.reads,
+                    'errors': state.errors,
+                    'pool': pool_stats(engines[key]),
+                }
+                for key, state in self.states.items()
+            },
+        }
+
+
+class RoutingSession(Session):
+    """只读请求中的 SELECT 发往副本，写入、flush 和其他请求发往主库"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not has_request_context():
+            return engine
+        if self._flushing or (clause is not None and not getattr(clause, 'is_select', False)):
+            self.info['wrote'] = True
+            return engine
+        if not g.get('db_read_only') or engine is not self._db.engines.get(None):
+            return engine
+        router = current_app.extensions.get('replica_router')
+        if router is None or not router.states:
+            return engine
+        replica = router.choose()
+        return self._db.engines[replica] if replica else engine
+
+
+@sa.event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(db_session):
+    if db_session.info.pop('wrote', False) and has_request_context():
+        g.db_wrote = True
+
+
+@sa.event.listens_for(RoutingSession, 'after_rollback')
+def _after_rollback(db_session):
+    db_session.info.pop('wrote', None)
+
+
+def read_only(f):
+    """标记只读接口；在副本上出错时暂停该副本，并在主库上重试"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.db_read_only = True
+        try:
+            return f(*args, **kwargs)
+        except sa.exc.DBAPIError as e:
+            replica = g.pop('db_replica', None)
+            if not replica:
+                raise
+            router = current_app.extensions['replica_router']
+            router.mark_down(replica, e)
+            router.db.session.rollback()
+            g.db_replica = None
+            return f(*args, **kwargs)
+        finally:
+            g.db_read_only = False
+    return decorated_function
+
+
+def replica_cache_ttl(ttl=None):
+    """当前请求从副本读过数据时，进程内缓存的有效期不超过允许的最大延迟"""
+    if has_request_context() and g.get('db_replica'):
+        max_lag = current_app.extensions['replica_router'].max_lag
+        return max_lag if ttl is None else min(ttl, max_lag)
+    return ttl
@@ -0,0 +1,305 @@
+"""
+按接口统计请求延迟、吞吐和错误，以 Prometheus 文本格式输出
+
+每个进程在内存中累计，后台线程定期把本进程的累计值整体写入共享 sqlite 文件（每个进程一行一个序列）；
+抓取 /metrics 时汇总所有进程的行，多个 worker 进程的数据不会互相覆盖。
+- 计数器和直方图为进程启动以来的累计值，进程退出后的数据会并入 retired 行继续计入总数
+- 在途请求数（gauge）只汇总最近仍在刷新的进程
+- 延迟为视图返回响应的耗时，流式响应（文件下载、导出）不包含发送内容的时间
+- 业务状态码取 JSON 响应中的 code 字段（接口出错时 HTTP 状态往往仍是 200）
+
+配置项（app.config 或同名环境变量）：
+    METRICS_BACKEND           'sqlite'（默认）或 'memory'（单进程）
+    METRICS_SQLITE_PATH       sqlite 文件路径
+    METRICS_FLUSH_INTERVAL    写入共享文件的间隔秒数，默认 5
+    METRICS_RETIRE_AFTER      进程超过该秒数未刷新即视为退出，默认 600
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from flask import g, request
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000, 100000000)
+# 只解析不超过该大小的 JSON 响应来读取业务状态码
+CODE_PARSE_LIMIT = 64 * 1024
+RETIRED_PROCESS = 'retired'
+
+METRICS = {
+    'http_requests_total': ('counter', "Requests by endpoint, method, HTTP status and response code"),
+    'http_request_errors_total': ('counter', "Requests that failed with HTTP status or response code >= 500"),
+    'http_requests_in_flight': ('gauge', "Requests currently being handled"),
+    'http_request_duration_seconds': ('histogram', "Time spent in the view until the response was returned"),
+    'http_response_size_bytes': ('histogram', "Response body size when known"),
+}
+HISTOGRAM_BUCKETS = {
+    'http_request_duration_seconds': LATENCY_BUCKETS,
+    'http_response_size_bytes': SIZE_BUCKETS,
+}
+
+
+def labels_key(labels):
+    return json.dumps(sorted(labels.items()))
+
+
+class Registry:
+    """单个进程内的累计值，键为 (指标名, 标签 JSON)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels_key(labels))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAM_BUCKETS[name]
+        key = (name, labels_key(labels))
+        with self._lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = self.values[key] = {'buckets': [0] * len(buckets), 'sum': 0, 'count': 0}
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['buckets'][index] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def rows(self):
+        with self._lock:
+            return [(name, labels, json.dumps(value)) for (name, labels), value in self.values.items()]
+
+
+def merge(total, value):
+    """累加同一序列的两个值（数字或直方图）"""
+    if total is None:
+        return value
+    if isinstance(value, dict):
+        return {
+            'buckets': [a + b for a, b in zip(total['buckets'], value['buckets'])],
+            'sum': total['sum'] + value['sum'],
+            'count': total['count'] + value['count'],
+        }
+    return total + value
+
+
+class MemoryMetricsStore:
+    """只保存当前进程的数据，用于单进程调试"""
+
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def write(self, process, rows, now):
+        with self._lock:
+            self._rows = {(name, labels): value for name, labels, value in rows}
+
+    def collect(self):
+        now = time.time()
+        with self._lock:
+            return [(name, labels, value, now) for (name, labels), value in self._rows.items()]
+
+    def retire(self, before):
+        pass
+
+
+class SQLiteMetricsStore:
+    """多进程共享的累计值，每个线程一个连接"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('CREATE TABLE IF NOT EXISTS samples ('
+                     'process TEXT NOT NULL, metric TEXT NOT NULL, labels TEXT NOT NULL, '
+                     'value TEXT NOT NULL, updated REAL NOT NULL, PRIMARY KEY (process, metric, labels))')
+        conn.execute('CREATE INDEX IF NOT EXISTS samples_updated ON samples (updated)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def write(self, process, rows, now):
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN')
+            conn.executemany('INSERT OR REPLACE INTO samples (process, metric, labels, value, updated) '
+                             'VALUES (?, ?, ?, ?, ?)', [(process, name, labels, value, now) for name, labels, value in rows])
+
+    def collect(self):
+        return self._conn().execute('SELECT metric, labels, value, updated FROM samples').fetchall()
+
+    def retire(self, before):
+        """把已退出进程的计数器和直方图并入 retired 行，丢弃它们的 gauge"""
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            stale = conn.execute('SELECT process, metric, labels, value FROM samples '
+                                 'WHERE updated < ? AND process != ?', (before, RETIRED_PROCESS)).fetchall()
+            if not stale:
+                return
+            merged = {}
+            for process, metric, labels, value in stale:
+                if METRICS.get(metric, ('gauge',))[0] == 'gauge':
+                    continue
+                merged[(metric, labels)] = merge(merged.get((metric, labels)), json.loads(value))
+            for (metric, labels), value in merged.items():
+                row = conn.execute('SELECT value FROM samples WHERE process = ? AND metric = ? AND labels = ?',
+                                   (RETIRED_PROCESS, metric, labels)).fetchone()
+                if row is not None:
+                    value = merge(json.loads(row[0]), value)
+                conn.execute('INSERT OR REPLACE INTO samples (process, metric, labels, value, updated) '
+                             'VALUES (?, ?, ?, ?, ?)', (RETIRED_PROCESS, metric, labels, json.dumps(value), time.time()))
+            conn.execute('DELETE FROM samples WHERE updated < ? AND process != ?', (before, RETIRED_PROCESS))
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in items) + '}'
+
+
+def format_number(value):
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class RequestMetrics:
+
+    def __init__(self, store, flush_interval=5, retire_after=600):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.retire_after = retire_after
+        self.registry = Registry()
+        self.pid = None
+        self.process = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        def setting(name, default):
+            return config.get(name, os.environ.get(name, default))
+        backend = setting('METRICS_BACKEND', 'sqlite')
+        if backend == 'sqlite':
+            store = SQLiteMetricsStore(config['METRICS_SQLITE_PATH'])
+        elif backend == 'memory':
+            store = MemoryMetricsStore()
+        else:
+            raise ValueError(f"unknown METRICS_BACKEND: {backend}")
+        return cls(store,
+                   flush_interval=float(setting('METRICS_FLUSH_INTERVAL', 5)),
+                   retire_after=float(setting('METRICS_RETIRE_AFTER', 600)))
+
+    def _ensure_process(self):
+        """每个进程使用自己的累计值和刷新线程（fork 出的 worker 不继承父进程的数据）"""
+        if self.pid == os.getpid():
+            return
+        with self._lock:
+            if self.pid == os.getpid():
+                return
+            self.registry = Registry()
+            self.process = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            self.pid = os.getpid()
+            if self.flush_interval:
+                thread = threading.Thread(target=self._run, name='metrics-flusher', daemon=True)
+                thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing metrics: {e}")
+
+    def flush(self):
+        now = time.time()
+        self.store.write(self.process, self.registry.rows(), now)
+        self.store.retire(now - self.retire_after)
+
+    def init_app(self, app):
+        @app.before_request
+        def start_request():
+            self._ensure_process()
+            g.metrics_start = time.perf_counter()
+            g.metrics_endpoint = request.endpoint or 'unmatched'
+            self.registry.inc('http_requests_in_flight', {'endpoint': g.metrics_endpoint})
+
+        @app.after_request
+        def record_request(response):
+            start = g.pop('metrics_start', None)
+            if start is None:
+                return response
+            endpoint = g.metrics_endpoint
+            code = None
+            if response.is_json and not response.is_streamed and (response.content_length or 0) <= CODE_PARSE_LIMIT:
+                payload = response.get_json(silent=True)
+                if isinstance(payload, dict) and isinstance(payload.get('code'), int):
+                    code = payload['code']
+            labels = {'endpoint': endpoint, 'method': request.method}
+            self.registry.inc('http_requests_total',
+                              dict(labels, status=response.status_code, code='' if code is None else code))
+            if response.status_code >= 500 or (code is not None and code >= 500):
+                self.registry.inc('http_request_errors_total', labels)
+            self.registry.observe('http_request_duration_seconds', labels, time.perf_counter() - start)
+            size = response.calculate_content_length()
+            if size is None:
+                size = response.content_length
+            if size is not None:
+                self.registry.observe('http_response_size_bytes', labels, size)
+            return response
+
+        @app.teardown_request
+        def finish_request(exc):
+            endpoint = g.pop('metrics_endpoint', None)
+            if endpoint is not None:
+                self.registry.inc('http_requests_in_flight', {'endpoint': endpoint}, -1)
+
+    def render(self):
+        """汇总所有进程并生成 Prometheus 文本"""
+        self._ensure_process()
+        now = time.time()
+        self.store.write(self.process, self.registry.rows(), now)
+        fresh_after = now - max(self.flush_interval * 3, 15)
+
+        totals = {}
+        for metric, labels, value, updated in self.store.collect():
+            kind = METRICS.get(metric, ('gauge',))[0]
+            if kind == 'gauge' and updated < fresh_after:
+                continue
+            totals[(metric, labels)] = merge(totals.get((metric, labels)), json.loads(value))
+
+        lines = []
+        for metric, (kind, help_text) in METRICS.items():
+            series = sorted((labels, value) for (name, labels), value in totals.items() if name == metric)
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} {kind}')
+            for labels, value in series:
+                labels = json.loads(labels)
+                if kind != 'histogram':
+                    lines.append(f'{metric}{format_labels(labels)} {format_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(HISTOGRAM_BUCKETS[metric], value['buckets']):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{format_labels(labels, ("le", bound))} {cumulative}')
+                lines.append(f'{metric}_bucket{format_labels(labels, ("le", "+Inf"))} {value["count"]}')
+                lines.append(f'{metric}_sum{format_labels(labels)} {format_number(value["sum"])}')
+                lines.append(f'{metric}_count{format_labels(labels)} {value["count"]}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,259 @@
+"""
+数据库版本化迁移
+
+    python migrations.py upgrade     # 执行所有未应用的迁移
+    python migrations.py current     # 查看当前版本
+    python migrations.py check       # 用 EXPLAIN 检查热点查询是否走索引
+
+新增迁移时在 MIGRATIONS 末尾追加 (版本号, 说明, 函数)，版本号递增。
+迁移中直接写出要创建的列和索引，不要引用 model.py 的定义：已部署的数据库要按顺序经过每个迁移，
+模型当前的定义可能依赖之后的迁移才加上的列。
+"""
+import sys
+
+from model import app, db, Student, Teacher, VisionPro, TeacherToClass, StudentToClass, TeacherToTemplate, StudentToTemplate, Template, TemplateToQuestionFile, TemplateToAnswerFile, QuestionFile, AnswerFile
+
+# 记录当前数据库的迁移版本，独立于业务模型
+version_metadata = db.MetaData()
+schema_version = db.Table(
+    'schema_version', version_metadata,
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('description', db.String(255), nullable=False),
+    db.Column('applied_at', db.TIMESTAMP, server_default=db.text('CURRENT_TIMESTAMP')),
+)
+
+
+def create_index(conn, table_name, name, columns, unique=False):
+    """
+    按名称创建索引，已存在时跳过。
+    索引和列的定义写死在各个迁移里，不读取 model.py：模型以后新增的索引或列可能依赖更晚的迁移
+    """
+    table = db.Table(table_name, db.MetaData(), *[db.Column(column, db.Integer) for column in columns])
+    db.Index(name, *[table.c[column] for column in columns], unique=unique).create(conn, checkfirst=True)
+
+
+def add_column(conn, table_name, column):
+    """为已有表补充列，列已存在时跳过"""
+    existing = {info['name'] for info in db.inspect(conn).get_columns(table_name)}
+    if column.name in existing:
+        return False
+    db.Table(table_name, db.MetaData(), column)
+    ddl = db.schema.CreateColumn(column).compile(dialect=conn.dialect)
+    conn.exec_driver_sql(f"ALTER TABLE {conn.dialect.identifier_preparer.quote(table_name)} ADD COLUMN {ddl}")
+    return True
+
+
+def check_duplicates(conn, table_name, columns):
+    """创建唯一索引前检查重复数据，有重复则中止迁移"""
+    table = db.table(table_name, *[db.column(name) for name in columns])
+    cols = [table.c[name] for name in columns]
+    duplicates = conn.execute(
+        db.select(*cols, db.func.count().label('n')).group_by(*cols).having(db.func.count() > 1)
+    ).all()
+    if duplicates:
+        raise RuntimeError(f"{table_name} has {len(duplicates)} duplicated {tuple(columns)} groups, "
+                           f"e.g. {tuple(duplicates[0])[:-1]}; clean them up before upgrading")
+
+
+# 迁移 1 创建的索引：(表, 唯一索引列, 反向查询的普通索引列)
+ASSOCIATION_INDEXES = [
+    ('teacher_class', ('tid', 'cid'), 'cid'),
+    ('student_class', ('cid', 'sid'), 'sid'),
+    ('teacher_template', ('tid', 'temid'), 'temid'),
+    ('student_template', ('temid', 'sid'), 'sid'),
+    ('template_to_question_file', ('temid', 'qid'), 'qid'),
+    ('template_to_answer_file', ('temid', 'aid'), 'aid'),
+]
+
+
+def add_association_indexes(conn):
+    """为关联表添加与访问路径匹配的复合/唯一索引，并为姓名列加索引"""
+    for table_name, unique_columns, _ in ASSOCIATION_INDEXES:
+        check_duplicates(conn, table_name, unique_columns)
+    for table_name, unique_columns, column in ASSOCIATION_INDEXES:
+        create_index(conn, table_name, f"uq_{table_name}_{'_'.join(unique_columns)}", unique_columns, unique=True)
+        create_index(conn, table_name, f"ix_{table_name}_{column}", [column])
+    create_index(conn, 'student', 'ix_student_name', ['name'])
+    create_index(conn, 'teacher', 'ix_teacher_name', ['name'])
+
+
+def match_answer_question(answer_name, temid, questions):
+    """根据文件名推断答案对应的 (学生, 问题)，questions 为 问题文件名 -> qid"""
+    # 新格式: "{sid}_{temid}_{问题名}"，问题文件名为 "{temid}_{问题名}"
+    prefix, _, rest = answer_name.partition('_')
+    if prefix.isdigit() and rest in questions:
+        return int(prefix), questions[rest]
+    # 旧格式，优先匹配最长的问题文件名
+    template_prefix = str(temid)
+    for question_name, qid in sorted(questions.items(), key=lambda item: -len(item[0])):
+        # 旧 create_template: "{temid}{sid}{问题名}"，问题文件名为 "{temid}{问题名}"
+        if question_name.startswith(template_prefix) and answer_name.startswith(template_prefix):
+            suffix = question_name[len(template_prefix):]
+            middle = answer_name[len(template_prefix):-len(suffix) or None]
+            if suffix and answer_name.endswith(suffix) and middle.isdigit():
+                return int(middle), qid
+        # 旧答案查询: "{sid}{问题文件名}"
+        prefix = answer_name[:-len(question_name)]
+        if answer_name.endswith(question_name) and prefix.isdigit():
+            return int(prefix), qid
+    return None
+
+
+def add_answer_owner_columns(conn):
+    """为 answer_file 增加 sid/qid 列及 (qid, sid) 唯一索引，并按文件名回填已有数据"""
+    add_column(conn, 'answer_file', db.Column('sid', db.Integer))
+    add_column(conn, 'answer_file', db.Column('qid', db.Integer))
+
+    question_file = db.table('question_file', db.column('id'), db.column('questionFileName'))
+    answer_file = db.table('answer_file', db.column('id'), db.column('answerFileName'),
+                           db.column('sid'), db.column('qid'))
+    template_question = db.table('template_to_question_file', db.column('temid'), db.column('qid'))
+    template_answer = db.table('template_to_answer_file', db.column('temid'), db.column('aid'))
+
+    questions = {}
+    for temid, qid, name in conn.execute(
+            db.select(template_question.c.temid, question_file.c.id, question_file.c.questionFileName)
+            .join(question_file, question_file.c.id == template_question.c.qid)):
+        questions.setdefault(temid, {})[name] = qid
+
+    updates = []
+    seen = set()
+    answers = conn.execute(
+        db.select(template_answer.c.temid, answer_file.c.id, answer_file.c.answerFileName)
+        .join(answer_file, answer_file.c.id == template_answer.c.aid)
+        .where(answer_file.c.qid.is_(None))
+    ).all()
+    for temid, aid, name in answers:
+        match = match_answer_question(name, temid, questions.get(temid, {}))
+        # 无法识别或重复的旧数据保持为空
+        if match and match not in seen:
+            seen.add(match)
+            updates.append({'b_id': aid, 'b_sid': match[0], 'b_qid': match[1]})
+
+    statement = (answer_file.update()
+                 .where(answer_file.c.id == db.bindparam('b_id'))
+                 .values(sid=db.bindparam('b_sid'), qid=db.bindparam('b_qid')))
+    for i in range(0, len(updates), 1000):
+        conn.execute(statement, updates[i:i + 1000])
+
+    create_index(conn, 'answer_file', 'uq_answer_file_qid_sid', ['qid', 'sid'], unique=True)
+
+
+def add_visionpro_teacher_index(conn):
+    """为 visionpro.teacher_id 加索引，设备列表按老师过滤"""
+    create_index(conn, 'visionpro', 'ix_visionpro_teacher_id', ['teacher_id'])
+
+
+def add_file_hash_columns(conn):
+    """为 question_file/answer_file 增加内容哈希列，用于去重存储的引用计数；已有文件不回填"""
+    for table_name in ['question_file', 'answer_file']:
+        add_column(conn, table_name, db.Column('sha256', db.String(64)))
+        create_index(conn, table_name, f'ix_{table_name}_sha256', ['sha256'])
+
+
+MIGRATIONS = [
+    (1, 'association table indexes', add_association_indexes),
+    (2, 'answer file owner columns', add_answer_owner_columns),
+    (3, 'visionpro teacher index', add_visionpro_teacher_index),
+    (4, 'file content hash columns', add_file_hash_columns),
+]
+
+
+def current_version(conn):
+    version_metadata.create_all(conn)
+    return conn.execute(db.select(db.func.max(schema_version.c.version))).scalar() or 0
+
+
+def upgrade():
+    """依次执行所有未应用的迁移，每个迁移一个事务"""
+    db.create_all()
+    applied = []
+    with db.engine.connect() as conn:
+        version = current_version(conn)
+        conn.commit()
+        for number, description, migrate in MIGRATIONS:
+            if number <= version:
+                continue
+            with conn.begin():
+                migrate(conn)
+                conn.execute(schema_version.insert().values(version=number, description=description))
+            applied.append(number)
+    return applied
+
+
+# 热点查询（说明, 语句），与 api.py 中的访问路径保持一致
+def hot_queries():
+    return [
+        ('teacher class ownership', db.select(TeacherToClass.id).where(TeacherToClass.tid == 1, TeacherToClass.cid == 1)),
+        ('teacher classes', db.select(TeacherToClass.cid).where(TeacherToClass.tid == 1)),
+        ('class roster', db.select(StudentToClass.sid).where(StudentToClass.cid == 1)),
+        ('student in class', db.select(StudentToClass.id).where(StudentToClass.sid == 1, StudentToClass.cid == 1)),
+        ('student classes', db.select(StudentToClass.cid).where(StudentToClass.sid == 1)),
+        ('template assignment', db.select(StudentToTemplate.id).where(StudentToTemplate.temid == 1, StudentToTemplate.sid == 1)),
+        ('template students', db.select(StudentToTemplate.sid).where(StudentToTemplate.temid == 1)),
+        ('template questions', db.select(TemplateToQuestionFile.qid).where(TemplateToQuestionFile.temid == 1)),
+        ('template answers', db.select(TemplateToAnswerFile.aid).where(TemplateToAnswerFile.temid == 1)),
+        ('template teachers', db.select(TeacherToTemplate.id).where(TeacherToTemplate.temid == 1)),
+        ('student answers', db.select(QuestionFile.id, AnswerFile.id)
+            .select_from(TemplateToQuestionFile)
+            .join(QuestionFile, QuestionFile.id == TemplateToQuestionFile.qid)
+            .outerjoin(AnswerFile, db.and_(AnswerFile.qid == QuestionFile.id, AnswerFile.sid == 1))
+            .where(TemplateToQuestionFile.temid == 1)),
+        ('teacher devices', db.select(VisionPro.vp_id).where(VisionPro.teacher_id == 1)),
+        ('student name', db.select(Student.sid).where(Student.name == 'name')),
+        ('teacher name', db.select(Teacher.tid).where(Teacher.name == 'name')),
+        ('teacher dashboard', db.select(Template.temid, db.func.count(StudentToTemplate.id))
+            .select_from(TeacherToTemplate)
+            .join(Template, Template.temid == TeacherToTemplate.temid)
+            .outerjoin(StudentToTemplate, StudentToTemplate.temid == Template.temid)
+            .where(TeacherToTemplate.tid == 1)
+            .group_by(Template.temid)),
+    ]
+
+
+def full_scans(conn, statement):
+    """返回执行计划中的全表扫描，sqlite 与 mysql 分别解析"""
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+    if conn.dialect.name == 'sqlite':
+        rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql).all()
+        # "SCAN t" 为全表扫描，"SEARCH t USING INDEX" 为索引查找
+        return [row[3] for row in rows if row[3].startswith('SCAN') or 'AUTOMATIC' in row[3]]
+    rows = conn.exec_driver_sql('EXPLAIN ' + sql).mappings().all()
+    return [f"{row['table']}: type=ALL" for row in rows if row['type'] == 'ALL']
+
+
+def check():
+    """对热点查询执行 EXPLAIN，返回存在全表扫描的查询"""
+    failures = []
+    with db.engine.connect() as conn:
+        for name, statement in hot_queries():
+            scans = full_scans(conn, statement)
+            if scans:
+                failures.append((name, scans))
+    return failures
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'upgrade'
+    with app.app_context():
+        if command == 'upgrade':
+            applied = upgrade()
+            print(f"applied migrations: {applied}" if applied else "database is up to date")
+        elif command == 'current':
+            with db.engine.connect() as conn:
+                print(f"current version: {current_version(conn)}")
+                conn.commit()
+        elif command == 'check':
+            failures = check()
+            for name, scans in failures:
+                print(f"FULL SCAN in {name}: {'; '.join(scans)}")
+            if failures:
+                sys.exit(1)
+            print("all hot queries use indexes")
+        else:
+            print(__doc__)
+            sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+密码哈希与校验
+
+pbkdf2 是纯 CPU 计算，放到有界进程池里执行，避免阻塞请求线程。
+
+配置项（app.config 或同名环境变量）：
+    PASSWORD_HASH_METHOD         werkzeug 哈希方法，默认 'pbkdf2:sha256'，可写成 'pbkdf2:sha256:600000' 指定迭代次数
+    PASSWORD_POOL_SIZE           进程数，默认 CPU 核数，0 表示在当前线程内计算
+    PASSWORD_POOL_MAX_PENDING    排队上限，超过后等待 PASSWORD_POOL_TIMEOUT 秒仍无空位则拒绝
+    PASSWORD_POOL_TIMEOUT        等待排队位置和计算结果的超时时间（秒），默认 10
+    PASSWORD_POOL_START_METHOD   进程启动方式（fork / spawn / forkserver），默认 forkserver，不支持时用 spawn；
+                                 服务进程里已有后台线程，fork 出的子进程可能继承被其他线程持有的锁
+"""
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import cached_property
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+
+
+class PasswordHasherBusy(Exception):
+    """进程池排队已满或等待结果超时"""
+
+
+def default_start_method():
+    return 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class PasswordHasher:
+    """有界进程池上的密码哈希/校验，并记录排队深度和耗时"""
+
+    def __init__(self, method=PASSWORD_HASH_METHOD, pool_size=None, max_pending=64, timeout=10, start_method=None):
+        self.method = method
+        self.pool_size = (os.cpu_count() or 1) if pool_size is None else pool_size
+        self.timeout = timeout
+        self.start_method = start_method or default_start_method()
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max(self.pool_size, 1) + max_pending)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._latencies = deque(maxlen=1024)
+
+    @classmethod
+    def from_config(cls, config):
+        def get(name, default, cast=str):
+            value = config.get(name, os.environ.get(name))
+            return default if value is None else cast(value)
+        return cls(
+            method=get('PASSWORD_HASH_METHOD', PASSWORD_HASH_METHOD),
+            pool_size=get('PASSWORD_POOL_SIZE', None, int),
+            max_pending=get('PASSWORD_POOL_MAX_PENDING', 64, int),
+            timeout=get('PASSWORD_POOL_TIMEOUT', 10, float),
+            start_method=get('PASSWORD_POOL_START_METHOD', None),
+        )
+
+    def _get_executor(self):
+        # 首次使用时再创建进程池
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context(self.start_method)
+                if self.start_method == 'forkserver':
+                    # forkserver 只预加载哈希函数所在模块，不导入主模块
+                    context.set_forkserver_preload(['werkzeug.security'])
+                self._executor = ProcessPoolExecutor(max_workers=self.pool_size, mp_context=context)
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._rejected += 1
+            raise PasswordHasherBusy()
+        start = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+        if self.pool_size == 0:
+            try:
+                return fn(*args)
+            finally:
+                self._finish(start, {'returned': True})
+
+        call = {'returned': True}
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._finish(start, {'returned': False})
+            raise
+        # 进程池中已开始的任务无法取消，任务真正结束时才释放排队位置，保证同时执行和排队的任务不超过上限
+        future.add_done_callback(lambda _: self._finish(start, call))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                call['returned'] = False
+                self._timed_out += 1
+            future.cancel()
+            raise PasswordHasherBusy()
+
+    def _finish(self, start, call):
+        """任务结束：释放排队位置；调用方已超时返回的任务不计入完成数和耗时"""
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._in_flight -= 1
+            if call['returned']:
+                self._completed += 1
+                self._latencies.append(elapsed)
+        self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        return self._run(check_password_hash, stored_hash, password)
+
+    @cached_property
+    def method_prefix(self):
+        """
+        当前配置生成的哈希的 "方法:参数" 前缀，如 'pbkdf2:sha256:1000000'、'scrypt:32768:8:1'；
+        由 werkzeug 补全省略的哈希名和参数，首次使用时生成一个一次性哈希得到
+        """
+        return generate_password_hash('', self.method).split('$', 1)[0]
+
+    def needs_rehash(self, stored_hash):
+        """已存储哈希的方法或参数与当前配置不同"""
+        return stored_hash.split('$', 1)[0] != self.method_prefix
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            in_flight = self._in_flight
+            completed = self._completed
+            rejected = self._rejected
+            timed_out = self._timed_out
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        return {
+            'method': self.method,
+            'pool_size': self.pool_size,
+            'in_flight': in_flight,
+            'queue_depth': max(0, in_flight - self.pool_size),
+            'completed': completed,
+            'rejected': rejected,
+            'timed_out': timed_out,
+            'latency_ms': {
+                'mean': statistics.fmean(latencies) * 1000 if latencies else None,
+                'p50': percentile(0.5),
+                'p95': percentile(0.95),
+                'max': latencies[-1] * 1000 if latencies else None,
+            },
+        }
@@ -0,0 +1,427 @@
+"""
+上传目录与数据库的对账清理
+
+双向查找孤儿：
+- 记录：没有关联到任何模板的 QuestionFile/AnswerFile，删除后其文件按孤儿文件处理
+- 文件：没有记录指向的上传文件、没有记录引用且没有其他硬链接的 blob、
+  超时未完成的分块上传和临时文件，以及留下的空目录
+
+数据库按主键分批查询，每批单独提交，不长时间持有表锁；文件系统逐目录流式遍历，
+每批文件用一次 IN 查询核对。孤儿文件默认移到隔离目录，保留 quarantine_days 天后才真正删除，
+所有删除/移动按 rate（次/秒）限速。最近 grace 秒内写入的文件不处理，避免与进行中的上传竞争。
+处理文件前抽查最新的若干条记录：路径不在上传目录下（如部署目录变更）时跳过该目录，
+抽查到的记录文件已不存在时列在报告的 missing_files 中。
+
+    python reaper.py                 # 执行一次并打印报告
+    python reaper.py --dry-run       # 只统计不处理
+    python reaper.py --delete        # 直接删除而不是隔离
+
+配置项（环境变量，见 api.py）：
+    REAPER_INTERVAL          后台执行间隔秒数，默认 0 表示不启动后台线程
+    REAPER_MODE              'quarantine'（默认）或 'delete'
+    REAPER_GRACE             新文件保护期秒数，默认 3600
+    REAPER_UPLOAD_MAX_AGE    分块上传无进展多久后清理，默认 86400
+    REAPER_QUARANTINE_DAYS   隔离文件保留天数，默认 7
+    REAPER_RATE              每秒最多处理的文件数，默认 50，0 表示不限速
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+
+from blob_store import is_sha256
+from model import db, QuestionFile, AnswerFile, TemplateToQuestionFile, TemplateToAnswerFile
+from uploads import UPLOAD_ID_PATTERN
+
+try:
+    import fcntl
+except ImportError:  # Windows 上只做进程内互斥
+    fcntl = None
+
+QUARANTINE_DATE_FORMAT = '%Y%m%d'
+
+
+def iter_files(root, skip=()):
+    """逐目录流式遍历 root 下的普通文件，返回 DirEntry"""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.path in skip:
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+def changed_at(stat):
+    # 建立硬链接只改变 ctime，两者取较新的
+    return max(stat.st_mtime, stat.st_ctime)
+
+
+class Reaper:
+
+    def __init__(self, app, upload_folder, question_folder, answer_folder, blob_store, chunked_uploads,
+                 mode='quarantine', grace=3600, upload_max_age=86400, quarantine_days=7,
+                 batch_size=500, rate=50, dry_run=False, layout_sample_size=50):
+        self.app = app
+        self.upload_folder = upload_folder
+        self.question_folder = question_folder
+        self.answer_folder = answer_folder
+        self.blob_store = blob_store
+        self.chunked_uploads = chunked_uploads
+        self.quarantine_folder = os.path.join(upload_folder, '.quarantine')
+        self.lock_path = os.path.join(upload_folder, '.reaper.lock')
+        self.mode = mode
+        self.grace = grace
+        self.upload_max_age = upload_max_age
+        self.quarantine_days = quarantine_days
+        self.batch_size = batch_size
+        self.rate = rate
+        self.dry_run = dry_run
+        self.layout_sample_size = layout_sample_size
+        self.last_report = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, app, upload_folder, question_folder, answer_folder, blob_store, chunked_uploads):
+        env = os.environ.get
+        return cls(app, upload_folder, question_folder, answer_folder, blob_store, chunked_uploads,
+                   mode=env('REAPER_MODE', 'quarantine'),
+                   grace=float(env('REAPER_GRACE', 3600)),
+                   upload_max_age=float(env('REAPER_UPLOAD_MAX_AGE', 86400)),
+                   quarantine_days=int(env('REAPER_QUARANTINE_DAYS', 7)),
+                   rate=float(env('REAPER_RATE', 50)))
+
+    def _throttle(self):
+        if self.rate:
+            time.sleep(1.0 / self.rate)
+
+    # 入口
+    def run(self):
+        """执行一轮对账，另一个线程或进程正在执行时返回 None"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        lock_file = None
+        try:
+            if fcntl is not None:
+                lock_file = open(self.lock_path, 'w')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return None
+
+            started = time.time()
+            report = {
+                'started_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'dry_run': self.dry_run,
+                'mode': self.mode,
+                'orphan_rows': 0,
+                'files_scanned': 0,
+                'orphan_files': 0,
+                'orphan_blobs': 0,
+                'orphan_bytes': 0,
+                'stale_uploads': 0,
+                'stale_temp_files': 0,
+                'quarantined': 0,
+                'quarantine_purged': 0,
+                'empty_dirs': 0,
+                'bytes_reclaimed': 0,
+                'skipped_folders': [],
+                'missing_files': [],
+            }
+            with self.app.app_context():
+                try:
+                    self._reap_rows(AnswerFile, [TemplateToAnswerFile.aid], report)
+                    self._reap_rows(QuestionFile, [TemplateToQuestionFile.qid, AnswerFile.qid], report)
+                    self._reap_files(self.question_folder, QuestionFile, QuestionFile.questionFilePath, report)
+                    self._reap_files(self.answer_folder, AnswerFile, AnswerFile.answerFilePath, report)
+                    self._reap_blobs(report)
+                finally:
+                    db.session.remove()
+            self._reap_uploads(report)
+            self._purge_quarantine(report)
+            if not self.dry_run:
+                for folder in [self.question_folder, self.answer_folder, self.blob_store.root]:
+                    report['empty_dirs'] += self._prune_empty_dirs(folder)
+            report['duration'] = round(time.time() - started, 3)
+            self.last_report = report
+            return report
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+            self._lock.release()
+
+    # 数据库 -> 文件
+    def _reap_rows(self, model, reference_columns, report):
+        """删除没有被任何关联表引用的文件记录"""
+        last_id = 0
+        while True:
+            ids = [row_id for (row_id,) in db.session.execute(
+                db.select(model.id).where(model.id > last_id).order_by(model.id).limit(self.batch_size))]
+            if not ids:
+                return
+            last_id = ids[-1]
+            referenced = set()
+            for column in reference_columns:
+                referenced.update(row_id for (row_id,) in db.session.execute(
+                    db.select(column).where(column.in_(ids)).distinct()))
+            db.session.commit()
+
+            orphans = [row_id for row_id in ids if row_id not in referenced]
+            if not orphans:
+                continue
+            report['orphan_rows'] += len(orphans)
+            if self.dry_run:
+                continue
+            # 删除时再次确认没有引用，避免与并发写入竞争
+            statement = db.delete(model).where(model.id.in_(orphans))
+            for column in reference_columns:
+                statement = statement.where(~db.exists().where(column == model.id))
+            db.session.execute(statement)
+            db.session.commit()
+
+    # 文件 -> 数据库
+    def _reap_files(self, folder, model, path_column, report):
+        # 记录中的路径不在该目录下（如部署目录变更、路径写法不同）时不处理，避免把有记录的文件当成孤儿
+        if self._layout_mismatch(folder, model, path_column, report):
+            report['skipped_folders'].append(folder)
+            return
+        batch = []
+        for entry in iter_files(folder):
+            batch.append(entry)
+            if len(batch) >= self.batch_size:
+                self._check_files(batch, path_column, report)
+                batch = []
+        if batch:
+            self._check_files(batch, path_column, report)
+
+    def _layout_mismatch(self, folder, model, path_column, report):
+        """
+        抽查最新的 layout_sample_size 条已上传内容（sha256 非空）的记录，有路径不是 folder 下
+        按遍历写法拼出的路径时返回 True；路径对得上但文件不存在的记入 missing_files，不影响清理
+        """
+        rows = db.session.execute(
+            db.select(path_column).where(model.sha256.isnot(None))
+            .order_by(model.id.desc()).limit(self.layout_sample_size)).all()
+        db.session.commit()
+        mismatch = False
+        for (path,) in rows:
+            relative = os.path.relpath(path, folder)
+            if relative.startswith('..') or os.path.join(folder, relative) != path:
+                mismatch = True
+            elif not os.path.isfile(path):
+                report['missing_files'].append(path)
+        return mismatch
+
+    def _check_files(self, batch, path_column, report):
+        known = {path for (path,) in db.session.execute(
+            db.select(path_column).where(path_column.in_([entry.path for entry in batch])))}
+        db.session.commit()
+        now = time.time()
+        for entry in batch:
+            report['files_scanned'] += 1
+            if entry.path in known:
+                continue
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if now - changed_at(stat) < self.grace:
+                continue
+            report['orphan_files'] += 1
+            self._dispose(entry.path, stat, report)
+
+    def _reap_blobs(self, report):
+        """没有其他硬链接且没有记录引用的 blob"""
+        now = time.time()
+        candidates = {}
+
+        def check():
+            shas = list(candidates)
+            referenced = set()
+            for column in [QuestionFile.sha256, AnswerFile.sha256]:
+                referenced.update(sha for (sha,) in db.session.execute(
+                    db.select(column).where(column.in_(shas)).distinct()))
+            db.session.commit()
+            for sha, (path, stat) in candidates.items():
+                if sha not in referenced:
+                    report['orphan_blobs'] += 1
+                    self._dispose(path, stat, report)
+            candidates.clear()
+
+        for entry in iter_files(self.blob_store.root, skip={self.blob_store.tmp_dir}):
+            if not is_sha256(entry.name):
+                continue
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if stat.st_nlink > 1 or now - changed_at(stat) < self.grace:
+                continue
+            candidates[entry.name] = (entry.path, stat)
+            if len(candidates) >= self.batch_size:
+                check()
+        if candidates:
+            check()
+
+    def _dispose(self, path, stat, report):
+        """删除或隔离一个孤儿文件"""
+        report['orphan_bytes'] += stat.st_size
+        if self.dry_run:
+            return
+        try:
+            if self.mode == 'delete':
+                os.remove(path)
+                # 仍有其他硬链接时空间并未释放
+                if stat.st_nlink == 1:
+                    report['bytes_reclaimed'] += stat.st_size
+            else:
+                dest = os.path.join(self.quarantine_folder, datetime.now().strftime(QUARANTINE_DATE_FORMAT),
+                                    os.path.relpath(path, self.upload_folder))
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                os.replace(path, dest)
+                report['quarantined'] += 1
+        except OSError as e:
+            print(f"Error reaping {path}: {e}")
+            return
+        self._throttle()
+
+    # 临时文件
+    def _reap_uploads(self, report):
+        """清理长时间没有进展的分块上传和 blob 临时文件"""
+        now = time.time()
+        try:
+            upload_ids = [name for name in os.listdir(self.chunked_uploads.root) if UPLOAD_ID_PATTERN.match(name)]
+        except FileNotFoundError:
+            upload_ids = []
+        for upload_id in upload_ids:
+            directory = os.path.join(self.chunked_uploads.root, upload_id)
+            last_active = 0
+            size = 0
+            for name in ['.', 'meta.json', 'data.part', 'chunks']:
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except FileNotFoundError:
+                    continue
+                last_active = max(last_active, stat.st_mtime)
+                if name == 'data.part':
+                    size = stat.st_blocks * 512
+            if now - last_active < self.upload_max_age:
+                continue
+            report['stale_uploads'] += 1
+            if not self.dry_run:
+                self.chunked_uploads.discard(upload_id)
+                report['bytes_reclaimed'] += size
+                self._throttle()
+
+        for entry in iter_files(self.blob_store.tmp_dir):
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime < self.upload_max_age:
+                continue
+            report['stale_temp_files'] += 1
+            if not self.dry_run:
+                try:
+                    os.remove(entry.path)
+                    report['bytes_reclaimed'] += stat.st_size
+                except FileNotFoundError:
+                    pass
+                self._throttle()
+
+    def _purge_quarantine(self, report):
+        """删除超过保留期的隔离文件"""
+        cutoff = (datetime.now() - timedelta(days=self.quarantine_days)).strftime(QUARANTINE_DATE_FORMAT)
+        try:
+            days = sorted(os.listdir(self.quarantine_folder))
+        except FileNotFoundError:
+            return
+        for day in days:
+            if not day.isdigit() or day >= cutoff:
+                continue
+            directory = os.path.join(self.quarantine_folder, day)
+            for entry in iter_files(directory):
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                report['quarantine_purged'] += 1
+                if self.dry_run:
+                    continue
+                os.remove(entry.path)
+                if stat.st_nlink == 1:
+                    report['bytes_reclaimed'] += stat.st_size
+                self._throttle()
+            if not self.dry_run:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def _prune_empty_dirs(self, root):
+        """
+        自底向上删除空目录（不含 root 本身），保护期内修改过的目录不删；
+        删除子目录会更新父目录的修改时间，有保护期时父目录在之后的轮次中删除
+        """
+        removed = 0
+        for directory, _, files in os.walk(root, topdown=False):
+            if directory == root or files or directory.startswith(self.blob_store.tmp_dir):
+                continue
+            try:
+                if time.time() - os.stat(directory).st_mtime < self.grace:
+                    continue
+                os.rmdir(directory)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+def start_reaper(reaper, interval):
+    """启动后台对账线程"""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                report = reaper.run()
+                if report:
+                    print(f"Reaper report: {json.dumps(report)}")
+            except Exception as e:
+                print(f"Error reaping uploads: {e}")
+    thread = threading.Thread(target=run, name='upload-reaper', daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="清理上传目录和数据库中的孤儿文件")
+    parser.add_argument('--dry-run', action='store_true', help="只统计不处理")
+    parser.add_argument('--delete', action='store_true', help="直接删除而不是移到隔离目录")
+    parser.add_argument('--rate', type=float, help="每秒最多处理的文件数，0 表示不限速")
+    parser.add_argument('--grace', type=float, help="新文件保护期秒数")
+    args = parser.parse_args()
+
+    from api import reaper
+    reaper.dry_run = args.dry_run
+    if args.delete:
+        reaper.mode = 'delete'
+    if args.rate is not None:
+        reaper.rate = args.rate
+    if args.grace is not None:
+        reaper.grace = args.grace
+    report = reaper.run()
+    if report is None:
+        print("another reaper is running")
+        return
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
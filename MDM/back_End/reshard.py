@@ -0,0 +1,139 @@
+"""
+把上传目录中的已有文件迁移到两级十六进制前缀的分散布局（见 upload_paths.py）
+
+    python reshard.py                              # 迁移全部记录
+    python reshard.py --batch-size 200 --pause 0.5 # 控制每批条数和批间隔
+    python reshard.py --dry-run                    # 只统计需要迁移的记录
+
+迁移期间服务可以照常运行：
+- 每条记录先在新位置建立硬链接，旧路径仍然可读
+- 用 UPDATE ... WHERE 路径未变 写入新路径，期间被重新上传替换的记录会跳过
+- 每批提交后才删除旧路径，并清理变空的旧目录
+已迁移的记录会被跳过，中断后重新执行即可继续。
+"""
+import argparse
+import os
+import shutil
+import time
+import uuid
+
+from model import app, db, QuestionFile, AnswerFile
+from upload_paths import QUESTION_FOLDER, ANSWER_FOLDER, UUID_PREFIX_PATTERN, is_sharded, shard_dir
+
+
+def relative_path(path, folder):
+    return os.path.relpath(path, folder).replace(os.sep, '/')
+
+
+def target_path(path, folder):
+    """新路径：保留已有的 uuid 前缀，没有则补一个，保证唯一"""
+    filename = os.path.basename(path)
+    match = UUID_PREFIX_PATTERN.match(filename)
+    if match:
+        token = match.group(1)
+    else:
+        token = uuid.uuid4().hex
+        filename = f"{token}_{filename}"
+    return os.path.join(shard_dir(folder, token), filename)
+
+
+def link_file(src, dest):
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+def prune_empty_dirs(directory, stop):
+    """从 directory 向上删除空目录，到 stop 为止"""
+    stop = os.path.abspath(stop)
+    directory = os.path.abspath(directory)
+    while directory != stop and directory.startswith(stop + os.sep):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            return
+        directory = os.path.dirname(directory)
+
+
+def reshard_table(table, path_column, folder, batch_size, pause, dry_run, stats):
+    column = table.c[path_column]
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            db.select(table.c.id, column).where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+
+        moved = []
+        linked = []
+        try:
+            for row_id, path in rows:
+                if not path:
+                    continue
+                relative = relative_path(path, folder)
+                if relative.startswith('..'):
+                    stats['outside'] += 1
+                    continue
+                if is_sharded(path, folder):
+                    continue
+                if dry_run:
+                    stats['pending'] += 1
+                    continue
+
+                new_path = target_path(path, folder)
+                exists = os.path.exists(path)
+                if exists:
+                    link_file(path, new_path)
+                    linked.append(new_path)
+                result = db.session.execute(
+                    table.update().where(table.c.id == row_id, column == path).values({path_column: new_path}))
+                if result.rowcount:
+                    moved.append((path, exists))
+                else:
+                    # 迁移期间路径已被其他请求修改
+                    stats['skipped'] += 1
+                    if exists:
+                        os.remove(new_path)
+                        linked.remove(new_path)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            for new_path in linked:
+                if os.path.exists(new_path):
+                    os.remove(new_path)
+            raise
+
+        for old_path, exists in moved:
+            if exists and os.path.exists(old_path):
+                os.remove(old_path)
+            prune_empty_dirs(os.path.dirname(old_path), folder)
+        stats['moved'] += len(moved)
+        if moved:
+            print(f"{table.name}: moved {stats['moved']} files so far (id <= {last_id})")
+            if pause:
+                time.sleep(pause)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="迁移上传文件到分散目录布局")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--pause', type=float, default=0.1, help="每批之间暂停的秒数，降低对线上服务的影响")
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    with app.app_context():
+        for model, path_column, folder in [
+            (QuestionFile, 'questionFilePath', QUESTION_FOLDER),
+            (AnswerFile, 'answerFilePath', ANSWER_FOLDER),
+        ]:
+            stats = {'moved': 0, 'pending': 0, 'skipped': 0, 'outside': 0}
+            reshard_table(model.__table__, path_column, folder, args.batch_size, args.pause, args.dry_run, stats)
+            print(f"{model.__tablename__}: {stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+读接口的服务端响应缓存
+
+缓存键为 (接口, 当前用户, 请求参数)，缓存值记录生成时所依赖实体的版本号。
+写接口调用 bump() 递增实体版本号，读取时版本号不一致即视为失效，不需要逐条查找删除缓存。
+- 响应体缓存在进程内 LRU（TTLCache）中
+- 版本号默认存放在 sqlite 文件中，同一台机器上的多个进程共享，写入后其他进程立即失效；
+  也可用内存存储（单进程调试）
+- 响应带 ETag（响应体哈希），客户端携带 If-None-Match 时返回 304
+
+配置项：
+    RESPONSE_CACHE_BACKEND       'sqlite'（默认）或 'memory'
+    RESPONSE_CACHE_SQLITE_PATH   版本号 sqlite 文件路径
+    RESPONSE_CACHE_SIZE          进程内缓存条目数，默认 2000
+    RESPONSE_CACHE_TTL           缓存有效秒数，默认 300
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+
+from cache import TTLCache
+from db_routing import replica_cache_ttl
+
+
+def entity_key(kind, object_id=None):
+    return kind if object_id is None else f"{kind}:{object_id}"
+
+
+class MemoryVersionStore:
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        with self._lock:
+            return {key: self._versions.get(key, 0) for key in keys}
+
+    def bump(self, keys):
+        with self._lock:
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+
+class SQLiteVersionStore:
+    """实体版本号，每个线程一个连接"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute('CREATE TABLE IF NOT EXISTS versions ('
+                             'entity TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys):
+        versions = dict.fromkeys(keys, 0)
+        if keys:
+            placeholders = ','.join('?' * len(keys))
+            versions.update(self._conn().execute(
+                f'SELECT entity, version FROM versions WHERE entity IN ({placeholders})', list(keys)))
+        return versions
+
+    def bump(self, keys):
+        self._conn().executemany(
+            'INSERT INTO versions (entity, version) VALUES (?, 1) '
+            'ON CONFLICT(entity) DO UPDATE SET version = version + 1', [(key,) for key in keys])
+
+
+class ResponseCache:
+
+    def __init__(self, versions, maxsize=2000, ttl=300):
+        self.versions = versions
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    @classmethod
+    def from_config(cls, config):
+        backend = config.get('RESPONSE_CACHE_BACKEND', 'sqlite')
+        if backend == 'sqlite':
+            versions = SQLiteVersionStore(config['RESPONSE_CACHE_SQLITE_PATH'])
+        elif backend == 'memory':
+            versions = MemoryVersionStore()
+        else:
+            raise ValueError(f"unknown RESPONSE_CACHE_BACKEND: {backend}")
+        return cls(versions,
+                   maxsize=config.get('RESPONSE_CACHE_SIZE', 2000),
+                   ttl=config.get('RESPONSE_CACHE_TTL', 300))
+
+    def bump(self, *entities):
+        """使依赖这些实体的缓存失效，entities 为 (类型, id) 元组，应在事务提交后调用"""
+        self.versions.bump(sorted({entity_key(*entity) for entity in entities}))
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+        }
+
+    def cached(self, dependencies):
+        """
+        缓存视图的成功响应（code == 200）
+        dependencies(data) 根据请求 JSON 返回响应依赖的 (类型, id) 列表
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                data = request.get_json(silent=True) or {}
+                keys = sorted({entity_key(*entity) for entity in dependencies(data)})
+                key = (request.endpoint, session.get('user_id'), session.get('is_teacher'),
+                       json.dumps(data, sort_keys=True), json.dumps(kwargs, sort_keys=True))
+                # 先取版本号再生成响应，生成期间发生的写入会让这条缓存在下次读取时失效
+                versions = tuple(sorted(self.versions.get_many(keys).items()))
+
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] == versions:
+                    self._count('hits')
+                    etag, body = entry[1], entry[2]
+                else:
+                    self._count('misses')
+                    response = make_response(f(*args, **kwargs))
+                    payload = response.get_json(silent=True) if response.is_json else None
+                    if response.status_code != 200 or not isinstance(payload, dict) or payload.get('code') != 200:
+                        return response
+                    body = response.get_data()
+                    etag = hashlib.sha256(body).hexdigest()
+                    # 从副本读出的响应可能落后于版本号，只短暂缓存
+                    self.entries.set(key, (versions, etag, body), ttl=replica_cache_ttl())
+
+                if request.if_none_match.contains(etag):
+                    self._count('not_modified')
+                    response = current_app.response_class(status=304)
+                else:
+                    response = current_app.response_class(body, mimetype='application/json')
+                response.set_etag(etag)
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+                return response
+            return decorated_function
+        return decorator
@@ -0,0 +1,205 @@
+"""
+班级名单批量导入（CSV / XLSX）
+
+第一行为表头（不区分大小写、顺序不限）：
+    name, account, birth, gender   必填
+    password                       可选，为空时使用请求中的默认密码
+空行跳过；CSV 需为 UTF-8（可带 BOM），XLSX 读取第一个工作表，需要安装 openpyxl。
+
+- 上传文件逐行解析，不整体读入内存
+- 与注册接口相同，账号和姓名在学生表和老师表中都必须唯一（文件内也不能重复）
+- 账号、姓名是否已被使用和学生是否已在班级中，都按 1000 个一组用 IN 查询，不逐行查库
+- 学生和班级关联按批 executemany 写入，班级人数用一条 UPDATE 累加，全部在同一个事务中
+- 有问题的行不会中断导入，按行号返回错误原因
+"""
+import csv
+import io
+import os
+from datetime import date, datetime
+
+from model import db, Student, Teacher, Class, StudentToClass
+
+try:
+    import openpyxl
+except ImportError:  # 未安装时只支持 CSV
+    openpyxl = None
+
+REQUIRED_COLUMNS = ('name', 'account', 'birth', 'gender')
+OPTIONAL_COLUMNS = ('password',)
+# 与 Student 表的字段长度一致
+MAX_FIELD_LENGTH = 80
+QUERY_CHUNK_SIZE = 1000
+ON_EXISTING = ('error', 'enroll')
+
+
+class RosterError(Exception):
+    """整个文件无法导入（格式、表头、行数）"""
+
+
+def chunks(items, size=QUERY_CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def csv_rows(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.reader(text)
+    except UnicodeDecodeError:
+        raise RosterError("csv file must be UTF-8 encoded")
+    except csv.Error as e:
+        raise RosterError(f"invalid csv file: {e}")
+    finally:
+        # 不随包装对象一起关闭上传文件
+        text.detach()
+
+
+def cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def xlsx_rows(stream):
+    if openpyxl is None:
+        raise RosterError("xlsx import is not available, please upload csv")
+    try:
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise RosterError(f"invalid xlsx file: {e}")
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield [cell_text(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def read_rows(filename, stream):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        return csv_rows(stream)
+    if extension == '.xlsx':
+        return xlsx_rows(stream)
+    raise RosterError("unsupported file type, please upload .csv or .xlsx")
+
+
+def row_error(line, record, message):
+    return {"row": line, "account": record.get('account', ''), "message": message}
+
+
+def parse_roster(filename, stream, max_rows):
+    """逐行解析并做不需要查库的校验，返回 (有效行 [(行号, 字段)], 错误)"""
+    rows = read_rows(filename, stream)
+    header = next(rows, None)
+    if header is None:
+        raise RosterError("empty file")
+    columns = [column.strip().lower() for column in header]
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise RosterError(f"missing columns: {', '.join(missing)}")
+    positions = {column: columns.index(column) for column in REQUIRED_COLUMNS + OPTIONAL_COLUMNS if column in columns}
+
+    records, errors, seen, seen_names = [], [], {}, {}
+    for line, row in enumerate(rows, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(records) + len(errors) >= max_rows:
+            raise RosterError(f"too many rows, at most {max_rows} students per import")
+        record = {column: row[index] if index < len(row) else '' for column, index in positions.items()}
+        for column in REQUIRED_COLUMNS:
+            record[column] = record[column].strip()
+
+        empty = [column for column in REQUIRED_COLUMNS if not record[column]]
+        too_long = [column for column in REQUIRED_COLUMNS if len(record[column]) > MAX_FIELD_LENGTH]
+        if empty:
+            errors.append(row_error(line, record, f"missing {', '.join(empty)}"))
+        elif too_long:
+            errors.append(row_error(line, record, f"{', '.join(too_long)} longer than {MAX_FIELD_LENGTH} characters"))
+        elif record['account'] in seen:
+            errors.append(row_error(line, record, f"duplicate account, first used in row {seen[record['account']]}"))
+        elif record['name'] in seen_names:
+            errors.append(row_error(line, record, f"duplicate name, first used in row {seen_names[record['name']]}"))
+        else:
+            seen[record['account']] = line
+            seen_names[record['name']] = line
+            records.append((line, record))
+    return records, errors
+
+
+def existing_accounts(accounts):
+    """已被使用的账号：学生账号对应 sid，老师账号对应 None"""
+    found = {}
+    for chunk in chunks(accounts):
+        found.update((account, None) for (account,) in
+                     db.session.query(Teacher.account).filter(Teacher.account.in_(chunk)))
+        found.update((account, sid) for sid, account in
+                     db.session.query(Student.sid, Student.account).filter(Student.account.in_(chunk)))
+    return found
+
+
+def existing_names(names):
+    """已被学生或老师使用的姓名"""
+    found = set()
+    for chunk in chunks(names):
+        found.update(name for (name,) in db.session.query(Teacher.name).filter(Teacher.name.in_(chunk)))
+        found.update(name for (name,) in db.session.query(Student.name).filter(Student.name.in_(chunk)))
+    return found
+
+
+def enrolled_students(class_id, student_ids):
+    enrolled = set()
+    for chunk in chunks(student_ids):
+        enrolled.update(sid for (sid,) in db.session.query(StudentToClass.sid)
+                        .filter(StudentToClass.cid == class_id, StudentToClass.sid.in_(chunk)))
+    return enrolled
+
+
+def plan_import(class_id, records, on_existing='error'):
+    """
+    按已有账号把有效行分为新建学生和加入班级的已有学生，返回 (新建 [(行号, 字段)], 已有学生 sid, 错误)
+    on_existing 为 'enroll' 时，账号已是学生的行直接把该学生加入班级；新建学生的姓名已被使用时报错
+    """
+    found = existing_accounts(record['account'] for _, record in records)
+    enrolled = enrolled_students(class_id, {sid for sid in found.values() if sid is not None})
+    # 只有新建的学生需要检查姓名
+    used_names = existing_names(record['name'] for _, record in records if record['account'] not in found)
+
+    new_students, existing_ids, errors = [], [], []
+    for line, record in records:
+        account = record['account']
+        if account not in found:
+            if record['name'] in used_names:
+                errors.append(row_error(line, record, "name already exists"))
+            else:
+                new_students.append((line, record))
+        elif found[account] is None or on_existing != 'enroll':
+            errors.append(row_error(line, record, "account already exists"))
+        elif found[account] in enrolled:
+            errors.append(row_error(line, record, "student already in this class"))
+        else:
+            existing_ids.append(found[account])
+    return new_students, existing_ids, errors
+
+
+def insert_roster(class_id, student_rows, existing_ids, batch_size=QUERY_CHUNK_SIZE):
+    """写入新学生并把新学生和 existing_ids 加入班级，返回加入人数；由调用方提交或回滚"""
+    student_ids = list(existing_ids)
+    for chunk in chunks(student_rows, batch_size):
+        db.session.execute(Student.__table__.insert(), chunk)
+        # MySQL 不支持 INSERT ... RETURNING，按账号取回新生成的 sid
+        student_ids.extend(sid for (sid,) in db.session.query(Student.sid)
+                           .filter(Student.account.in_([row['account'] for row in chunk])))
+
+    for chunk in chunks(student_ids, batch_size):
+        db.session.execute(StudentToClass.__table__.insert(), [{'sid': sid, 'cid': class_id} for sid in chunk])
+    if student_ids:
+        db.session.execute(db.update(Class).where(Class.cid == class_id)
+                           .values(studentNum=Class.studentNum + len(student_ids)))
+    return len(student_ids)
@@ -0,0 +1,347 @@
+"""
+生成测试数据（替代原 model.py 中逐条插入的初始化脚本），会先清空所有业务表
+
+    python seed.py                                  # small：2 个老师，几十个学生
+    python seed.py --scale district                 # 区级规模：30 万学生、750 万条答案记录
+    python seed.py --scale school --teachers 120 --seed 7
+    python seed.py --scale district --no-files      # 只写数据库，不创建占位文件
+
+相同的规模参数和 --seed 生成相同的数据（密码哈希的盐除外）：主键按规模直接算出（见 Layout），
+随机字段（姓名、性别、提交状态等）来自每个老师各自的固定种子。
+- 账号为 teacher<tid> / student<sid>，所有老师共用一个密码哈希、所有学生共用一个，只计算一次
+- 按老师逐个生成行，每张表攒够 --batch-size 行后用 Core executemany 写入并提交，不在内存中保存整张表；
+  pymysql 的 executemany 会合并成多行 INSERT。MySQL 导入期间关闭 unique_checks / foreign_key_checks，
+  sqlite 关闭同步写盘
+- 模板的创建方式与 create_template 相同：每个学生每道题一条答案记录；约 30% 的学生已提交，
+  只有已提交的答案有文件
+- 占位文件写入按内容寻址的存储：每道题的问题文件一个 blob，同一题所有已提交答案链接到同一个 blob
+- 姓名与注册、名单导入的要求一致，在所有老师和学生中唯一：随机姓名后加上账号中的编号
+- 只导入 model，不导入 api，不会启动会话清理、指标写入和对账清理等后台线程
+"""
+import argparse
+import hashlib
+import io
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from blob_store import BlobStore
+from migrations import upgrade
+from model import (app, db, Teacher, Student, Class, TeacherToClass, StudentToClass, VisionPro, Template,
+                   TeacherToTemplate, StudentToTemplate, QuestionFile, AnswerFile,
+                   TemplateToQuestionFile, TemplateToAnswerFile)
+from passwords import PASSWORD_HASH_METHOD
+from upload_paths import UPLOAD_FOLDER, placeholder_file_path
+from werkzeug.security import generate_password_hash
+
+# 每个老师的班级数、每班学生数、模板数、每个模板的题目数、设备数
+SCALES = {
+    'small': dict(teachers=2, classes=2, students=10, templates=3, questions=4, devices=2),
+    'school': dict(teachers=80, classes=4, students=30, templates=10, questions=5, devices=10),
+    'district': dict(teachers=2500, classes=4, students=30, templates=20, questions=5, devices=10),
+}
+DEFAULT_PASSWORD = '123'
+BATCH_SIZE = 10000
+SUBMIT_RATE = 0.3
+
+FIRST_NAMES = ['David', 'Emily', 'Michael', 'Sarah', 'John', 'Alice', 'Bob', 'Charlie', 'Eve', 'Frank',
+               'Grace', 'Henry', 'Ivy', 'Jack', 'Jerry', 'Esther', 'Lily', 'Oscar', 'Ruby', 'Tom']
+LAST_NAMES = ['Chan', 'Cheung', 'Chen', 'Ho', 'Lam', 'Lau', 'Lee', 'Leung', 'Li', 'Ng',
+              'Smith', 'Tang', 'Wang', 'Wong', 'Wu', 'Yeung', 'Zhang', 'Brown', 'Taylor', 'Jones']
+GENDERS = ['Male', 'Female']
+DEVICE_STATES = ['Available', 'Available', 'Available', 'In Use', 'Offline']
+TERM_START = datetime(2025, 1, 1)
+
+
+class Layout:
+    """数据规模及由规模算出的主键，生成数据和基准测试脚本共用"""
+
+    def __init__(self, teachers, classes, students, templates, questions, devices, random_seed=1):
+        self.teachers = teachers
+        self.classes = classes
+        self.students = students
+        self.templates = templates
+        self.questions = questions
+        self.devices = devices
+        self.random_seed = random_seed
+
+    def rng(self, tid):
+        return random.Random(f'{self.random_seed}:{tid}')
+
+    def teacher_ids(self):
+        return range(1, self.teachers + 1)
+
+    def class_ids(self, tid):
+        return range((tid - 1) * self.classes + 1, tid * self.classes + 1)
+
+    def student_ids(self, cid):
+        return range((cid - 1) * self.students + 1, cid * self.students + 1)
+
+    def template_ids(self, tid):
+        return range((tid - 1) * self.templates + 1, tid * self.templates + 1)
+
+    def template_class(self, temid):
+        """模板轮流分配给老师的各个班级"""
+        tid = (temid - 1) // self.templates + 1
+        return self.class_ids(tid)[(temid - 1) % self.templates % self.classes]
+
+    def question_ids(self, temid):
+        return range((temid - 1) * self.questions + 1, temid * self.questions + 1)
+
+    def answer_id(self, qid, index):
+        """第 qid 题第 index 个学生（从 0 开始）的答案"""
+        return (qid - 1) * self.students + index + 1
+
+    def device_ids(self, tid):
+        return range((tid - 1) * self.devices + 1, tid * self.devices + 1)
+
+    @staticmethod
+    def teacher_account(tid):
+        return f'teacher{tid}'
+
+    @staticmethod
+    def student_account(sid):
+        return f'student{sid}'
+
+    @staticmethod
+    def question_name(temid, number):
+        # 与 create_template 的命名一致
+        return f'{temid}_{number}.jpg'
+
+    @staticmethod
+    def answer_name(sid, question_name):
+        return f'{sid}_{question_name}'
+
+    def totals(self):
+        classes = self.teachers * self.classes
+        templates = self.teachers * self.templates
+        assignments = templates * self.students
+        return {
+            'teachers': self.teachers,
+            'classes': classes,
+            'students': classes * self.students,
+            'devices': self.teachers * self.devices,
+            'templates': templates,
+            'assignments': assignments,
+            'questions': templates * self.questions,
+            'answers': assignments * self.questions,
+        }
+
+
+def person_name(rng, number):
+    """随机姓名加编号，编号与账号一致，保证姓名唯一"""
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {number}'
+
+
+def placeholder(kind, name):
+    content = f'{kind} {name}\n'.encode()
+    return content, hashlib.sha256(content).hexdigest()
+
+
+class Placeholders:
+    """占位文件的存放位置：上传目录下的问题、答案目录和 blob 存储（与 api.py 的布局一致）"""
+
+    def __init__(self, upload_folder, create_files=True):
+        self.question_folder = os.path.join(upload_folder, 'questions')
+        self.answer_folder = os.path.join(upload_folder, 'answers')
+        self.blob_store = BlobStore(os.path.join(upload_folder, '.blobs'))
+        self.create_files = create_files
+
+    def question_path(self, name):
+        return placeholder_file_path(self.question_folder, name)
+
+    def answer_path(self, name):
+        return placeholder_file_path(self.answer_folder, name)
+
+    def write(self, content, sha256, dest):
+        """写入占位文件；内容已在存储中时只建立链接。路径和内容都由文件名决定，重复执行时已存在的文件跳过"""
+        if os.path.exists(dest):
+            return
+        if not self.blob_store.link(sha256, dest):
+            self.blob_store.store_stream(io.BytesIO(content), dest)
+
+
+def teacher_rows(layout, tid, teacher_hash, student_hash, placeholders):
+    """生成一个老师及其班级、学生、设备、模板的所有行，产出 (表, 行)"""
+    create_files = placeholders.create_files
+    rng = layout.rng(tid)
+    account = layout.teacher_account(tid)
+    yield Teacher.__table__, {
+        'tid': tid, 'name': person_name(rng, tid), 'account': account, 'password': teacher_hash,
+        'birth': f'{rng.randint(1965, 2000)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        'gender': rng.choice(GENDERS), 'email': f'{account}@example.com',
+        'phone': f'{rng.randrange(10 ** 9, 10 ** 10)}',
+    }
+
+    for cid in layout.class_ids(tid):
+        grade = rng.randint(1, 6)
+        yield Class.__table__, {'cid': cid, 'name': f'Year{grade}_Class{cid}', 'studentNum': layout.students}
+        yield TeacherToClass.__table__, {'tid': tid, 'cid': cid}
+        for sid in layout.student_ids(cid):
+            yield Student.__table__, {
+                'sid': sid, 'name': person_name(rng, sid), 'account': layout.student_account(sid),
+                'password': student_hash, 'birth': f'{2019 - grade}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+                'gender': rng.choice(GENDERS),
+            }
+            yield StudentToClass.__table__, {'sid': sid, 'cid': cid}
+
+    for vp_id in layout.device_ids(tid):
+        yield VisionPro.__table__, {'vp_id': vp_id, 'teacher_id': tid, 'curState': rng.choice(DEVICE_STATES)}
+
+    for temid in layout.template_ids(tid):
+        start = TERM_START + timedelta(days=rng.randrange(300), hours=rng.randrange(24))
+        end = start + timedelta(days=rng.randint(7, 60))
+        yield Template.__table__, {
+            'temid': temid, 'name': f'Template {temid}', 'startTime': start.strftime('%Y-%m-%d %H:%M:%S'),
+            'endTime': end.strftime('%Y-%m-%d %H:%M:%S'), 'description': f'Generated template {temid}',
+        }
+        yield TeacherToTemplate.__table__, {'tid': tid, 'temid': temid}
+
+        students = layout.student_ids(layout.template_class(temid))
+        submitted = []
+        for sid in students:
+            is_submitted = rng.random() < SUBMIT_RATE
+            submitted.append(is_submitted)
+            yield StudentToTemplate.__table__, {
+                'sid': sid, 'temid': temid, 'isSubmitted': is_submitted,
+                'totalTime': rng.randint(5, 90) if is_submitted else 0,
+                'score': str(rng.randint(40, 100)) if is_submitted else '',
+            }
+
+        for number, qid in enumerate(layout.question_ids(temid), start=1):
+            name = layout.question_name(temid, number)
+            question_path = placeholders.question_path(name)
+            question_content, question_sha = placeholder('question', name)
+            answer_content, answer_sha = placeholder('answer', name)
+            if create_files:
+                placeholders.write(question_content, question_sha, question_path)
+            yield QuestionFile.__table__, {'id': qid, 'questionFileName': name, 'questionFilePath': question_path,
+                                           'sha256': question_sha if create_files else None}
+            yield TemplateToQuestionFile.__table__, {'temid': temid, 'qid': qid}
+
+            for index, sid in enumerate(students):
+                aid = layout.answer_id(qid, index)
+                answer_name = layout.answer_name(sid, name)
+                answer_path = placeholders.answer_path(answer_name)
+                has_file = create_files and submitted[index]
+                if has_file:
+                    placeholders.write(answer_content, answer_sha, answer_path)
+                yield AnswerFile.__table__, {'id': aid, 'answerFileName': answer_name, 'answerFilePath': answer_path,
+                                             'sha256': answer_sha if has_file else None, 'sid': sid, 'qid': qid}
+                yield TemplateToAnswerFile.__table__, {'temid': temid, 'aid': aid}
+
+
+class BulkLoader:
+    """按表缓存行，任意一张表攒够 batch_size 行时按外键依赖顺序写入所有表并提交"""
+
+    def __init__(self, conn, batch_size=BATCH_SIZE):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.pending = {table: [] for table in db.metadata.sorted_tables}
+        self.counts = {}
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    def add(self, table, row):
+        rows = self.pending[table]
+        rows.append(row)
+        self.rows += 1
+        if len(rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for table, rows in self.pending.items():
+            if rows:
+                self.conn.execute(table.insert(), rows)
+                self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+                rows.clear()
+        self.conn.commit()
+
+    def progress(self):
+        elapsed = time.perf_counter() - self.started
+        return f"{self.rows} rows in {elapsed:.1f}s ({self.rows / elapsed if elapsed else 0:.0f} rows/s)"
+
+
+def prepare_connection(conn):
+    """导入期间的会话级设置，只影响本连接"""
+    dialect = conn.dialect.name
+    if dialect == 'mysql':
+        conn.exec_driver_sql('SET unique_checks=0')
+        conn.exec_driver_sql('SET foreign_key_checks=0')
+    elif dialect == 'sqlite':
+        conn.exec_driver_sql('PRAGMA synchronous=OFF')
+
+
+def restore_connection(conn):
+    dialect = conn.dialect.name
+    if dialect == 'mysql':
+        conn.exec_driver_sql('SET unique_checks=1')
+        conn.exec_driver_sql('SET foreign_key_checks=1')
+    elif dialect == 'sqlite':
+        conn.exec_driver_sql('PRAGMA synchronous=FULL')
+
+
+def seed(layout, teacher_password=DEFAULT_PASSWORD, student_password=DEFAULT_PASSWORD,
+         batch_size=BATCH_SIZE, create_files=True, upload_folder=UPLOAD_FOLDER, verbose=False):
+    """清空业务表后按 layout 写入数据，返回每张表写入的行数；需在 app context 中调用"""
+    placeholders = Placeholders(upload_folder, create_files)
+    db.drop_all()
+    upgrade()
+
+    teacher_hash = generate_password_hash(teacher_password, method=PASSWORD_HASH_METHOD)
+    student_hash = generate_password_hash(student_password, method=PASSWORD_HASH_METHOD)
+    report_every = max(1, layout.teachers // 20)
+
+    with db.engine.connect() as conn:
+        prepare_connection(conn)
+        conn.commit()
+        try:
+            loader = BulkLoader(conn, batch_size)
+            for tid in layout.teacher_ids():
+                for table, row in teacher_rows(layout, tid, teacher_hash, student_hash, placeholders):
+                    loader.add(table, row)
+                if verbose and tid % report_every == 0:
+                    print(f"teacher {tid}/{layout.teachers}: {loader.progress()}")
+            loader.flush()
+        finally:
+            restore_connection(conn)
+            conn.commit()
+    if verbose:
+        print(f"done: {loader.progress()}")
+    return loader.counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="清空数据库并写入按规模生成的测试数据")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--teachers', type=int, help="老师数")
+    parser.add_argument('--classes', type=int, help="每个老师的班级数")
+    parser.add_argument('--students', type=int, help="每个班级的学生数")
+    parser.add_argument('--templates', type=int, help="每个老师的模板数")
+    parser.add_argument('--questions', type=int, help="每个模板的题目数")
+    parser.add_argument('--devices', type=int, help="每个老师的设备数")
+    parser.add_argument('--seed', type=int, default=1, help="随机种子")
+    parser.add_argument('--teacher-password', default=DEFAULT_PASSWORD)
+    parser.add_argument('--student-password', default=DEFAULT_PASSWORD)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--no-files', action='store_true', help="不创建占位文件")
+    args = parser.parse_args()
+
+    scale = dict(SCALES[args.scale])
+    for name in scale:
+        if getattr(args, name) is not None:
+            scale[name] = getattr(args, name)
+    layout = Layout(random_seed=args.seed, **scale)
+
+    print(f"Seeding {db.engine.url.render_as_string(hide_password=True)}: "
+          + ', '.join(f"{count} {name}" for name, count in layout.totals().items()))
+    counts = seed(layout, teacher_password=args.teacher_password, student_password=args.student_password,
+                  batch_size=args.batch_size, create_files=not args.no_files, verbose=True)
+    for name, count in sorted(counts.items()):
+        print(f"  {name}: {count}")
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        main()
@@ -0,0 +1,282 @@
+"""
+服务端会话存储
+
+替代 Flask-Session 的 filesystem 后端：
+- 持久层为单个 sqlite 文件（按过期时间建索引），也可换成内存存储
+- 进程内 LRU 缓存作为前端，命中时只按主键读取版本号核对，不读取和反序列化会话内容；
+  每次写入或续期都会生成新版本号，其他进程中缓存的旧内容（包括已登出的会话）不会再被使用
+- 滑动过期只在剩余有效期低于阈值时才写回
+- 后台线程定期分批清理过期会话
+
+配置项：
+    SESSION_BACKEND              'sqlite'（默认）或 'memory'
+    SESSION_SQLITE_PATH          sqlite 文件路径
+    SESSION_CACHE_SIZE           进程内缓存条目数，默认 10000
+    SESSION_CACHE_TTL            进程内缓存有效秒数，默认 10
+    SESSION_REFRESH_THRESHOLD    剩余有效期低于该比例时续期，默认 0.5
+    SESSION_SWEEP_INTERVAL       清理间隔秒数，默认 300，0 表示不启动清理线程
+"""
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from cache import TTLCache
+
+
+def new_version():
+    """会话记录的版本号，每次写入或续期时重新生成"""
+    return secrets.token_hex(8)
+
+
+class StoreSession(CallbackDict, SessionMixin):
+    """记录会话 id、过期时间以及内容是否被修改"""
+
+    def __init__(self, initial=None, sid=None, expires_at=None, new=False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = new
+        self.modified = False
+
+
+class MemorySessionStore:
+    """纯内存存储，用于本地调试"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            return self._data.get(sid)
+
+    def version(self, sid):
+        with self._lock:
+            record = self._data.get(sid)
+            return record[2] if record is not None else None
+
+    def save(self, sid, payload, expires_at):
+        version = new_version()
+        with self._lock:
+            self._data[sid] = (payload, expires_at, version)
+        return version
+
+    def touch(self, sid, expires_at):
+        version = new_version()
+        with self._lock:
+            if sid in self._data:
+                self._data[sid] = (self._data[sid][0], expires_at, version)
+        return version
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def sweep(self, now, batch_size=500):
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._data.items() if expires_at <= now]
+            for sid in expired:
+                del self._data[sid]
+        return len(expired)
+
+
+class SQLiteSessionStore:
+    """sqlite 持久化存储，每个线程一个连接，WAL 模式下读写互不阻塞"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('CREATE TABLE IF NOT EXISTS sessions ('
+                     "sid TEXT PRIMARY KEY, payload BLOB NOT NULL, expires_at REAL NOT NULL, version TEXT NOT NULL DEFAULT '')")
+        if 'version' not in [row[1] for row in conn.execute('PRAGMA table_info(sessions)')]:
+            # 旧版本建的表没有版本号列
+            conn.execute("ALTER TABLE sessions ADD COLUMN version TEXT NOT NULL DEFAULT ''")
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid):
+        return self._conn().execute(
+            'SELECT payload, expires_at, version FROM sessions WHERE sid = ?', (sid,)).fetchone()
+
+    def version(self, sid):
+        row = self._conn().execute('SELECT version FROM sessions WHERE sid = ?', (sid,)).fetchone()
+        return row[0] if row is not None else None
+
+    def save(self, sid, payload, expires_at):
+        version = new_version()
+        self._conn().execute(
+            'INSERT OR REPLACE INTO sessions (sid, payload, expires_at, version) VALUES (?, ?, ?, ?)',
+            (sid, payload, expires_at, version))
+        return version
+
+    def touch(self, sid, expires_at):
+        version = new_version()
+        self._conn().execute('UPDATE sessions SET expires_at = ?, version = ? WHERE sid = ?',
+                             (expires_at, version, sid))
+        return version
+
+    def delete(self, sid):
+        self._conn().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def sweep(self, now, batch_size=500):
+        """分批删除过期会话，每批一个短事务，避免长时间持有写锁"""
+        removed = 0
+        conn = self._conn()
+        while True:
+            cursor = conn.execute(
+                'DELETE FROM sessions WHERE sid IN '
+                '(SELECT sid FROM sessions WHERE expires_at <= ? LIMIT ?)', (now, batch_size))
+            removed += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return removed
+
+
+class CachedSessionStore:
+    """
+    在持久存储前加一层进程内 LRU 缓存；缓存的记录带版本号，使用前与共享存储中的版本号核对，
+    其他进程写入、续期或删除会话后本进程的缓存即失效
+    """
+
+    def __init__(self, store, maxsize=10000, ttl=10):
+        self.store = store
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def load(self, sid):
+        record = self.cache.get(sid)
+        if record is not None:
+            version = self.store.version(sid)
+            if version == record[2]:
+                return record
+            self.cache.delete(sid)
+            if version is None:
+                return None
+        record = self.store.load(sid)
+        if record is not None:
+            record = tuple(record)
+            self.cache.set(sid, record)
+        return record
+
+    def save(self, sid, payload, expires_at):
+        version = self.store.save(sid, payload, expires_at)
+        self.cache.set(sid, (payload, expires_at, version))
+        return version
+
+    def touch(self, sid, expires_at):
+        version = self.store.touch(sid, expires_at)
+        record = self.cache.get(sid)
+        if record is not None:
+            self.cache.set(sid, (record[0], expires_at, version))
+        return version
+
+    def delete(self, sid):
+        self.cache.delete(sid)
+        self.store.delete(sid)
+
+    def sweep(self, now, batch_size=500):
+        return self.store.sweep(now, batch_size)
+
+
+class StoreSessionInterface(SessionInterface):
+    """基于 SessionStore 的会话接口，只有内容变化或需要续期时才写存储"""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, refresh_threshold=0.5):
+        self.store = store
+        self.refresh_threshold = refresh_threshold
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            record = self.store.load(sid)
+            if record is not None:
+                payload, expires_at = record[:2]
+                if expires_at > time.time():
+                    return StoreSession(self.serializer.loads(payload), sid=sid, expires_at=expires_at)
+                self.store.delete(sid)
+        return StoreSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            # 会话被清空（如登出）则删除记录和 cookie
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        if session.modified or session.new:
+            session.expires_at = now + lifetime
+            self.store.save(session.sid, self.serializer.dumps(dict(session)), session.expires_at)
+        elif session.expires_at - now < lifetime * self.refresh_threshold:
+            # 滑动过期：剩余时间不足阈值时才续期
+            session.expires_at = now + lifetime
+            self.store.touch(session.sid, session.expires_at)
+        else:
+            return
+
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def start_sweeper(store, interval):
+    """启动后台清理线程"""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                store.sweep(time.time())
+            except Exception as e:
+                print(f"Error sweeping sessions: {e}")
+    thread = threading.Thread(target=run, name='session-sweeper', daemon=True)
+    thread.start()
+    return thread
+
+
+def init_session(app):
+    """根据配置创建会话存储并挂到 app 上"""
+    backend = app.config.get('SESSION_BACKEND', 'sqlite')
+    if backend == 'sqlite':
+        store = SQLiteSessionStore(app.config['SESSION_SQLITE_PATH'])
+    elif backend == 'memory':
+        store = MemorySessionStore()
+    else:
+        raise ValueError(f"unknown SESSION_BACKEND: {backend}")
+
+    store = CachedSessionStore(store,
+                               maxsize=app.config.get('SESSION_CACHE_SIZE', 10000),
+                               ttl=app.config.get('SESSION_CACHE_TTL', 10))
+    app.session_interface = StoreSessionInterface(
+        store, refresh_threshold=app.config.get('SESSION_REFRESH_THRESHOLD', 0.5))
+
+    interval = app.config.get('SESSION_SWEEP_INTERVAL', 300)
+    if interval:
+        start_sweeper(store, interval)
+    return store
@@ -0,0 +1,150 @@
+"""
+测试共用的应用和数据库
+
+导入 api 之前把数据库、会话、缓存和上传目录都指向临时目录，测试不会碰到开发数据：
+    cd MDM/back_End && python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+TEST_DIR = tempfile.mkdtemp(prefix='mdm_test_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(TEST_DIR, 'test.db')
+os.environ['SESSION_BACKEND'] = 'memory'
+os.environ['RESPONSE_CACHE_BACKEND'] = 'memory'
+os.environ['METRICS_BACKEND'] = 'memory'
+os.environ['METRICS_FLUSH_INTERVAL'] = '0'
+os.environ['DB_PROFILER_HEADERS'] = '1'
+# 测试中在请求线程内计算密码哈希，并降低迭代次数
+os.environ['PASSWORD_POOL_SIZE'] = '0'
+os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+
+import api  # noqa: E402
+from blob_store import BlobStore  # noqa: E402
+from model import db, Teacher, Student, Class, TeacherToClass, StudentToClass  # noqa: E402
+from uploads import ChunkedUploads  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+PASSWORD = 'secret'
+
+
+@pytest.fixture
+def upload_dir(tmp_path):
+    """把上传相关目录指向本测试的临时目录"""
+    upload_dir = str(tmp_path / 'uploads')
+    api.UPLOAD_FOLDER = upload_dir
+    api.QUESTION_FOLDER = os.path.join(upload_dir, 'questions')
+    api.ANSWER_FOLDER = os.path.join(upload_dir, 'answers')
+    api.blob_store = BlobStore(os.path.join(upload_dir, '.blobs'))
+    api.chunked_uploads = ChunkedUploads(os.path.join(upload_dir, '.incoming'), chunk_size=1024, max_size=1024 * 1024)
+    return upload_dir
+
+
+@pytest.fixture
+def app(upload_dir):
+    """每个测试使用新建的空库和空缓存"""
+    with api.app.app_context():
+        db.drop_all()
+        db.create_all()
+        api.roster_count_cache.clear()
+        api.response_cache.entries.clear()
+        yield api.app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    # 会话 cookie 设置了 Secure，测试客户端需要模拟 https
+    client.environ_base['wsgi.url_scheme'] = 'https'
+    return client
+
+
+@pytest.fixture
+def make_client(app):
+    def factory():
+        client = app.test_client()
+        client.environ_base['wsgi.url_scheme'] = 'https'
+        return client
+    return factory
+
+
+def add_teacher(account='teacher1', name=None):
+    teacher = Teacher(name=name or account, account=account, password=generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000'),
+                      birth='1990-01-01', gender='Male', email=f'{account}@example.com', phone='0000000000')
+    db.session.add(teacher)
+    db.session.commit()
+    return teacher
+
+
+def add_student(account, name=None, class_id=None):
+    student = Student(name=name or account, account=account, password=generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000'),
+                      birth='2010-01-01', gender='Female')
+    db.session.add(student)
+    db.session.flush()
+    if class_id is not None:
+        db.session.add(StudentToClass(sid=student.sid, cid=class_id))
+    db.session.commit()
+    return student
+
+
+def add_class(teacher, name='Class 1', students=0):
+    class_obj = Class(name=name, studentNum=students)
+    db.session.add(class_obj)
+    db.session.flush()
+    db.session.add(TeacherToClass(tid=teacher.tid, cid=class_obj.cid))
+    db.session.commit()
+    return class_obj
+
+
+def login(client, account, teacher=True):
+    path = '/teacher/login' if teacher else '/student/login'
+    response = client.post(path, json={'account': account, 'password': PASSWORD})
+    assert response.get_json()['code'] == 200, response.get_json()
+    return response.get_json()
+
+
+@pytest.fixture
+def template(client):
+    """一个老师、一个模板（两道题）和两个学生，返回时已退出登录"""
+    teacher = add_teacher()
+    class_obj = add_class(teacher)
+    students = [add_student(f'student{n}', class_id=class_obj.cid) for n in (1, 2)]
+    login(client, teacher.account)
+    response = client.post('/api/template/create', json={
+        'teacher_id': teacher.tid, 'name': 'Quiz', 'question_names': ['q1.jpg', 'q2.jpg'],
+        'student_ids': [student.sid for student in students],
+    }).get_json()
+    assert response['code'] == 200
+    detail = client.post('/api/template/detail', json={'template_id': response['template_id']}).get_json()
+    client.delete('/user/logout')
+    return {
+        'id': response['template_id'],
+        'teacher': teacher,
+        'questions': [question['question_id'] for question in detail['data']['questions']],
+        'students': students,
+    }
+
+
+def init_upload(client, template, content, question_index=0, filename='answer.jpg'):
+    init = client.post(f"/api/template/{template['id']}/upload/init", json={
+        'kind': 'answer', 'filename': filename, 'size': len(content),
+        'question_id': template['questions'][question_index],
+    }).get_json()
+    assert init['code'] == 200, init
+    return init
+
+
+def upload(client, template, content, question_index=0, filename='answer.jpg'):
+    """按 init/chunk/finalize 顺序上传一个答案文件，返回 finalize 的结果"""
+    init = init_upload(client, template, content, question_index, filename)
+    chunk_size = init['chunk_size']
+    for index in range(init['chunk_count']):
+        chunk = content[index * chunk_size:(index + 1) * chunk_size]
+        assert client.put(f"/api/upload/{init['upload_id']}/chunk/{index}", data=chunk).get_json()['code'] == 200
+    return client.post(f"/api/upload/{init['upload_id']}/finalize").get_json()
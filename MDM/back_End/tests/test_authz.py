@@ -0,0 +1,34 @@
+from flask import session
+
+import authz
+from conftest import add_class, add_teacher, login
+
+
+def test_cached_ids_are_bounded(app):
+    teacher = add_teacher()
+    class_ids = [add_class(teacher, name=f'Class {n}').cid for n in range(authz.MAX_CACHED_IDS + 20)]
+    with app.test_request_context():
+        session['user_id'], session['is_teacher'] = teacher.tid, True
+        assert all(authz.teacher_owns_class(teacher.tid, class_id) for class_id in class_ids)
+        cached = session['authz'][authz.CLASSES]
+        assert cached == class_ids[-authz.MAX_CACHED_IDS:]
+        # 被淘汰的 id 回查数据库
+        assert authz.teacher_owns_class(teacher.tid, class_ids[0])
+
+
+def test_delete_invalidates_other_sessions(make_client):
+    first, second, other = make_client(), make_client(), make_client()
+    teacher, other_teacher = add_teacher('teacher1'), add_teacher('teacher2')
+    class_id = add_class(teacher).cid
+    login(first, 'teacher1')
+    login(second, 'teacher1')
+    login(other, 'teacher2')
+    assert first.post(f'/class/info/{class_id}', json={'teacher_id': teacher.tid}).get_json()['code'] == 200
+
+    assert second.post('/class/delete', json={'teacher_id': teacher.tid, 'classId': class_id}).get_json()['code'] == 200
+    # sqlite 会复用被删除的最大 id
+    reused = other.post('/class/create', json={'teacher_id': other_teacher.tid, 'name': 'Other', 'studentNum': 1}).get_json()
+    assert reused['class_id'] == class_id
+    assert first.post(f'/class/info/{class_id}', json={'teacher_id': teacher.tid}).get_json()['code'] == 403
+    assert other.post(f'/class/info/{class_id}', json={'teacher_id': other_teacher.tid}).get_json()['code'] == 200
+
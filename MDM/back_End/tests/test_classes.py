@@ -0,0 +1,64 @@
+import api
+from conftest import add_class, add_student, add_teacher, login
+from model import db, Class, Student, StudentToClass
+
+
+def test_remove_student_updates_count_atomically(client, monkeypatch):
+    teacher = add_teacher()
+    class_obj = add_class(teacher, students=2)
+    students = [add_student(f's{n}', class_id=class_obj.cid) for n in (1, 2)]
+    login(client, teacher.account)
+    owns_class = api.teacher_owns_class
+
+    def concurrent_add(teacher_id, class_id):
+        # 本请求读取班级之后，另一个请求加入了学生
+        with db.engine.begin() as conn:
+            conn.execute(db.update(Class).where(Class.cid == class_id).values(studentNum=Class.studentNum + 1))
+        return owns_class(teacher_id, class_id)
+    monkeypatch.setattr(api, 'teacher_owns_class', concurrent_add)
+
+    response = client.post('/class/remove_student', json={
+        'teacher_id': teacher.tid, 'class_id': class_obj.cid, 'student_id': students[0].sid}).get_json()
+    assert response['code'] == 200
+    db.session.expire_all()
+    assert db.session.get(Class, class_obj.cid).studentNum == 2
+
+
+def test_roster_count_follows_writes_in_other_workers(client):
+    teacher = add_teacher()
+    class_obj = add_class(teacher, students=1)
+    add_student('s0', class_id=class_obj.cid)
+    login(client, teacher.account)
+    roster_url = f'/class/students/{class_obj.cid}'
+    assert client.post(roster_url, json={'teacher_id': teacher.tid}).get_json()['total'] == 1
+
+    # 另一个 worker 进程加入学生：只共享数据库和版本号存储，不共享本进程的缓存
+    db.session.add(StudentToClass(sid=add_student('s1').sid, cid=class_obj.cid))
+    db.session.commit()
+    assert client.post(roster_url, json={'teacher_id': teacher.tid}).get_json()['total'] == 1
+    api.response_cache.bump(('class', class_obj.cid))
+    assert client.post(roster_url, json={'teacher_id': teacher.tid}).get_json()['total'] == 2
+
+
+def test_roster_without_limit_returns_every_student(client):
+    teacher = add_teacher()
+    class_obj = add_class(teacher, students=150)
+    students = [Student(name=f'Student {n}', account=f's{n}', password='x', birth='2010-01-01', gender='Female')
+                for n in range(150)]
+    db.session.add_all(students)
+    db.session.flush()
+    db.session.add_all([StudentToClass(sid=student.sid, cid=class_obj.cid) for student in students])
+    db.session.commit()
+    login(client, teacher.account)
+    roster_url = f'/class/students/{class_obj.cid}'
+
+    # view.html 不分页，用完整名单填充学生选择和全选
+    response = client.post(roster_url, json={'teacher_id': teacher.tid}).get_json()
+    assert response['code'] == 200 and response['total'] == 150 and not response['has_more']
+    assert [student['student_id'] for student in response['data']] == [student.sid for student in students]
+
+    first = client.post(roster_url, json={'teacher_id': teacher.tid, 'limit': 100}).get_json()
+    rest = client.post(roster_url, json={'teacher_id': teacher.tid, 'limit': 100,
+                                         'cursor': first['next_cursor']}).get_json()
+    assert first['has_more'] and not rest['has_more']
+    assert [student['student_id'] for student in first['data'] + rest['data']] == [student.sid for student in students]
@@ -0,0 +1,62 @@
+import io
+import zipfile
+
+import pytest
+
+from conftest import login, upload
+
+
+@pytest.fixture
+def export_url(make_client, template):
+    for index, student in enumerate(template['students']):
+        client = make_client()
+        login(client, student.account, teacher=False)
+        assert upload(client, template, bytes([index]) * 3000, question_index=0)['code'] == 200
+        assert upload(client, template, b'second answer %d' % index, question_index=1)['code'] == 200
+    return f"/api/template/{template['id']}/answers/export"
+
+
+def test_export_zip(client, template, export_url):
+    login(client, template['teacher'].account)
+    response = client.get(export_url)
+    assert response.status_code == 200
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert int(response.headers['Content-Length']) == len(response.data)
+
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert archive.testzip() is None
+        names = sorted(archive.namelist())
+        assert len(names) == 4
+        student = template['students'][0]
+        assert names[0].startswith(f'{student.sid}_{student.name}/')
+        assert archive.read(names[0]) in (bytes([0]) * 3000, b'second answer 0')
+
+
+def test_export_range_matches_full_archive(client, template, export_url):
+    login(client, template['teacher'].account)
+    full = client.get(export_url)
+    etag = full.headers['ETag'].strip('"')
+
+    # 起点分别落在本地文件头、文件内容和中央目录中
+    for start, stop in [(0, 99), (40, 3100), (len(full.data) - 200, len(full.data) - 1)]:
+        response = client.get(export_url, headers={'Range': f'bytes={start}-{stop}'})
+        assert response.status_code == 206
+        assert response.headers['Content-Range'] == f'bytes {start}-{stop}/{len(full.data)}'
+        assert response.data == full.data[start:stop + 1]
+
+    suffix = client.get(export_url, headers={'Range': 'bytes=-50'})
+    assert suffix.status_code == 206 and suffix.data == full.data[-50:]
+
+    assert client.get(export_url, headers={'If-None-Match': f'"{etag}"'}).status_code == 304
+    # If-Range 不匹配时返回完整归档
+    stale = client.get(export_url, headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert stale.status_code == 200 and stale.data == full.data
+
+    unsatisfiable = client.get(export_url, headers={'Range': f'bytes={len(full.data)}-'})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers['Content-Range'] == f'bytes */{len(full.data)}'
+
+
+def test_export_requires_template_owner(client, template, export_url):
+    login(client, 'student1', teacher=False)
+    assert client.get(export_url).get_json()['code'] == 403
@@ -0,0 +1,104 @@
+import pytest
+
+import migrations
+from model import db
+
+# 首个版本的表结构（迁移之前已部署的数据库），只保留迁移涉及的列
+BASELINE_DDL = [
+    'CREATE TABLE student (sid INTEGER PRIMARY KEY, name VARCHAR(80) NOT NULL, account VARCHAR(80) NOT NULL UNIQUE, '
+    'password VARCHAR(256) NOT NULL, birth VARCHAR(80) NOT NULL, gender VARCHAR(80) NOT NULL, vp_id VARCHAR(100) UNIQUE)',
+    'CREATE TABLE teacher (tid INTEGER PRIMARY KEY, name VARCHAR(80) NOT NULL, account VARCHAR(80) NOT NULL UNIQUE, '
+    'password VARCHAR(256) NOT NULL, birth VARCHAR(80) NOT NULL, gender VARCHAR(80) NOT NULL, '
+    'email VARCHAR(80) NOT NULL, phone VARCHAR(80) NOT NULL)',
+    'CREATE TABLE class (cid INTEGER PRIMARY KEY, name VARCHAR(80) NOT NULL, "studentNum" INTEGER NOT NULL)',
+    'CREATE TABLE teacher_class (id INTEGER PRIMARY KEY, tid INTEGER, cid INTEGER)',
+    'CREATE TABLE student_class (id INTEGER PRIMARY KEY, sid INTEGER, cid INTEGER)',
+    'CREATE TABLE visionpro (vp_id INTEGER PRIMARY KEY, owner_name VARCHAR(80), owner_id INTEGER UNIQUE, '
+    'teacher_id INTEGER, "curState" VARCHAR(80) NOT NULL)',
+    'CREATE TABLE template (temid INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, "startTime" VARCHAR(20), '
+    '"endTime" VARCHAR(20), description TEXT)',
+    'CREATE TABLE teacher_template (id INTEGER PRIMARY KEY, tid INTEGER, temid INTEGER)',
+    'CREATE TABLE student_template (id INTEGER PRIMARY KEY, sid INTEGER, temid INTEGER, "isSubmitted" BOOLEAN, '
+    '"totalTime" INTEGER, score VARCHAR(20))',
+    'CREATE TABLE question_file (id INTEGER PRIMARY KEY, "questionFileName" VARCHAR(255) NOT NULL UNIQUE, '
+    '"questionFilePath" VARCHAR(255) NOT NULL UNIQUE, upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+    'CREATE TABLE answer_file (id INTEGER PRIMARY KEY, "answerFileName" VARCHAR(255) NOT NULL UNIQUE, '
+    '"answerFilePath" VARCHAR(255) NOT NULL UNIQUE, upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+    'CREATE TABLE template_to_answer_file (id INTEGER PRIMARY KEY, temid INTEGER, aid INTEGER)',
+    'CREATE TABLE template_to_question_file (id INTEGER PRIMARY KEY, temid INTEGER, qid INTEGER)',
+]
+
+BASELINE_DATA = [
+    "INSERT INTO template (temid, name) VALUES (1, 'Template 1')",
+    "INSERT INTO question_file (id, \"questionFileName\", \"questionFilePath\") VALUES (1, '11.jpg', 'q/1.jpg')",
+    "INSERT INTO template_to_question_file (temid, qid) VALUES (1, 1)",
+    # 旧 create_template 的答案命名 "{temid}{sid}{问题名}"
+    "INSERT INTO answer_file (id, \"answerFileName\", \"answerFilePath\") VALUES (1, '151.jpg', 'a/1.jpg')",
+    "INSERT INTO template_to_answer_file (temid, aid) VALUES (1, 1)",
+]
+
+
+@pytest.fixture
+def baseline_db(app):
+    db.drop_all()
+    with db.engine.begin() as conn:
+        migrations.version_metadata.drop_all(conn)
+        for statement in BASELINE_DDL + BASELINE_DATA:
+            conn.exec_driver_sql(statement)
+    yield
+    with db.engine.begin() as conn:
+        migrations.version_metadata.drop_all(conn)
+    db.drop_all()
+    db.create_all()
+
+
+def index_names(table_name):
+    return {index['name'] for index in db.inspect(db.engine).get_indexes(table_name)}
+
+
+def test_upgrade_baseline_database(baseline_db):
+    applied = migrations.upgrade()
+    assert applied == [number for number, _, _ in migrations.MIGRATIONS]
+
+    assert {'uq_student_class_cid_sid', 'ix_student_class_sid'} <= index_names('student_class')
+    assert 'ix_student_name' in index_names('student')
+    assert {'uq_answer_file_qid_sid', 'ix_answer_file_sha256'} <= index_names('answer_file')
+    assert 'ix_question_file_sha256' in index_names('question_file')
+    assert 'ix_visionpro_teacher_id' in index_names('visionpro')
+
+    with db.engine.connect() as conn:
+        assert conn.exec_driver_sql('SELECT sid, qid, sha256 FROM answer_file WHERE id = 1').one() == (5, 1, None)
+        assert migrations.current_version(conn) == migrations.MIGRATIONS[-1][0]
+    # 已是最新版本时不再执行
+    assert migrations.upgrade() == []
+
+
+def test_upgrade_rejects_duplicate_links(baseline_db):
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('INSERT INTO student_class (sid, cid) VALUES (1, 1), (1, 1)')
+    with pytest.raises(RuntimeError, match='student_class'):
+        migrations.upgrade()
+
+
+def test_upgrade_fresh_database(app):
+    migrations.upgrade()
+    with db.engine.connect() as conn:
+        assert migrations.current_version(conn) == migrations.MIGRATIONS[-1][0]
+
+
+def test_check_passes_on_upgraded_schema(app):
+    migrations.upgrade()
+    assert migrations.check() == []
+
+
+def test_check_reports_full_scans(app):
+    migrations.upgrade()
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('DROP INDEX uq_student_class_cid_sid')
+        conn.exec_driver_sql('DROP INDEX ix_visionpro_teacher_id')
+    # EXPLAIN QUERY PLAN 不会让连接池中的其他连接重新读取表结构
+    db.engine.dispose()
+    failures = dict(migrations.check())
+    assert {'class roster', 'teacher devices'} <= set(failures)
+    assert any('student_class' in scan for scan in failures['class roster'])
+    assert 'teacher classes' not in failures
@@ -0,0 +1,33 @@
+import pytest
+
+from passwords import PasswordHasher, PasswordHasherBusy
+
+
+def test_pool_does_not_fork():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', pool_size=1)
+    assert hasher.start_method in ('forkserver', 'spawn')
+    stored = hasher.hash('secret')
+    assert hasher.verify(stored, 'secret') and not hasher.verify(stored, 'wrong')
+    hasher._executor.shutdown()
+
+
+def test_result_timeout_keeps_slot_until_work_finishes():
+    hasher = PasswordHasher(method='pbkdf2:sha256:300000', pool_size=1, max_pending=0, timeout=0.01)
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash('secret')
+    # 超时的任务仍在子进程中执行，占着唯一的位置，新的请求被拒绝
+    assert hasher.stats()['timed_out'] == 1 and hasher.stats()['in_flight'] == 1
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash('secret')
+    assert hasher.stats()['rejected'] == 1
+
+    hasher._executor.shutdown(wait=True)
+    stats = hasher.stats()
+    assert stats['in_flight'] == 0 and stats['completed'] == 0 and stats['timed_out'] == 1
+
+
+@pytest.mark.parametrize('method', ['scrypt', 'pbkdf2', 'pbkdf2:sha256', 'pbkdf2:sha256:1000'])
+def test_own_hashes_do_not_need_rehash(method):
+    hasher = PasswordHasher(method=method, pool_size=0)
+    assert not hasher.needs_rehash(hasher.hash('secret'))
+    assert hasher.needs_rehash(PasswordHasher(method='pbkdf2:sha256:2000', pool_size=0).hash('secret'))
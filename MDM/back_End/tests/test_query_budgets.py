@@ -0,0 +1,88 @@
+"""
+热点接口的查询次数上限：数据量比上限大得多，出现按行查询（N+1）时会超出
+"""
+import os
+
+import pytest
+
+import api
+from conftest import PASSWORD, login
+from db_profiler import query_budget
+from model import db, AnswerFile, QuestionFile, TemplateToAnswerFile, TemplateToQuestionFile
+from seed import Layout, seed
+
+STUDENTS = 30
+TEMPLATES = 20
+QUESTIONS = 5
+DEVICES = 25
+
+
+@pytest.fixture
+def layout(client):
+    layout = Layout(1, 2, STUDENTS, TEMPLATES, QUESTIONS, DEVICES)
+    seed(layout, teacher_password=PASSWORD, student_password=PASSWORD, create_files=False,
+         upload_folder=api.UPLOAD_FOLDER)
+    login(client, layout.teacher_account(1))
+    # 会话中第一次校验某个班级的归属时查库，不计入各接口的查询次数
+    class_id = next(iter(layout.class_ids(1)))
+    assert client.post(f'/class/info/{class_id}', json={'teacher_id': 1}).get_json()['code'] == 200
+    return layout
+
+
+def test_teacher_templates(client, layout):
+    with query_budget(2):
+        response = client.post('/api/teacher/templates', json={'teacher_id': 1}).get_json()
+    assert response['code'] == 200 and len(response['data']) == TEMPLATES
+
+
+def test_create_template(client, layout):
+    class_id = next(iter(layout.class_ids(1)))
+    with query_budget(16):
+        response = client.post('/api/template/create', json={
+            'teacher_id': 1, 'name': 'Budget', 'student_ids': list(layout.student_ids(class_id)),
+            'question_names': [f'{number}.jpg' for number in range(QUESTIONS * 4)],
+        }).get_json()
+    assert response['code'] == 200
+
+
+def test_student_answers(client, layout):
+    template_id = next(iter(layout.template_ids(1)))
+    student_id = next(iter(layout.student_ids(layout.template_class(template_id))))
+    with query_budget(4):
+        response = client.post('/api/template/student/answers',
+                               json={'template_id': template_id, 'student_id': student_id}).get_json()
+    assert response['code'] == 200 and len(response['data']['questions']) == QUESTIONS
+
+
+def test_class_roster(client, layout):
+    class_id = next(iter(layout.class_ids(1)))
+    with query_budget(3):
+        response = client.post(f'/class/students/{class_id}', json={'teacher_id': 1}).get_json()
+    assert response['code'] == 200 and len(response['data']) == response['total'] == STUDENTS
+    # 人数已缓存，翻页不再 COUNT
+    with query_budget(2):
+        response = client.post(f'/class/students/{class_id}', json={'teacher_id': 1, 'limit': 10}).get_json()
+    assert response['code'] == 200 and response['has_more']
+
+
+def test_device_inventory(client, layout):
+    with query_budget(1):
+        response = client.post('/vp/info', json={'teacher_id': 1}).get_json()
+    assert response['code'] == 200 and len(response['data']) == DEVICES
+
+
+def test_delete_template(client, layout):
+    template_id = next(iter(layout.template_ids(1)))
+    # 每个文件都存在且有内容哈希，逐个检查 blob 引用时查询次数随文件数增长
+    for model, path_column, link, column in [
+            (QuestionFile, QuestionFile.questionFilePath, TemplateToQuestionFile, TemplateToQuestionFile.qid),
+            (AnswerFile, AnswerFile.answerFilePath, TemplateToAnswerFile, TemplateToAnswerFile.aid)]:
+        ids = db.select(column).where(link.temid == template_id)
+        db.session.execute(db.update(model).where(model.id.in_(ids)).values(sha256=db.func.printf('%064d', model.id)))
+        for (path,) in db.session.execute(db.select(path_column).where(model.id.in_(ids))):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'wb').close()
+    db.session.commit()
+    with query_budget(16):
+        response = client.post('/api/template/delete', json={'template_id': template_id}).get_json()
+    assert response['code'] == 200
@@ -0,0 +1,130 @@
+import os
+import time
+
+import pytest
+
+import api
+from conftest import login, upload
+from model import db, AnswerFile, TemplateToAnswerFile
+from reaper import Reaper
+
+
+def make_reaper(upload_dir, **options):
+    options = dict(dict(grace=0, rate=0, upload_max_age=3600), **options)
+    return Reaper(api.app, upload_dir, api.QUESTION_FOLDER, api.ANSWER_FOLDER, api.blob_store,
+                  api.chunked_uploads, **options)
+
+
+def write(path, content=b'stray'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+@pytest.fixture
+def uploaded(client, template):
+    login(client, 'student1', teacher=False)
+    result = upload(client, template, b'kept answer' * 20)
+    assert result['code'] == 200
+    record = db.session.get(AnswerFile, result['file_id'])
+    return {'id': record.id, 'path': record.answerFilePath, 'sha256': record.sha256}
+
+
+def test_orphan_files_are_quarantined(upload_dir, uploaded):
+    orphan = write(os.path.join(api.ANSWER_FOLDER, 'ff', 'ff', 'orphan.jpg'))
+    report = make_reaper(upload_dir).run()
+
+    assert report['orphan_files'] == 1 and report['quarantined'] == 1
+    assert not os.path.exists(orphan)
+    quarantined = [os.path.join(directory, name) for directory, _, names
+                   in os.walk(os.path.join(upload_dir, '.quarantine')) for name in names]
+    assert [os.path.basename(path) for path in quarantined] == ['orphan.jpg']
+    # 有记录的文件和它的 blob 保留
+    assert os.path.exists(uploaded['path']) and api.blob_store.exists(uploaded['sha256'])
+
+
+def test_recent_files_are_protected(upload_dir, uploaded):
+    orphan = write(os.path.join(api.ANSWER_FOLDER, 'ff', 'ff', 'orphan.jpg'))
+    # 保护期按 mtime 和 ctime 中较新的计算，刚写入或刚建立硬链接的文件都不处理
+    age(orphan, 7200)
+    report = make_reaper(upload_dir, grace=3600, mode='delete').run()
+    assert report['orphan_files'] == 0 and os.path.exists(orphan)
+
+
+def test_unlinked_rows_and_their_blobs_are_removed(upload_dir, uploaded):
+    TemplateToAnswerFile.query.filter_by(aid=uploaded['id']).delete()
+    db.session.commit()
+
+    report = make_reaper(upload_dir, mode='delete').run()
+    assert report['orphan_rows'] == 1 and report['orphan_files'] == 1 and report['orphan_blobs'] == 1
+    assert db.session.get(AnswerFile, uploaded['id']) is None
+    assert not os.path.exists(uploaded['path']) and not api.blob_store.exists(uploaded['sha256'])
+
+
+def test_stale_uploads_are_discarded(upload_dir, client, template):
+    login(client, 'student1', teacher=False)
+    stale = client.post(f"/api/template/{template['id']}/upload/init", json={
+        'kind': 'answer', 'filename': 'a.jpg', 'size': 10, 'question_id': template['questions'][0]}).get_json()
+    active = client.post(f"/api/template/{template['id']}/upload/init", json={
+        'kind': 'answer', 'filename': 'b.jpg', 'size': 10, 'question_id': template['questions'][1]}).get_json()
+    stale_dir = os.path.join(api.chunked_uploads.root, stale['upload_id'])
+    for name in ['.', 'meta.json', 'data.part', 'chunks']:
+        age(os.path.join(stale_dir, name), 7200)
+
+    report = make_reaper(upload_dir).run()
+    assert report['stale_uploads'] == 1 and not os.path.exists(stale_dir)
+    assert client.get(f"/api/upload/{active['upload_id']}").get_json()['code'] == 200
+
+
+def test_dry_run_changes_nothing(upload_dir, uploaded):
+    orphan = write(os.path.join(api.ANSWER_FOLDER, 'ff', 'ff', 'orphan.jpg'))
+    TemplateToAnswerFile.query.filter_by(aid=uploaded['id']).delete()
+    db.session.commit()
+
+    report = make_reaper(upload_dir, dry_run=True, mode='delete').run()
+    assert report['dry_run'] and report['orphan_rows'] == 1 and report['orphan_files'] == 1
+    assert report['quarantined'] == 0 and report['bytes_reclaimed'] == 0
+    assert os.path.exists(orphan) and os.path.exists(uploaded['path'])
+    assert db.session.get(AnswerFile, uploaded['id']) is not None
+
+
+def test_dry_run_reports_orphans_next_to_live_file(upload_dir, uploaded):
+    directory = os.path.dirname(uploaded['path'])
+    orphans = [write(os.path.join(directory, name)) for name in ['orphan1.jpg', 'orphan2.jpg']]
+
+    report = make_reaper(upload_dir, dry_run=True, mode='delete').run()
+    assert report['skipped_folders'] == [] and report['orphan_files'] == 2
+    assert all(os.path.exists(path) for path in orphans + [uploaded['path']])
+
+
+def test_folder_with_unmatched_paths_is_skipped(upload_dir, client, template, uploaded):
+    second = upload(client, template, b'second answer' * 20, question_index=1)
+    record = db.session.get(AnswerFile, second['file_id'])
+    stored_path = record.answerFilePath
+    # 同一个文件换一种写法存储，遍历得到的路径与之不完全相同
+    record.answerFilePath = os.path.join(api.ANSWER_FOLDER, '.', os.path.relpath(stored_path, api.ANSWER_FOLDER))
+    db.session.commit()
+    orphan = write(os.path.join(api.ANSWER_FOLDER, 'ff', 'ff', 'orphan.jpg'))
+
+    report = make_reaper(upload_dir, mode='delete').run()
+    # 另一条记录的路径能对上，也不能据此处理整个目录
+    assert report['skipped_folders'] == [api.ANSWER_FOLDER] and report['orphan_files'] == 0
+    assert os.path.exists(stored_path) and os.path.exists(orphan) and os.path.exists(uploaded['path'])
+
+
+def test_missing_files_are_reported_without_blocking(upload_dir, client, template, uploaded):
+    second = upload(client, template, b'second answer' * 20, question_index=1)
+    missing = db.session.get(AnswerFile, second['file_id']).answerFilePath
+    # 记录的文件被手动删除或恢复备份时丢失
+    os.remove(missing)
+    orphan = write(os.path.join(api.ANSWER_FOLDER, 'ff', 'ff', 'orphan.jpg'))
+
+    report = make_reaper(upload_dir, mode='delete').run()
+    assert report['skipped_folders'] == [] and report['missing_files'] == [missing]
+    assert report['orphan_files'] == 1 and not os.path.exists(orphan) and os.path.exists(uploaded['path'])
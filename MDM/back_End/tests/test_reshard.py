@@ -0,0 +1,47 @@
+import os
+import uuid
+
+import api
+from model import db, QuestionFile
+from reshard import reshard_table
+from upload_paths import is_sharded
+
+
+def test_is_sharded(tmp_path):
+    folder = str(tmp_path)
+    token = uuid.uuid4().hex
+    assert is_sharded(os.path.join(folder, token[:2], token[2:4], f'{token}_a.pdf'), folder)
+    assert is_sharded(api.placeholder_path('a.pdf'), api.QUESTION_FOLDER)
+    # 形如 xx/xx/ 但前缀不是由文件名推出的旧路径
+    assert not is_sharded(os.path.join(folder, 'ab', 'cd', 'a.pdf'), folder)
+    assert not is_sharded(os.path.join(folder, 'ab', 'cd', f'{token}_a.pdf'), folder)
+    assert not is_sharded(os.path.join(folder, f'{token}_a.pdf'), folder)
+
+
+def test_reshard_moves_legacy_files(app):
+    folder = api.QUESTION_FOLDER
+    token = uuid.uuid4().hex
+    paths = {
+        'legacy.pdf': os.path.join(folder, 'legacy.pdf'),
+        'nested.pdf': os.path.join(folder, 'ab', 'cd', 'nested.pdf'),
+        'sharded.pdf': os.path.join(folder, token[:2], token[2:4], f'{token}_sharded.pdf'),
+    }
+    for name, path in paths.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(name)
+        db.session.add(QuestionFile(questionFileName=name, questionFilePath=path))
+    db.session.commit()
+
+    stats = {'moved': 0, 'pending': 0, 'skipped': 0, 'outside': 0}
+    reshard_table(QuestionFile.__table__, 'questionFilePath', folder, 10, 0, False, stats)
+    assert stats['moved'] == 2
+
+    db.session.expire_all()
+    for record in QuestionFile.query.all():
+        assert is_sharded(record.questionFilePath, folder)
+        with open(record.questionFilePath) as f:
+            assert f.read() == record.questionFileName
+    assert QuestionFile.query.filter_by(questionFileName='sharded.pdf').one().questionFilePath == paths['sharded.pdf']
+    assert not os.path.exists(paths['nested.pdf'])
+    assert not os.path.exists(os.path.join(folder, 'ab'))
@@ -0,0 +1,93 @@
+import io
+
+import pytest
+
+from conftest import add_class, add_student, add_teacher, login
+from model import db, Class, Student, StudentToClass
+from roster_import import RosterError, parse_roster, plan_import
+
+
+def csv_file(text):
+    return io.BytesIO(text.encode('utf-8'))
+
+
+def test_parse_roster():
+    stream = csv_file('﻿Account,Name,Gender,Birth,Password\n'
+                      's1, Amy ,Female,2010-01-01,\n'
+                      '\n'
+                      's2,,Male,2010-01-01,pw\n'
+                      's1,Amy again,Female,2010-01-01,\n'
+                      's3,' + 'x' * 81 + ',Male,2010-01-01,\n'
+                      's4,Bob,Male,2010-02-02,pw\n'
+                      's5,Bob,Male,2010-02-02,pw\n')
+    records, errors = parse_roster('roster.csv', stream, max_rows=10)
+
+    assert [(line, record['account'], record['name']) for line, record in records] == [(2, 's1', 'Amy'), (7, 's4', 'Bob')]
+    assert records[1][1]['password'] == 'pw'
+    assert [(error['row'], error['message']) for error in errors] == [
+        (4, 'missing name'),
+        (5, 'duplicate account, first used in row 2'),
+        (6, 'name longer than 80 characters'),
+        (8, 'duplicate name, first used in row 7'),
+    ]
+
+
+@pytest.mark.parametrize('filename, text, message', [
+    ('roster.txt', 'name\n', 'unsupported file type'),
+    ('roster.csv', '', 'empty file'),
+    ('roster.csv', 'name,account\n', 'missing columns: birth, gender'),
+    ('roster.csv', 'name,account,birth,gender\n' + 'a,b,c,d\n' * 3, 'too many rows'),
+])
+def test_parse_roster_rejects_file(filename, text, message):
+    with pytest.raises(RosterError, match=message):
+        parse_roster(filename, csv_file(text), max_rows=2)
+
+
+def test_plan_import(app):
+    teacher = add_teacher('teacher1', name='Ms Smith')
+    class_obj = add_class(teacher)
+    enrolled = add_student('enrolled', class_id=class_obj.cid)
+    other = add_student('other', name='Amy')
+    records = [(line, {'account': account, 'name': name}) for line, (account, name) in enumerate([
+        ('new', 'New'), ('teacher1', 'T'), ('enrolled', 'E'), ('other', 'Amy'),
+        ('amy2', 'Amy'), ('smith', 'Ms Smith'),
+    ], start=2)]
+
+    new_students, existing_ids, errors = plan_import(class_obj.cid, records, on_existing='error')
+    assert [record['account'] for _, record in new_students] == ['new']
+    assert existing_ids == []
+    # 与注册接口一致，姓名在学生和老师中都不能重复
+    assert [(error['row'], error['message']) for error in errors] == [
+        (3, 'account already exists'), (4, 'account already exists'), (5, 'account already exists'),
+        (6, 'name already exists'), (7, 'name already exists')]
+
+    new_students, existing_ids, errors = plan_import(class_obj.cid, records, on_existing='enroll')
+    assert existing_ids == [other.sid]
+    assert [(error['row'], error['message']) for error in errors] == [
+        (3, 'account already exists'), (4, 'student already in this class'),
+        (6, 'name already exists'), (7, 'name already exists')]
+    assert enrolled.sid not in existing_ids
+
+
+def test_import_endpoint(client):
+    teacher = add_teacher()
+    class_obj = add_class(teacher, students=1)
+    add_student('s0', class_id=class_obj.cid)
+    login(client, teacher.account)
+    roster = 'name,account,birth,gender\nAmy,s1,2010-01-01,Female\nBob,s2,2010-01-01,Male\nZed,s0,2010-01-01,Male\n'
+
+    dry_run = client.post(f'/class/{class_obj.cid}/students/import', data={
+        'file': (csv_file(roster), 'roster.csv'), 'password': 'initial', 'dry_run': '1'}).get_json()
+    assert dry_run['code'] == 200 and dry_run['created'] == 2 and len(dry_run['errors']) == 1
+    assert Student.query.count() == 1
+
+    response = client.post(f'/class/{class_obj.cid}/students/import', data={
+        'file': (csv_file(roster), 'roster.csv'), 'password': 'initial'}).get_json()
+    assert response['code'] == 200 and response['created'] == 2
+    assert response['errors'] == [{'row': 4, 'account': 's0', 'message': 'account already exists'}]
+    db.session.expire_all()
+    assert db.session.get(Class, class_obj.cid).studentNum == 3
+    assert StudentToClass.query.filter_by(cid=class_obj.cid).count() == 3
+    assert client.post(f'/class/students/{class_obj.cid}', json={'teacher_id': teacher.tid}).get_json()['total'] == 3
+    assert client.post('/student/login', json={'account': 's1', 'password': 'initial'}).get_json()['code'] == 200
+
@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+
+import api
+from conftest import BACKEND_DIR
+from model import db, Student, Teacher
+from seed import Layout, seed
+
+
+def test_seeded_names_are_unique(app):
+    seed(Layout(3, 2, 40, 1, 1, 0), create_files=False, upload_folder=api.UPLOAD_FOLDER)
+    names = [name for (name,) in db.session.query(Teacher.name).union_all(db.session.query(Student.name))]
+    assert len(names) == 3 + 3 * 2 * 40 and len(set(names)) == len(names)
+
+
+def test_seed_does_not_import_api(tmp_path):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + str(tmp_path / 'seed.db'))
+    result = subprocess.run([sys.executable, '-c', "import sys, seed; print('api' in sys.modules)"],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
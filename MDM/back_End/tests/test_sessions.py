@@ -0,0 +1,40 @@
+import time
+
+from session_store import CachedSessionStore, SQLiteSessionStore
+
+
+def test_cached_records_follow_other_workers(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    # 两个 worker 进程：共享 sqlite 文件，各有自己的进程内缓存
+    worker_a = CachedSessionStore(SQLiteSessionStore(path))
+    worker_b = CachedSessionStore(SQLiteSessionStore(path))
+    expires_at = time.time() + 3600
+
+    worker_a.save('sid', b'{"user_id": 1}', expires_at)
+    assert worker_b.load('sid')[0] == b'{"user_id": 1}'
+
+    # A 写入后 B 不再使用缓存中的旧内容，B 的下一次保存也就不会覆盖 A 的修改
+    worker_a.save('sid', b'{"user_id": 1, "authz": {}}', expires_at)
+    assert worker_b.load('sid')[0] == b'{"user_id": 1, "authz": {}}'
+
+    # 续期同样更新其他 worker 看到的过期时间
+    worker_a.touch('sid', expires_at + 60)
+    assert worker_b.load('sid')[1] == expires_at + 60
+
+    # A 中登出后 B 不能再用缓存通过认证
+    worker_a.delete('sid')
+    assert worker_b.load('sid') is None
+
+
+def test_adds_version_column_to_existing_table(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    store = SQLiteSessionStore(path)
+    conn = store._conn()
+    conn.execute('DROP TABLE sessions')
+    conn.execute('CREATE TABLE sessions (sid TEXT PRIMARY KEY, payload BLOB NOT NULL, expires_at REAL NOT NULL)')
+    conn.execute("INSERT INTO sessions VALUES ('old', x'7b7d', 1e12)")
+
+    store = CachedSessionStore(SQLiteSessionStore(path))
+    assert store.load('old')[0] == b'{}'
+    store.save('new', b'{}', 1e12)
+    assert store.load('new')[2] == store.store.version('new')
@@ -0,0 +1,17 @@
+from conftest import add_class, add_student, add_teacher, login
+
+
+def test_create_template_keeps_question_order(client):
+    teacher = add_teacher()
+    class_obj = add_class(teacher)
+    students = [add_student(f'student{n}', class_id=class_obj.cid) for n in range(1, 4)]
+    login(client, teacher.account)
+    names = ['q3.jpg', 'q10.jpg', 'q2.jpg', 'a1.jpg']
+    template_id = client.post('/api/template/create', json={
+        'teacher_id': teacher.tid, 'name': 'Quiz', 'question_names': names,
+        'student_ids': [student.sid for student in students],
+    }).get_json()['template_id']
+
+    detail = client.post('/api/template/detail', json={'template_id': template_id}).get_json()['data']
+    assert [question['question_name'] for question in detail['questions']] == [f'{template_id}_{name}' for name in names]
+    assert [student['student_id'] for student in detail['students']] == [student.sid for student in students]
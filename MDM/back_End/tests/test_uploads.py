@@ -0,0 +1,155 @@
+import hashlib
+import io
+import os
+
+import api
+from conftest import add_teacher, init_upload, login, upload
+from model import AnswerFile
+from uploads import ChunkedUploads
+
+
+def answer_record(student, question_id):
+    return AnswerFile.query.filter_by(sid=student.sid, qid=question_id).one()
+
+
+def test_chunked_upload_replaces_answer(client, template):
+    content = bytes(range(256)) * 10  # 1024 字节一块，共 3 块
+    login(client, 'student1', teacher=False)
+    result = upload(client, template, content)
+    assert result['code'] == 200
+    assert result['sha256'] == hashlib.sha256(content).hexdigest()
+
+    record = answer_record(template['students'][0], template['questions'][0])
+    assert record.id == result['file_id'] and record.sha256 == result['sha256']
+    with open(record.answerFilePath, 'rb') as f:
+        assert f.read() == content
+    download = client.get(f"/api/template/file/answer/{record.id}")
+    assert download.status_code == 200 and download.data == content
+
+
+def test_resume_after_interruption(client, template):
+    content = b'abcdef' * 500
+    login(client, 'student1', teacher=False)
+    init = init_upload(client, template, content)
+    upload_id, chunk_size = init['upload_id'], init['chunk_size']
+    chunks = [content[index * chunk_size:(index + 1) * chunk_size] for index in range(init['chunk_count'])]
+
+    # 乱序上传一部分后中断
+    assert client.put(f'/api/upload/{upload_id}/chunk/2', data=chunks[2]).get_json()['code'] == 200
+    assert client.put(f'/api/upload/{upload_id}/chunk/0', data=chunks[0]).get_json()['code'] == 200
+    finalize = client.post(f'/api/upload/{upload_id}/finalize').get_json()
+    assert finalize['code'] == 400 and 'missing chunks: [1]' in finalize['message']
+
+    status = client.get(f'/api/upload/{upload_id}').get_json()
+    assert status['received'] == [0, 2] and status['chunk_count'] == 3
+    for index in set(range(status['chunk_count'])) - set(status['received']):
+        assert client.put(f'/api/upload/{upload_id}/chunk/{index}', data=chunks[index]).get_json()['code'] == 200
+    result = client.post(f'/api/upload/{upload_id}/finalize').get_json()
+    assert result['code'] == 200 and result['sha256'] == hashlib.sha256(content).hexdigest()
+    # 完成后会话被清理
+    assert client.get(f'/api/upload/{upload_id}').get_json()['code'] == 404
+
+
+def test_chunk_validation(client, template):
+    content = b'x' * 1500
+    login(client, 'student1', teacher=False)
+    upload_id = init_upload(client, template, content)['upload_id']
+
+    assert client.put(f'/api/upload/{upload_id}/chunk/0', data=b'short').get_json()['code'] == 400
+    assert client.put(f'/api/upload/{upload_id}/chunk/5', data=b'x' * 1024).get_json()['code'] == 400
+    mismatch = client.put(f'/api/upload/{upload_id}/chunk/1', data=b'x' * 476,
+                          headers={'X-Chunk-SHA256': '0' * 64}).get_json()
+    assert mismatch['code'] == 400 and 'checksum' in mismatch['message']
+
+
+def test_upload_belongs_to_its_user(make_client, template):
+    owner, other = make_client(), make_client()
+    login(owner, 'student1', teacher=False)
+    upload_id = init_upload(owner, template, b'x' * 10)['upload_id']
+
+    login(other, 'student2', teacher=False)
+    assert other.get(f'/api/upload/{upload_id}').get_json()['code'] == 404
+    assert other.put(f'/api/upload/{upload_id}/chunk/0', data=b'y' * 10).get_json()['code'] == 404
+    assert other.delete(f'/api/upload/{upload_id}').get_json()['code'] == 404
+    assert owner.get(f'/api/upload/{upload_id}').get_json()['received'] == []
+
+
+def test_only_owning_teacher_can_init_uploads(make_client, template):
+    owner, other = make_client(), make_client()
+    add_teacher('teacher2')
+    login(other, 'teacher2')
+    url = f"/api/template/{template['id']}/upload/init"
+    question = {'kind': 'question', 'filename': 'q.jpg', 'size': 10}
+    answer = {'kind': 'answer', 'filename': 'a.jpg', 'size': 10, 'question_id': template['questions'][0],
+              'student_id': template['students'][0].sid}
+    assert other.post(url, json=question).get_json()['code'] == 403
+    assert other.post(url, json=answer).get_json()['code'] == 403
+
+    login(owner, template['teacher'].account)
+    assert owner.post(url, json=question).get_json()['code'] == 200
+    assert owner.post(url, json=answer).get_json()['code'] == 200
+
+
+def test_claimed_digest_does_not_link_existing_content(make_client, template):
+    owner, other = make_client(), make_client()
+    content = b'original answer' * 10
+    login(owner, 'student1', teacher=False)
+    assert upload(owner, template, content)['code'] == 200
+
+    login(other, 'student2', teacher=False)
+    init = other.post(f"/api/template/{template['id']}/upload/init", json={
+        'kind': 'answer', 'filename': 'copy.jpg', 'size': len(content),
+        'sha256': hashlib.sha256(content).hexdigest(), 'question_id': template['questions'][0],
+    }).get_json()
+    # 只知道哈希不能得到文件，必须上传数据
+    assert init['code'] == 200 and 'upload_id' in init and 'file_id' not in init
+    assert answer_record(template['students'][1], template['questions'][0]).sha256 is None
+
+
+def test_identical_uploads_share_one_blob(make_client, template):
+    first, second = make_client(), make_client()
+    content = b'same answer' * 50
+    login(first, 'student1', teacher=False)
+    login(second, 'student2', teacher=False)
+    assert upload(first, template, content)['code'] == 200
+    assert upload(second, template, content)['code'] == 200
+
+    paths = [answer_record(student, template['questions'][0]).answerFilePath for student in template['students']]
+    assert paths[0] != paths[1] and os.path.samefile(*paths)
+
+
+def test_finalize_keeps_upload_when_storing_fails(client, template, monkeypatch):
+    content = b'retry me' * 200
+    login(client, 'student1', teacher=False)
+    init = init_upload(client, template, content)
+    chunk_size = init['chunk_size']
+    for index in range(init['chunk_count']):
+        client.put(f"/api/upload/{init['upload_id']}/chunk/{index}", data=content[index * chunk_size:(index + 1) * chunk_size])
+
+    def fail(*args):
+        raise OSError('disk full')
+    with monkeypatch.context() as patch:
+        patch.setattr(api.blob_store, 'store_file', fail)
+        assert client.post(f"/api/upload/{init['upload_id']}/finalize").get_json()['code'] == 500
+    # 上传数据保留，修复后可以直接重试
+    assert client.get(f"/api/upload/{init['upload_id']}").get_json()['received'] == list(range(init['chunk_count']))
+    assert answer_record(template['students'][0], template['questions'][0]).sha256 is None
+
+    result = client.post(f"/api/upload/{init['upload_id']}/finalize").get_json()
+    assert result['code'] == 200 and result['sha256'] == hashlib.sha256(content).hexdigest()
+
+
+def test_hash_states_are_bounded(tmp_path):
+    uploads = ChunkedUploads(str(tmp_path), chunk_size=4, max_hash_states=2)
+    contents = [b'%04d' % n * 3 for n in range(5)]
+    upload_ids = [uploads.create({'size': len(content)}) for content in contents]
+    # 交替写入，较早的上传的哈希状态会被淘汰
+    for index in range(3):
+        for upload_id, content in zip(upload_ids, contents):
+            uploads.write_chunk(upload_id, index, io.BytesIO(content[index * 4:(index + 1) * 4]), 4)
+    assert len(uploads._hash_states) == 2
+
+    for upload_id, content in zip(upload_ids, contents):
+        assert uploads.assemble(upload_id)[2] == hashlib.sha256(content).hexdigest()
+        uploads.discard(upload_id)
+    assert len(uploads._hash_states) == 0
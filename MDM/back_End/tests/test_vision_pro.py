@@ -0,0 +1,29 @@
+from conftest import add_teacher, login
+from model import db, VisionPro
+
+DEVICES = 150
+
+
+def test_device_list(client):
+    teacher = add_teacher()
+    db.session.add_all([VisionPro(vp_id=vp_id, teacher_id=teacher.tid, curState='Not Assigned')
+                        for vp_id in range(1, DEVICES + 1)])
+    db.session.commit()
+    login(client, teacher.account)
+
+    # 不传 limit 时返回全部设备（manageVP.html 不分页）
+    response = client.post('/vp/info', json={'teacher_id': teacher.tid}).get_json()
+    assert response['code'] == 200 and not response['has_more'] and response['next_cursor'] is None
+    assert [vp['vp_id'] for vp in response['data']] == list(range(1, DEVICES + 1))
+
+    pages = []
+    cursor = None
+    while True:
+        response = client.post('/vp/info', json={'teacher_id': teacher.tid, 'limit': 60, 'cursor': cursor}).get_json()
+        assert response['code'] == 200
+        pages.append([vp['vp_id'] for vp in response['data']])
+        cursor = response['next_cursor']
+        if not response['has_more']:
+            break
+    assert [len(page) for page in pages] == [60, 60, 30]
+    assert sum(pages, []) == list(range(1, DEVICES + 1))
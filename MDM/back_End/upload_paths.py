@@ -0,0 +1,42 @@
+"""
+上传文件的目录布局
+
+问题和答案文件放在两级十六进制前缀的分散目录 folder/ab/cd 下，前缀取自：
+- 上传的文件：文件名前的 uuid（storage_path 生成的 "<uuid>_<原文件名>"）
+- 尚未上传的占位记录：文件名的 md5（placeholder_path）
+api.py 和离线脚本（reshard.py）共用这里的定义，脚本不需要导入 api。
+"""
+import hashlib
+import os
+import re
+
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads')
+QUESTION_FOLDER = os.path.join(UPLOAD_FOLDER, 'questions')
+ANSWER_FOLDER = os.path.join(UPLOAD_FOLDER, 'answers')
+
+UUID_PREFIX_PATTERN = re.compile(r'^([0-9a-f]{32})_')
+
+
+def shard_dir(folder, token):
+    """两级十六进制前缀分散目录 folder/ab/cd，token 为十六进制串，避免单个目录条目过多"""
+    return os.path.join(folder, token[:2], token[2:4])
+
+
+def placeholder_token(filename):
+    return hashlib.md5(filename.encode()).hexdigest()
+
+
+def placeholder_file_path(folder, filename):
+    """尚未上传的文件记录使用的路径，按文件名哈希分散"""
+    return os.path.join(shard_dir(folder, placeholder_token(filename)), filename)
+
+
+def is_sharded(path, folder):
+    """path 是否已位于按文件名推出的分散目录中"""
+    filename = os.path.basename(path)
+    tokens = [placeholder_token(filename)]
+    match = UUID_PREFIX_PATTERN.match(filename)
+    if match:
+        tokens.append(match.group(1))
+    directory = os.path.normpath(os.path.dirname(path))
+    return any(directory == os.path.normpath(shard_dir(folder, token)) for token in tokens)
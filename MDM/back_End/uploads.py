@@ -0,0 +1,228 @@
+"""
+可续传的分块上传
+
+每个上传会话对应 <root>/<upload_id>/ 目录：
+    meta.json      初始化时写入的元数据，之后只读
+    data.part      按 size 预分配的数据文件，各块按偏移直接写入
+    chunks/<n>     第 n 块写完后落盘的 sha256，用于断点续传时查询已收到的块
+
+块按 64KB 流式写盘，内存占用与文件大小无关。按顺序到达的块会同时喂给整文件的
+sha256（进程内状态），乱序到达的块在前面的块补齐后从磁盘追读。进程内状态数量有上限，
+长时间没有新块的会过期；状态丢失（过期、被淘汰或进程重启）后从磁盘重新追读，结果不变。
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+
+from cache import TTLCache
+
+READ_BLOCK_SIZE = 64 * 1024
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    """上传协议错误，code 与接口返回的 code 一致"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class _HashState:
+    """整文件 sha256 的增量计算状态，next_index 之前的块都已计入"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_index = 0
+        self.hasher = hashlib.sha256()
+
+
+class ChunkedUploads:
+
+    def __init__(self, root, chunk_size=4 * 1024 * 1024, max_size=2 * 1024 * 1024 * 1024,
+                 hash_state_ttl=3600, max_hash_states=10000):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        # 被放弃的上传不会调用 discard，状态靠过期和数量上限回收
+        self._hash_states = TTLCache(maxsize=max_hash_states, ttl=hash_state_ttl)
+        self._states_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    # 路径
+    def _dir(self, upload_id):
+        if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+            raise UploadError(404, "upload not found")
+        return os.path.join(self.root, upload_id)
+
+    def _data_path(self, upload_id):
+        return os.path.join(self._dir(upload_id), 'data.part')
+
+    def _chunk_marker(self, upload_id, index):
+        return os.path.join(self._dir(upload_id), 'chunks', str(index))
+
+    def chunk_count(self, meta):
+        return (meta['size'] + self.chunk_size - 1) // self.chunk_size
+
+    def chunk_length(self, meta, index):
+        return min(self.chunk_size, meta['size'] - index * self.chunk_size)
+
+    # 会话
+    def create(self, meta):
+        """初始化上传会话，返回 upload_id"""
+        size = meta.get('size')
+        if not isinstance(size, int) or size < 0:
+            raise UploadError(400, "invalid size")
+        if size > self.max_size:
+            raise UploadError(413, "file too large")
+        upload_id = uuid.uuid4().hex
+        directory = self._dir(upload_id)
+        os.makedirs(os.path.join(directory, 'chunks'))
+        meta = dict(meta, upload_id=upload_id, chunk_size=self.chunk_size)
+        with open(self._data_path(upload_id), 'wb') as f:
+            f.truncate(size)
+        tmp_path = os.path.join(directory, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(directory, 'meta.json'))
+        return upload_id
+
+    def load(self, upload_id):
+        try:
+            with open(os.path.join(self._dir(upload_id), 'meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError(404, "upload not found")
+
+    def received(self, upload_id):
+        """已收到的块序号"""
+        directory = os.path.join(self._dir(upload_id), 'chunks')
+        try:
+            return sorted(int(name) for name in os.listdir(directory) if name.isdigit())
+        except FileNotFoundError:
+            raise UploadError(404, "upload not found")
+
+    def discard(self, upload_id):
+        with self._states_lock:
+            self._hash_states.delete(upload_id)
+        shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+
+    # 分块
+    def _hash_state(self, upload_id):
+        with self._states_lock:
+            state = self._hash_states.get(upload_id) or _HashState()
+            # 每次使用都重新计时
+            self._hash_states.set(upload_id, state)
+            return state
+
+    def write_chunk(self, upload_id, index, stream, content_length, expected_sha256=None):
+        """把一块数据从请求流直接写到 data.part 对应偏移，返回该块的 sha256"""
+        meta = self.load(upload_id)
+        if not 0 <= index < self.chunk_count(meta):
+            raise UploadError(400, "invalid chunk index")
+        length = self.chunk_length(meta, index)
+        if content_length != length:
+            raise UploadError(400, f"chunk {index} must be {length} bytes")
+
+        state = self._hash_state(upload_id)
+        # 正好是下一个待计入的块时边写边计算整文件哈希
+        feed = state.lock.acquire(blocking=False)
+        if feed and (state.next_index != index or state.hasher is None):
+            state.lock.release()
+            feed = False
+
+        chunk_hasher = hashlib.sha256()
+        try:
+            with open(self._data_path(upload_id), 'r+b') as f:
+                f.seek(index * self.chunk_size)
+                remaining = length
+                while remaining > 0:
+                    block = stream.read(min(READ_BLOCK_SIZE, remaining))
+                    if not block:
+                        raise UploadError(400, "incomplete chunk")
+                    f.write(block)
+                    chunk_hasher.update(block)
+                    if feed:
+                        state.hasher.update(block)
+                    remaining -= len(block)
+            digest = chunk_hasher.hexdigest()
+            if expected_sha256 and expected_sha256.lower() != digest:
+                raise UploadError(400, f"chunk {index} checksum mismatch")
+        except Exception:
+            if feed:
+                # 整文件哈希已被污染，finalize 时重新计算
+                state.hasher = None
+                state.lock.release()
+            raise
+
+        marker = self._chunk_marker(upload_id, index)
+        if os.path.exists(marker):
+            with open(marker) as f:
+                if f.read() != digest and not feed:
+                    # 已计入哈希的块内容被改写
+                    with state.lock:
+                        if index < state.next_index:
+                            state.hasher = None
+        with open(marker + '.tmp', 'w') as f:
+            f.write(digest)
+        os.replace(marker + '.tmp', marker)
+
+        if feed:
+            state.next_index += 1
+        elif not state.lock.acquire(blocking=False):
+            return digest
+        try:
+            self._catch_up(upload_id, meta, state)
+        finally:
+            state.lock.release()
+        return digest
+
+    def _catch_up(self, upload_id, meta, state):
+        """从磁盘追读已到达但尚未计入整文件哈希的后续块（调用方持有 state.lock）"""
+        if state.hasher is None:
+            return
+        total = self.chunk_count(meta)
+        with open(self._data_path(upload_id), 'rb') as f:
+            while state.next_index < total and os.path.exists(self._chunk_marker(upload_id, state.next_index)):
+                f.seek(state.next_index * self.chunk_size)
+                remaining = self.chunk_length(meta, state.next_index)
+                while remaining > 0:
+                    block = f.read(min(READ_BLOCK_SIZE, remaining))
+                    state.hasher.update(block)
+                    remaining -= len(block)
+                state.next_index += 1
+
+    # 完成
+    def assemble(self, upload_id):
+        """确认所有块已到齐，返回 (数据文件路径, meta, 整文件 sha256)"""
+        meta = self.load(upload_id)
+        total = self.chunk_count(meta)
+        missing = sorted(set(range(total)) - set(self.received(upload_id)))
+        if missing:
+            raise UploadError(400, f"missing chunks: {missing[:20]}")
+
+        state = self._hash_state(upload_id)
+        with state.lock:
+            self._catch_up(upload_id, meta, state)
+            if state.hasher is not None and state.next_index == total:
+                digest = state.hasher.hexdigest()
+            else:
+                digest = file_sha256(self._data_path(upload_id))
+
+        if meta.get('sha256') and meta['sha256'].lower() != digest:
+            raise UploadError(400, "file checksum mismatch")
+        return self._data_path(upload_id), meta, digest
+
+
+def file_sha256(path):
+    """流式计算文件的 sha256"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
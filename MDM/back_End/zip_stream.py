@@ -0,0 +1,187 @@
+"""
+流式生成 ZIP（不压缩）
+
+归档布局只由条目的名称、大小和修改时间决定，生成前就能算出总长度和每个字节的位置：
+- 响应可以带 Content-Length，任意 Range 都能直接定位到对应文件的偏移，不需要从头生成
+- 文件内容边读边发，不写临时文件，内存占用与归档大小无关
+- CRC32 放在每个文件后的 data descriptor 中，读文件时顺带计算；
+  Range 跳过的文件只在需要它的 CRC（descriptor 或中央目录）时才补读
+- 超过 4GB 的文件或偏移自动使用 ZIP64 扩展
+"""
+import os
+import struct
+import time
+import zlib
+
+READ_BLOCK_SIZE = 64 * 1024
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP32_COUNT_LIMIT = 0xFFFF
+# ZIP64 中 32 位字段写入的占位值
+ZIP64_MARKER = 0xFFFFFFFF
+ZIP64_COUNT_MARKER = 0xFFFF
+
+FLAGS = 0x0808  # bit 3: data descriptor, bit 11: UTF-8 文件名
+
+
+def dos_datetime(timestamp):
+    t = time.localtime(max(timestamp, 315532800))  # ZIP 时间最早为 1980 年
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+class ZipEntry:
+
+    def __init__(self, name, path, size, mtime):
+        self.name = name.encode('utf-8')
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.offset = 0
+        self.crc = None
+
+    @property
+    def zip64(self):
+        return self.size >= ZIP32_LIMIT
+
+    def local_header(self):
+        dos_time, dos_date = dos_datetime(self.mtime)
+        if self.zip64:
+            extra = struct.pack('<HHQQ', 0x0001, 16, self.size, self.size)
+            size32 = ZIP64_MARKER
+        else:
+            extra = b''
+            size32 = self.size
+        return struct.pack('<IHHHHHIIIHH', 0x04034b50, 45 if self.zip64 else 20, FLAGS, 0,
+                           dos_time, dos_date, 0, size32, size32,
+                           len(self.name), len(extra)) + self.name + extra
+
+    def descriptor_length(self):
+        return 24 if self.zip64 else 16
+
+    def descriptor(self):
+        if self.zip64:
+            return struct.pack('<IIQQ', 0x08074b50, self.crc, self.size, self.size)
+        return struct.pack('<IIII', 0x08074b50, self.crc, self.size, self.size)
+
+    def central_header(self):
+        dos_time, dos_date = dos_datetime(self.mtime)
+        fields = []
+        size32 = self.size
+        offset32 = self.offset
+        if self.size >= ZIP32_LIMIT:
+            fields += [self.size, self.size]
+            size32 = ZIP64_MARKER
+        if self.offset >= ZIP32_LIMIT:
+            fields.append(self.offset)
+            offset32 = ZIP64_MARKER
+        extra = struct.pack('<HH' + 'Q' * len(fields), 0x0001, 8 * len(fields), *fields) if fields else b''
+        version = 45 if fields else 20
+        return struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, version, version, FLAGS, 0,
+                           dos_time, dos_date, self.crc, size32, size32,
+                           len(self.name), len(extra), 0, 0, 0, 0, offset32) + self.name + extra
+
+    def central_header_length(self):
+        fields = (2 if self.size >= ZIP32_LIMIT else 0) + (1 if self.offset >= ZIP32_LIMIT else 0)
+        return 46 + len(self.name) + (4 + 8 * fields if fields else 0)
+
+
+class StoredZip:
+    """由 (归档内名称, 文件路径) 列表构建的可按字节区间生成的 ZIP"""
+
+    def __init__(self, files):
+        self.entries = []
+        for name, path in files:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            self.entries.append(ZipEntry(name, path, stat.st_size, stat.st_mtime))
+
+        # 预先计算每一段的位置
+        self.segments = []
+        position = 0
+        for entry in self.entries:
+            entry.offset = position
+            header = entry.local_header()
+            self.segments.append((position, len(header), 'bytes', header))
+            position += len(header)
+            self.segments.append((position, entry.size, 'data', entry))
+            position += entry.size
+            self.segments.append((position, entry.descriptor_length(), 'descriptor', entry))
+            position += entry.descriptor_length()
+        self.central_offset = position
+        self.central_size = sum(entry.central_header_length() for entry in self.entries)
+        self.segments.append((position, self.central_size, 'central', None))
+        position += self.central_size
+        end = self._end_records()
+        self.segments.append((position, len(end), 'bytes', end))
+        self.size = position + len(end)
+
+    def __len__(self):
+        return self.size
+
+    def _end_records(self):
+        count = len(self.entries)
+        if count < ZIP32_COUNT_LIMIT and self.central_offset < ZIP32_LIMIT and self.central_size < ZIP32_LIMIT:
+            return struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, count, count,
+                               self.central_size, self.central_offset, 0)
+        zip64_end_offset = self.central_offset + self.central_size
+        return (struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count,
+                            self.central_size, self.central_offset)
+                + struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1)
+                + struct.pack('<IHHHHIIH', 0x06054b50, 0, 0,
+                              ZIP64_COUNT_MARKER, ZIP64_COUNT_MARKER, ZIP64_MARKER, ZIP64_MARKER, 0))
+
+    def _crc(self, entry):
+        """Range 跳过了文件内容时补读计算 CRC"""
+        if entry.crc is None:
+            crc = 0
+            with open(entry.path, 'rb') as f:
+                for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+                    crc = zlib.crc32(block, crc)
+            entry.crc = crc
+        return entry.crc
+
+    def _read_data(self, entry, start, stop):
+        # 从头读完整个文件时顺带得到 CRC
+        crc = 0 if start == 0 and stop == entry.size else None
+        with open(entry.path, 'rb') as f:
+            f.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                block = f.read(min(READ_BLOCK_SIZE, remaining))
+                if not block:
+                    raise IOError(f"{entry.path} changed while streaming")
+                if crc is not None:
+                    crc = zlib.crc32(block, crc)
+                remaining -= len(block)
+                yield block
+        if crc is not None:
+            entry.crc = crc
+
+    def iter_bytes(self, start=0, stop=None):
+        """生成归档中 [start, stop) 区间的字节"""
+        stop = self.size if stop is None else min(stop, self.size)
+        for position, length, kind, value in self.segments:
+            if position + length <= start:
+                continue
+            if position >= stop:
+                break
+            lo = max(start - position, 0)
+            hi = min(stop - position, length)
+            if kind == 'bytes':
+                yield value[lo:hi]
+            elif kind == 'data':
+                yield from self._read_data(value, lo, hi)
+            elif kind == 'descriptor':
+                self._crc(value)
+                yield value.descriptor()[lo:hi]
+            else:
+                # 中央目录逐条生成，只计算落在区间内的条目
+                cursor = position
+                for entry in self.entries:
+                    header_length = entry.central_header_length()
+                    if cursor + header_length > start and cursor < stop:
+                        self._crc(entry)
+                        yield entry.central_header()[max(start - cursor, 0):min(stop - cursor, header_length)]
+                    cursor += header_length